@@ -1,5 +1,7 @@
 
 from . import leaderboards
+from . import leaders
+from . import scoreboards
 from . import activity
 from . import status
 from . import events
@@ -4,88 +4,159 @@ from app.common.database.repositories import users, modding, scores
 from app.common.database.objects import DBStats
 
 from sqlalchemy.orm import Session
+from redis.commands.core import Script
 from redis.client import Pipeline
-from typing import Tuple, List
+from typing import Iterable, Tuple, List, Dict, Any
 
+import logging
+import time
+import uuid
 import app
 
-def update(stats: DBStats, country: str) -> None:
-    """Update ppv1, ppv2, country and score ranks"""
-    with app.session.redis.pipeline() as pipe:
-        # Performance
-        pipe.zadd(
-            f'bancho:performance:{stats.mode}',
-            {stats.user_id: float(stats.pp)}
-        )
-        pipe.zadd(
-            f'bancho:performance:{stats.mode}:{country.lower()}',
-            {stats.user_id: float(stats.pp)}
-        )
-
-        # Ranked Score
-        pipe.zadd(
-            f'bancho:rscore:{stats.mode}',
-            {stats.user_id: stats.rscore}
-        )
-        pipe.zadd(
-            f'bancho:rscore:{stats.mode}:{country.lower()}',
-            {stats.user_id: stats.rscore}
-        )
-
-        # Total Score
-        pipe.zadd(
-            f'bancho:tscore:{stats.mode}',
-            {stats.user_id: stats.tscore}
-        )
-        pipe.zadd(
-            f'bancho:tscore:{stats.mode}:{country.lower()}',
-            {stats.user_id: stats.tscore}
-        )
-
-        # PPV1
-        pipe.zadd(
-            f'bancho:ppv1:{stats.mode}',
-            {stats.user_id: stats.ppv1}
-        )
-        pipe.zadd(
-            f'bancho:ppv1:{stats.mode}:{country.lower()}',
-            {stats.user_id: stats.ppv1}
-        )
-
-        # Accuracy
-        pipe.zadd(
-            f'bancho:acc:{stats.mode}',
-            {stats.user_id: stats.acc}
-        )
-        pipe.zadd(
-            f'bancho:acc:{stats.mode}:{country.lower()}',
-            {stats.user_id: stats.acc}
-        )
-
-        clears = sum([
-            stats.xh_count,
-            stats.x_count,
-            stats.sh_count,
-            stats.s_count,
-            stats.a_count,
-            stats.b_count,
-            stats.c_count,
-            stats.d_count
-        ])
-
-        # Clears
-        pipe.zadd(
-            f'bancho:clears:{stats.mode}',
-            {stats.user_id: clears}
-        )
-        pipe.zadd(
-            f'bancho:clears:{stats.mode}:{country.lower()}',
-            {stats.user_id: clears}
-        )
-
-        pipe.execute()
+logger = logging.getLogger('leaderboards')
+
+# Sets the user's score on every given leaderboard and returns the new
+# (1-based) ranks, so that callers don't need to send follow-up ZREVRANKs.
+# KEYS: leaderboard keys, ARGV[1]: user id, ARGV[2..n+1]: scores for each key
+UPDATE_SCRIPT = """
+local ranks = {}
+
+for index, key in ipairs(KEYS) do
+    redis.call('ZADD', key, ARGV[index + 1], ARGV[1])
+    local rank = redis.call('ZREVRANK', key, ARGV[1])
+    ranks[index] = rank and rank + 1 or 0
+end
+
+return ranks
+"""
+
+# Keeps the country totals in bancho:countries:{type}:{mode} up to date, by applying
+# the difference between the player's previous and new score. Only scores >= 1
+# are counted, and bancho:countries:users:{mode} keeps track of the player count.
+# Deltas are only applied once reconcile_countries() has built the totals, which is
+# marked by bancho:countries:ready:{mode}. While a reconcile is running, they are
+# also recorded in bancho:countries:pending:{type}:{mode}, see reconcile_countries().
+# KEYS[1]: country leaderboard, KEYS[2]: ready marker, KEYS[3]: reconciling marker,
+# KEYS[4]: country totals, KEYS[5]: pending totals,
+# KEYS[6]: player counts (optional), KEYS[7]: pending player counts (optional)
+# ARGV[1]: user id, ARGV[2]: country, ARGV[3]: new score (empty when removing the player)
+COUNTRY_SCRIPT = """
+local previous = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]))
+local current = tonumber(ARGV[3])
+local ready = redis.call('EXISTS', KEYS[2]) == 1
+local reconciling = redis.call('EXISTS', KEYS[3]) == 1
+
+local function contribution(score)
+    if score and score >= 1 then
+        return score
+    end
+    return 0
+end
+
+local function apply(key, pending_key, amount)
+    if amount == 0 then
+        return
+    end
+
+    if ready then
+        redis.call('ZINCRBY', key, amount, ARGV[2])
+    end
+
+    if reconciling then
+        redis.call('ZINCRBY', pending_key, amount, ARGV[2])
+    end
+end
+
+local delta = contribution(current) - contribution(previous)
+apply(KEYS[4], KEYS[5], delta)
+
+if KEYS[6] then
+    local members = math.min(contribution(current), 1) - math.min(contribution(previous), 1)
+    apply(KEYS[6], KEYS[7], members)
+end
+
+return delta
+"""
+
+# Replaces the country totals with the ones built by reconcile_countries(),
+# plus all deltas that were recorded since its snapshot was taken
+# KEYS[1]: ready marker, KEYS[2]: reconciling marker,
+# KEYS[3..n]: (shadow totals, live totals, pending totals) for each type
+# ARGV[1]: reconcile token
+SWAP_COUNTRIES_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    -- Another reconcile has taken over
+    return 0
+end
+
+for index = 3, #KEYS, 3 do
+    local shadow, live, pending = KEYS[index], KEYS[index + 1], KEYS[index + 2]
+
+    if redis.call('EXISTS', shadow) == 1 then
+        redis.call('RENAME', shadow, live)
+    else
+        redis.call('DEL', live)
+    end
+
+    redis.call('ZUNIONSTORE', live, 2, live, pending)
+    redis.call('DEL', pending)
+end
+
+redis.call('DEL', KEYS[2])
+redis.call('SET', KEYS[1], 1)
+return 1
+"""
+
+# Remembers the players whose leaderboards changed during a rebuild(), since
+# the swap at its end overwrites them with an older snapshot of their stats
+# KEYS[1]: rebuilding marker, KEYS[2]: changed players, ARGV[1]: user id
+RECORD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('SADD', KEYS[2], ARGV[1])
+end
+"""
+
+# Leaderboards that are summed up for the country rankings
+country_leaderboards = ('performance', 'rscore', 'tscore')
+
+# Leaderboards that are derived from the stats table, see update()
+stats_leaderboards = ('performance', 'rscore', 'tscore', 'ppv1', 'acc', 'clears')
+
+update_script: Script | None = None
+country_script: Script | None = None
+swap_countries_script: Script | None = None
+record_script: Script | None = None
+
+def update(stats: DBStats, country: str) -> Dict[str, Tuple[int, int]]:
+    """Update ppv1, ppv2, country and score ranks
+    `returns`: Dict[leaderboard, Tuple[global_rank, country_rank]]
+    """
+    clears = sum([
+        stats.xh_count,
+        stats.x_count,
+        stats.sh_count,
+        stats.s_count,
+        stats.a_count,
+        stats.b_count,
+        stats.c_count,
+        stats.d_count
+    ])
+
+    return update_leaderboards(
+        stats.user_id,
+        stats.mode,
+        country,
+        {
+            'performance': float(stats.pp),
+            'rscore': stats.rscore,
+            'tscore': stats.tscore,
+            'ppv1': stats.ppv1,
+            'acc': stats.acc,
+            'clears': clears
+        }
+    )
 
-def update_leader_scores(stats: DBStats, country: str, session: Session | None = None) -> None:
+def update_leader_scores(stats: DBStats, country: str, session: Session | None = None) -> Tuple[int, int]:
     """Update #1 count"""
     count = scores.fetch_leader_count(
         stats.user_id,
@@ -93,34 +164,116 @@ def update_leader_scores(stats: DBStats, country: str, session: Session | None =
         session=session
     )
 
-    with app.session.redis.pipeline() as pipe:
-        pipe.zadd(
-            f'bancho:leader:{stats.mode}',
-            {stats.user_id: count}
-        )
-        pipe.zadd(
-            f'bancho:leader:{stats.mode}:{country.lower()}',
-            {stats.user_id: count}
-        )
-        pipe.execute()
+    ranks = update_leaderboards(
+        stats.user_id,
+        stats.mode,
+        country,
+        {'leader': count}
+    )
+    return ranks['leader']
 
-def update_kudosu(user_id: int, country: str, session: Session | None = None) -> None:
-    """Update #1 count"""
+def update_kudosu(user_id: int, country: str, session: Session | None = None) -> Tuple[int, int]:
+    """Update kudosu"""
     kudosu = modding.total_amount_by_user(
         user_id,
         session=session
     )
 
+    ranks = update_leaderboards(
+        user_id,
+        None,
+        country,
+        {'kudosu': kudosu}
+    )
+    return ranks['kudosu']
+
+def update_leaderboards(
+    user_id: int,
+    mode: int | None,
+    country: str,
+    values: Dict[str, float]
+) -> Dict[str, Tuple[int, int]]:
+    """Update the global & country leaderboards in a single round trip
+    `returns`: Dict[leaderboard, Tuple[global_rank, country_rank]]
+    """
+    mode_suffix = f":{mode}" if mode is not None else ""
+    keys, args = [], [user_id]
+
+    for leaderboard, value in values.items():
+        keys.append(f'bancho:{leaderboard}{mode_suffix}')
+        keys.append(f'bancho:{leaderboard}{mode_suffix}:{country.lower()}')
+        args.extend((value, value))
+
     with app.session.redis.pipeline() as pipe:
-        pipe.zadd(
-            f'bancho:kudosu',
-            {user_id: kudosu}
-        )
-        pipe.zadd(
-            f'bancho:kudosu:{country.lower()}',
-            {user_id: kudosu}
-        )
-        pipe.execute()
+        for leaderboard, value in values.items():
+            if leaderboard not in country_leaderboards or mode is None:
+                continue
+
+            # Totals need to be updated before the new score is set
+            update_country_totals(user_id, mode, country, leaderboard, value, pipe)
+
+        record_change(user_id, pipe)
+        leaderboard_update_script()(keys=keys, args=args, client=pipe)
+        *_, ranks = pipe.execute()
+
+    return {
+        leaderboard: (int(ranks[index * 2]), int(ranks[index * 2 + 1]))
+        for index, leaderboard in enumerate(values)
+    }
+
+def leaderboard_update_script() -> Script:
+    """Register the update script on first use, which will then be sent via EVALSHA"""
+    global update_script
+
+    if update_script is None:
+        update_script = app.session.redis.register_script(UPDATE_SCRIPT)
+
+    return update_script
+
+def record_change(user_id: int, pipe: Pipeline) -> None:
+    """Remember the player for the replay after a rebuild, if one is running"""
+    global record_script
+
+    if record_script is None:
+        record_script = app.session.redis.register_script(RECORD_SCRIPT)
+
+    record_script(
+        keys=['bancho:leaderboards:rebuilding', 'bancho:leaderboards:changed'],
+        args=[user_id],
+        client=pipe
+    )
+
+def update_country_totals(
+    user_id: int,
+    mode: int,
+    country: str,
+    leaderboard: str,
+    value: float | None,
+    pipe: Pipeline
+) -> None:
+    """Apply a player's score change to the country totals, `None` meaning removal"""
+    global country_script
+
+    if country_script is None:
+        country_script = app.session.redis.register_script(COUNTRY_SCRIPT)
+
+    keys = [
+        f'bancho:{leaderboard}:{mode}:{country.lower()}',
+        f'bancho:countries:ready:{mode}',
+        f'bancho:countries:reconciling:{mode}',
+        f'bancho:countries:{leaderboard}:{mode}',
+        f'bancho:countries:pending:{leaderboard}:{mode}'
+    ]
+
+    if leaderboard == 'performance':
+        keys.append(f'bancho:countries:users:{mode}')
+        keys.append(f'bancho:countries:pending:users:{mode}')
+
+    country_script(
+        keys=keys,
+        args=[user_id, country.lower(), value if value is not None else ''],
+        client=pipe
+    )
 
 def remove_country(
     user_id: int,
@@ -128,7 +281,12 @@ def remove_country(
 ) -> None:
     """Remove player from country leaderboards"""
     with app.session.redis.pipeline() as pipe:
+        record_change(user_id, pipe)
+
         for mode in range(4):
+            for leaderboard in country_leaderboards:
+                update_country_totals(user_id, mode, country, leaderboard, None, pipe)
+
             pipe.zrem(
                 f'bancho:performance:{mode}:{country.lower()}',
                 user_id
@@ -191,7 +349,12 @@ def remove(
 ) -> None:
     """Remove player from leaderboards"""
     with app.session.redis.pipeline() as pipe:
+        record_change(user_id, pipe)
+
         for mode in range(4):
+            for leaderboard in country_leaderboards:
+                update_country_totals(user_id, mode, country, leaderboard, None, pipe)
+
             pipe.zrem(
                 f'bancho:performance:{mode}',
                 user_id
@@ -292,6 +455,171 @@ def remove(
         )
         pipe.execute()
 
+def rebuild(
+    rows: Iterable[Any],
+    modes: Iterable[int] = range(4),
+    batch_size: int = 10000,
+    progress_interval: int = 100000
+) -> Dict[str, float]:
+    """Rebuild all stats leaderboards & country totals from scratch
+
+    `rows` need to provide the user_id, mode, country, pp, rscore, tscore, ppv1,
+    acc and clears attributes. Everything gets written into shadow keys first,
+    which then replace the live leaderboards in a single transaction. Updates
+    made in the meantime are lost in the swap, so callers need to replay the
+    players returned by finish_rebuild(), after calling begin_rebuild().
+    """
+    modes = list(modes)
+    country_codes = [country.lower() for country in countries.keys()]
+    rebuilt_modes = set(modes)
+    written_keys = set()
+    start_time = time.time()
+    skipped_rows = 0
+    total_rows = 0
+
+    totals = {
+        (leaderboard, mode): {}
+        for leaderboard in (*country_leaderboards, 'users')
+        for mode in modes
+    }
+
+    clear_shadow_keys()
+
+    try:
+        with app.session.redis.pipeline(transaction=False) as pipe:
+            for row in rows:
+                if row.mode not in rebuilt_modes:
+                    skipped_rows += 1
+                    continue
+
+                country = row.country.lower()
+                values = {
+                    'performance': float(row.pp),
+                    'rscore': row.rscore,
+                    'tscore': row.tscore,
+                    'ppv1': row.ppv1,
+                    'acc': row.acc,
+                    'clears': row.clears
+                }
+
+                for leaderboard, value in values.items():
+                    global_key = f'bancho:{leaderboard}:{row.mode}'
+                    country_key = f'bancho:{leaderboard}:{row.mode}:{country}'
+                    pipe.zadd(f'rebuild:{global_key}', {row.user_id: value})
+                    pipe.zadd(f'rebuild:{country_key}', {row.user_id: value})
+                    written_keys.update((global_key, country_key))
+
+                    if leaderboard not in country_leaderboards or value < 1:
+                        continue
+
+                    country_totals = totals[(leaderboard, row.mode)]
+                    country_totals[country] = country_totals.get(country, 0) + value
+
+                    if leaderboard == 'performance':
+                        country_users = totals[('users', row.mode)]
+                        country_users[country] = country_users.get(country, 0) + 1
+
+                total_rows += 1
+
+                if total_rows % batch_size == 0:
+                    pipe.execute()
+
+                if total_rows % progress_interval == 0:
+                    logger.info(
+                        f'Rebuilding leaderboards: {total_rows} rows '
+                        f'({total_rows / (time.time() - start_time):.0f} rows/s)'
+                    )
+
+            for (leaderboard, mode), country_totals in totals.items():
+                if not country_totals:
+                    continue
+
+                key = f'bancho:countries:{leaderboard}:{mode}'
+                pipe.zadd(f'rebuild:{key}', country_totals)
+                written_keys.add(key)
+
+            pipe.execute()
+
+        live_keys = [
+            f'bancho:{leaderboard}:{mode}{suffix}'
+            for leaderboard in stats_leaderboards
+            for mode in modes
+            for suffix in ('', *(f':{country}' for country in country_codes))
+        ]
+        live_keys.extend(
+            f'bancho:countries:{leaderboard}:{mode}'
+            for leaderboard in (*country_leaderboards, 'users')
+            for mode in modes
+        )
+
+        with app.session.redis.pipeline() as pipe:
+            for key in written_keys.union(live_keys):
+                if key in written_keys:
+                    pipe.rename(f'rebuild:{key}', key)
+                else:
+                    pipe.delete(key)
+
+            for mode in modes:
+                # Country totals are complete now, so deltas can be applied to them
+                pipe.set(f'bancho:countries:ready:{mode}', 1)
+
+            pipe.execute()
+    finally:
+        # Shadow keys of a failed rebuild would otherwise stay around
+        with app.session.redis.pipeline(transaction=False) as pipe:
+            for key in written_keys:
+                pipe.delete(f'rebuild:{key}')
+
+            pipe.execute()
+
+    if skipped_rows:
+        logger.warning(f'Skipped {skipped_rows} rows with modes outside of {modes}')
+
+    elapsed = time.time() - start_time
+    metrics = {
+        'rows': total_rows,
+        'skipped': skipped_rows,
+        'keys': len(written_keys),
+        'elapsed': elapsed,
+        'rows_per_second': total_rows / elapsed if elapsed > 0 else 0
+    }
+
+    logger.info(
+        f'Rebuilt {metrics["keys"]} leaderboards from {total_rows} rows '
+        f'in {elapsed:.2f}s ({metrics["rows_per_second"]:.0f} rows/s)'
+    )
+
+    return metrics
+
+def begin_rebuild() -> None:
+    """Start recording the players whose leaderboards change during a rebuild"""
+    with app.session.redis.pipeline() as pipe:
+        pipe.delete('bancho:leaderboards:changed')
+        pipe.set('bancho:leaderboards:rebuilding', 1)
+        pipe.execute()
+
+def finish_rebuild() -> List[int]:
+    """Stop recording changes
+    `returns`: The ids of all players that need to be replayed
+    """
+    with app.session.redis.pipeline() as pipe:
+        pipe.delete('bancho:leaderboards:rebuilding')
+        pipe.smembers('bancho:leaderboards:changed')
+        pipe.delete('bancho:leaderboards:changed')
+        _, user_ids, _ = pipe.execute()
+
+    return [int(user_id) for user_id in user_ids]
+
+def clear_shadow_keys() -> None:
+    """Remove leftover shadow keys of a previous rebuild"""
+    keys = app.session.redis.scan_iter(match='rebuild:bancho:*', count=1000)
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.delete(key)
+
+        pipe.execute()
+
 def global_rank(
     user_id: int,
     mode: int
@@ -638,6 +966,46 @@ def top_players_with_count(
 
 def top_countries(mode: int) -> List[dict]:
     """Get a list of the top countries"""
+    if not app.session.redis.exists(f'bancho:countries:ready:{mode}'):
+        # Totals have not been built yet, see reconcile_countries()
+        return top_countries_from_leaderboards(mode)
+
+    with app.session.redis.pipeline() as pipe:
+        pipe.zrevrange(f'bancho:countries:performance:{mode}', 0, -1, withscores=True)
+        pipe.zrange(f'bancho:countries:rscore:{mode}', 0, -1, withscores=True)
+        pipe.zrange(f'bancho:countries:tscore:{mode}', 0, -1, withscores=True)
+        pipe.zrange(f'bancho:countries:users:{mode}', 0, -1, withscores=True)
+        performance, rscore, tscore, users = pipe.execute()
+
+    country_rscore = dict(rscore)
+    country_tscore = dict(tscore)
+    country_users = dict(users)
+    country_rankings = []
+
+    for country, total_performance in performance:
+        total_users = round(country_users.get(country, 0))
+        total_rscore = country_rscore.get(country, 0)
+        total_tscore = country_tscore.get(country, 0)
+
+        if country == b'xx':
+            continue
+
+        if total_users <= 0 or total_rscore < 1 or total_tscore < 1:
+            continue
+
+        country_rankings.append({
+            'name': country.decode(),
+            'total_performance': total_performance,
+            'total_rscore': total_rscore,
+            'total_tscore': total_tscore,
+            'total_users': total_users,
+            'average_pp': total_performance / total_users
+        })
+
+    return country_rankings
+
+def top_countries_from_leaderboards(mode: int) -> List[dict]:
+    """Get a list of the top countries, by summing up every country leaderboard"""
     country_rankings = []
     country_codes = [
         country
@@ -700,6 +1068,78 @@ def top_countries(mode: int) -> List[dict]:
 
     return country_rankings
 
+def reconcile_countries(mode: int) -> None:
+    """Rebuild the country totals from the country leaderboards
+
+    This reads every country leaderboard, and is meant to be run from a job
+    (e.g. once on startup), not on the request path. Until it has completed,
+    top_countries() will keep summing up the country leaderboards itself.
+
+    The snapshot of the leaderboards is taken in the same transaction that starts
+    recording deltas, so every score change is counted exactly once after the swap.
+    """
+    global swap_countries_script
+
+    country_codes = [country.lower() for country in countries.keys()]
+    token = uuid.uuid4().hex
+    totals = {
+        leaderboard: {}
+        for leaderboard in (*country_leaderboards, 'users')
+    }
+
+    with app.session.redis.pipeline() as pipe:
+        pipe.set(f'bancho:countries:reconciling:{mode}', token, ex=300)
+
+        for leaderboard in totals:
+            pipe.delete(f'bancho:countries:pending:{leaderboard}:{mode}')
+
+        for country in country_codes:
+            for leaderboard in country_leaderboards:
+                pipe.zrangebyscore(
+                    f'bancho:{leaderboard}:{mode}:{country}',
+                    '1', '+inf',
+                    withscores=True
+                )
+
+        results = iter(pipe.execute()[1 + len(totals):])
+
+    for country in country_codes:
+        for leaderboard in country_leaderboards:
+            result = next(results)
+
+            if not result:
+                continue
+
+            totals[leaderboard][country] = sum(score for member, score in result)
+
+            if leaderboard == 'performance':
+                totals['users'][country] = len(result)
+
+    keys = [
+        f'bancho:countries:ready:{mode}',
+        f'bancho:countries:reconciling:{mode}'
+    ]
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for leaderboard, country_totals in totals.items():
+            pipe.delete(f'rebuild:bancho:countries:{leaderboard}:{mode}')
+
+            if country_totals:
+                pipe.zadd(f'rebuild:bancho:countries:{leaderboard}:{mode}', country_totals)
+
+            keys.extend((
+                f'rebuild:bancho:countries:{leaderboard}:{mode}',
+                f'bancho:countries:{leaderboard}:{mode}',
+                f'bancho:countries:pending:{leaderboard}:{mode}'
+            ))
+
+        pipe.execute()
+
+    if swap_countries_script is None:
+        swap_countries_script = app.session.redis.register_script(SWAP_COUNTRIES_SCRIPT)
+
+    swap_countries_script(keys=keys, args=[token])
+
 def player_count(
     mode: int,
     type: str = 'performance',
@@ -779,6 +1219,64 @@ def player_rankings_all_modes(
             for mode in range(4)
         }
 
+def bulk_rankings(
+    user_ids: List[int],
+    mode: int,
+    leaderboards = (
+        "performance",
+        "rscore", "tscore",
+        "ppv1", "clears",
+        "ppvn", "pprx",
+        "ppap", "leader"
+    ),
+    countries: List[str] | None = None,
+    chunk_size: int = 500
+) -> Dict[str, Dict[str, List[int]]]:
+    """Get the rankings of many players on various leaderboards
+    `returns`: Dict[leaderboard, Dict["value" | "global" | "country", List[int]]],
+    where every list is in the same order as `user_ids`. Country ranks are
+    only resolved if the `countries` of each player are provided.
+    """
+    commands_per_leaderboard = 3 if countries else 2
+    commands_per_user = len(leaderboards) * commands_per_leaderboard
+
+    results = {
+        leaderboard: {
+            'value': [],
+            'global': [],
+            'country': []
+        }
+        for leaderboard in leaderboards
+    }
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for chunk_start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[chunk_start:chunk_start + chunk_size]
+
+            for index, user_id in enumerate(chunk):
+                for leaderboard in leaderboards:
+                    pipe.zscore(f'bancho:{leaderboard}:{mode}', user_id)
+                    pipe.zrevrank(f'bancho:{leaderboard}:{mode}', user_id)
+
+                    if countries:
+                        country = countries[chunk_start + index].lower()
+                        pipe.zrevrank(f'bancho:{leaderboard}:{mode}:{country}', user_id)
+
+            response = pipe.execute()
+
+            for index in range(len(chunk)):
+                for leaderboard_index, leaderboard in enumerate(leaderboards):
+                    offset = index * commands_per_user + leaderboard_index * commands_per_leaderboard
+                    value, global_rank = response[offset], response[offset + 1]
+                    country_rank = response[offset + 2] if countries else None
+
+                    columns = results[leaderboard]
+                    columns['value'].append(round(float(value or -1)))
+                    columns['global'].append((global_rank if global_rank is not None else -1) + 1)
+                    columns['country'].append((country_rank if country_rank is not None else -1) + 1)
+
+    return results
+
 def player_above(
     user_id: int,
     mode: int,
@@ -0,0 +1,223 @@
+
+from redis.commands.core import Script
+from typing import Iterable, Tuple, List
+
+import app
+
+# Keeps track of the #1 score for every (beatmap, mode), so that counting
+# a player's first places doesn't need an anti-join over all of their scores.
+#   bancho:leaders:{mode}               -> beatmap_id: "{user_id}:{score_id}"
+#   bancho:leaders:{mode}:{user_id}     -> beatmap_id: score_id
+#   bancho:leaders:{mode}:ready         -> set once the hashes have been built
+#   bancho:leaders:{mode}:rebuilding    -> set while a rebuild is running
+#   bancho:leaders:{mode}:dirty         -> beatmaps that changed during a rebuild
+
+# KEYS[1]: leaders key, KEYS[2]: new holder key, KEYS[3]: previous holder key,
+# KEYS[4]: ready key, KEYS[5]: rebuilding key, KEYS[6]: dirty key
+# ARGV[1]: beatmap id, ARGV[2]: user id, ARGV[3]: score id, ARGV[4]: previous entry
+# An empty user id will remove the current holder of the beatmap. Returns 0 if the
+# previous entry has changed in the meantime, in which case the caller retries.
+SWAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[5]) == 1 then
+    redis.call('SADD', KEYS[6], ARGV[1])
+end
+
+if redis.call('EXISTS', KEYS[4]) == 0 then
+    return 1
+end
+
+local previous = redis.call('HGET', KEYS[1], ARGV[1]) or ''
+
+if previous ~= ARGV[4] then
+    return 0
+end
+
+if previous ~= '' then
+    redis.call('HDEL', KEYS[3], ARGV[1])
+end
+
+if ARGV[2] == '' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return 1
+end
+
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. ':' .. ARGV[3])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+return 1
+"""
+
+swap_script: Script | None = None
+
+def update(
+    beatmap_id: int,
+    mode: int,
+    user_id: int | None,
+    score_id: int | None,
+    retries: int = 5
+) -> None:
+    """Set the #1 score of a beatmap, or remove it if `user_id` is None"""
+    for _ in range(retries):
+        previous = app.session.redis.hget(f'bancho:leaders:{mode}', beatmap_id)
+        previous = previous.decode() if previous else ''
+        # Keys of holders that don't exist are never written to
+        previous_user_id = previous.split(':')[0] if previous else 0
+
+        applied = leader_swap_script()(
+            keys=[
+                f'bancho:leaders:{mode}',
+                f'bancho:leaders:{mode}:{user_id or 0}',
+                f'bancho:leaders:{mode}:{previous_user_id}',
+                f'bancho:leaders:{mode}:ready',
+                f'bancho:leaders:{mode}:rebuilding',
+                f'bancho:leaders:{mode}:dirty'
+            ],
+            args=[beatmap_id, user_id or '', score_id or '', previous]
+        )
+
+        if applied:
+            return
+
+def holder(beatmap_id: int, mode: int) -> Tuple[int, int] | None:
+    """Get the #1 score of a beatmap
+    `returns`: Tuple[user_id, score_id]
+    """
+    entry = app.session.redis.hget(f'bancho:leaders:{mode}', beatmap_id)
+
+    if not entry:
+        return None
+
+    user_id, score_id = entry.decode().split(':')
+    return int(user_id), int(score_id)
+
+def count(user_id: int, mode: int) -> int:
+    """Get the amount of #1 scores of a player"""
+    return app.session.redis.hlen(f'bancho:leaders:{mode}:{user_id}')
+
+def score_ids(user_id: int, mode: int) -> List[int]:
+    """Get the ids of all #1 scores of a player"""
+    return [
+        int(score_id) for score_id in
+        app.session.redis.hvals(f'bancho:leaders:{mode}:{user_id}')
+    ]
+
+def beatmap_ids(user_id: int, mode: int) -> List[int]:
+    """Get the ids of all beatmaps where the player holds #1"""
+    return [
+        int(beatmap_id) for beatmap_id in
+        app.session.redis.hkeys(f'bancho:leaders:{mode}:{user_id}')
+    ]
+
+def is_populated(mode: int) -> bool:
+    """Check if the first places have been built for this mode"""
+    return bool(app.session.redis.exists(f'bancho:leaders:{mode}:ready'))
+
+def is_tracked(mode: int) -> bool:
+    """Check if changes to the first places of this mode need to be recorded"""
+    return bool(app.session.redis.exists(
+        f'bancho:leaders:{mode}:ready',
+        f'bancho:leaders:{mode}:rebuilding'
+    ))
+
+def begin_rebuild(mode: int) -> None:
+    """Start recording the beatmaps that change while a rebuild reads its snapshot"""
+    with app.session.redis.pipeline() as pipe:
+        pipe.delete(f'bancho:leaders:{mode}:dirty')
+        pipe.set(f'bancho:leaders:{mode}:rebuilding', 1)
+        pipe.execute()
+
+def finish_rebuild(mode: int) -> List[int]:
+    """Stop recording changes
+    `returns`: The ids of all beatmaps that changed during the rebuild
+    """
+    with app.session.redis.pipeline() as pipe:
+        pipe.delete(f'bancho:leaders:{mode}:rebuilding')
+        pipe.smembers(f'bancho:leaders:{mode}:dirty')
+        pipe.delete(f'bancho:leaders:{mode}:dirty')
+        _, beatmap_ids, _ = pipe.execute()
+
+    return [int(beatmap_id) for beatmap_id in beatmap_ids]
+
+def rebuild(
+    mode: int,
+    entries: Iterable[Tuple[int, int, int]],
+    batch_size: int = 5000
+) -> int:
+    """Rebuild the first places of a mode from scratch
+    `entries`: Iterable[Tuple[beatmap_id, user_id, score_id]]
+    `returns`: The amount of first places
+
+    Everything is written into shadow keys first, which replace the live
+    hashes in a single transaction, so callers can keep using them until then.
+    Changes made during the rebuild need to be replayed, see `begin_rebuild`.
+    """
+    clear_shadow_keys(mode)
+    user_ids = set()
+    total = 0
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for beatmap_id, user_id, score_id in entries:
+            pipe.hset(f'rebuild:bancho:leaders:{mode}', beatmap_id, f'{user_id}:{score_id}')
+            pipe.hset(f'rebuild:bancho:leaders:{mode}:{user_id}', beatmap_id, score_id)
+            user_ids.add(str(user_id))
+            total += 1
+
+            if total % batch_size == 0:
+                pipe.execute()
+
+        pipe.execute()
+
+    live_keys = {
+        key.decode() for key in
+        app.session.redis.scan_iter(match=f'bancho:leaders:{mode}:*', count=1000)
+        if key.decode().rsplit(':', 1)[-1].isdigit()
+    }
+
+    with app.session.redis.pipeline() as pipe:
+        if total:
+            pipe.rename(f'rebuild:bancho:leaders:{mode}', f'bancho:leaders:{mode}')
+        else:
+            pipe.delete(f'bancho:leaders:{mode}')
+
+        for user_id in user_ids:
+            pipe.rename(f'rebuild:bancho:leaders:{mode}:{user_id}', f'bancho:leaders:{mode}:{user_id}')
+
+        for key in live_keys.difference(f'bancho:leaders:{mode}:{user_id}' for user_id in user_ids):
+            pipe.delete(key)
+
+        pipe.set(f'bancho:leaders:{mode}:ready', 1)
+        pipe.execute()
+
+    return total
+
+def clear_shadow_keys(mode: int) -> None:
+    """Remove leftover shadow keys of a previous rebuild"""
+    keys = app.session.redis.scan_iter(match=f'rebuild:bancho:leaders:{mode}*', count=1000)
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.delete(key)
+
+        pipe.execute()
+
+def clear(mode: int) -> None:
+    """Remove all first places of a mode"""
+    keys = app.session.redis.scan_iter(
+        match=f'bancho:leaders:{mode}:*',
+        count=1000
+    )
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.delete(key)
+
+        pipe.delete(f'bancho:leaders:{mode}')
+        pipe.execute()
+
+def leader_swap_script() -> Script:
+    """Register the swap script on first use, which will then be sent via EVALSHA"""
+    global swap_script
+
+    if swap_script is None:
+        swap_script = app.session.redis.register_script(SWAP_SCRIPT)
+
+    return swap_script
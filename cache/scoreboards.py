@@ -0,0 +1,243 @@
+
+from app.common.config import config_instance as config
+from redis.commands.core import Script
+from redis.client import Pipeline
+from typing import Iterable, Tuple, List, Dict
+
+import uuid
+import app
+
+# Sorted sets of the scores on a beatmap, used to serve in-game leaderboards:
+#   bancho:scoreboards:{beatmap_id}:{mode}         -> status_score == 3
+#   bancho:scoreboards:{beatmap_id}:{mode}:{mods}  -> status_score in (3, 4), by mods
+# Members are inverted & zero-padded score ids, so that scores with the same
+# total score are ordered by their id in ascending order, like in postgres.
+# Every set contains a placeholder member, so that empty leaderboards get cached too.
+
+MAX_SCORE_ID = 10**18
+PLACEHOLDER = '-'
+
+# While a leaderboard is being populated from a database snapshot, writes are
+# also recorded in journals, which get merged into the snapshot once it's stored.
+#   {scoreboard}:populating  -> token of the latest populate call
+#   {scoreboard}:added       -> scores that were added in the meantime
+#   {scoreboard}:removed     -> scores that were removed in the meantime
+POPULATE_TIMEOUT = 30
+
+# KEYS[1]: scoreboard, KEYS[2]: populating, KEYS[3]: added, KEYS[4]: removed
+# ARGV[1]: total score, ARGV[2]: member
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('ZADD', KEYS[3], ARGV[1], ARGV[2])
+    redis.call('SREM', KEYS[4], ARGV[2])
+    redis.call('EXPIRE', KEYS[3], redis.call('TTL', KEYS[2]) + 1)
+end
+
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS[1]: scoreboard, KEYS[2]: populating, KEYS[3]: added, KEYS[4]: removed
+# ARGV[1]: member
+REMOVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('SADD', KEYS[4], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    redis.call('EXPIRE', KEYS[4], redis.call('TTL', KEYS[2]) + 1)
+end
+
+return redis.call('ZREM', KEYS[1], ARGV[1])
+"""
+
+# Applies the journals to a freshly stored snapshot, which is discarded
+# if the leaderboard was invalidated or the populate call timed out
+# KEYS[1]: scoreboard, KEYS[2]: populating, KEYS[3]: added, KEYS[4]: removed
+# ARGV[1]: populate token, ARGV[2]: ttl
+MERGE_SCRIPT = """
+local current = redis.call('GET', KEYS[2])
+
+if not current then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+
+redis.call('ZUNIONSTORE', KEYS[1], 2, KEYS[1], KEYS[3], 'AGGREGATE', 'MAX')
+
+for _, member in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+    redis.call('ZREM', KEYS[1], member)
+end
+
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+
+if current == ARGV[1] then
+    redis.call('DEL', KEYS[2], KEYS[3], KEYS[4])
+end
+
+return 1
+"""
+
+# Same semantics as the database: the amount of strictly higher scores, plus one
+# KEYS[1]: scoreboard, ARGV[1]: member
+POSITION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+
+if not score then
+    return 0
+end
+
+return redis.call('ZCOUNT', KEYS[1], '(' .. score, '+inf') + 1
+"""
+
+scripts: Dict[str, Script] = {}
+
+def key(beatmap_id: int, mode: int, mods: int | None = None) -> str:
+    mods_suffix = f":{mods}" if mods is not None else ""
+    return f'bancho:scoreboards:{beatmap_id}:{mode}{mods_suffix}'
+
+def encode_member(score_id: int) -> str:
+    return f'{MAX_SCORE_ID - score_id:019d}'
+
+def decode_member(member: bytes) -> int:
+    return MAX_SCORE_ID - int(member)
+
+def journal_keys(scoreboard_key: str) -> List[str]:
+    return [
+        scoreboard_key,
+        f'{scoreboard_key}:populating',
+        f'{scoreboard_key}:added',
+        f'{scoreboard_key}:removed'
+    ]
+
+def fetch_range(
+    beatmap_id: int,
+    mode: int,
+    offset: int = 0,
+    limit: int = 50,
+    mods: int | None = None
+) -> List[int] | None:
+    """Get the score ids of a leaderboard range, or None if it's not cached"""
+    scoreboard_key = key(beatmap_id, mode, mods)
+
+    with app.session.redis.pipeline() as pipe:
+        pipe.zrevrange(scoreboard_key, offset, offset + limit - 1)
+        pipe.exists(scoreboard_key)
+        members, exists = pipe.execute()
+
+    if not exists:
+        return None
+
+    return [
+        decode_member(member)
+        for member in members
+        if member != PLACEHOLDER.encode()
+    ]
+
+def fetch_position(
+    beatmap_id: int,
+    mode: int,
+    score_id: int,
+    mods: int | None = None
+) -> int | None:
+    """Get the position of a score, or None if the leaderboard is not cached"""
+    position = scoreboard_script('position', POSITION_SCRIPT)(
+        keys=[key(beatmap_id, mode, mods)],
+        args=[encode_member(score_id)]
+    )
+
+    return position if position >= 0 else None
+
+def begin_populate(
+    beatmap_id: int,
+    mode: int,
+    mods: int | None = None
+) -> str:
+    """Start recording writes to a leaderboard, before its snapshot is read from the database
+    `returns`: The token to pass to `populate`
+    """
+    token = uuid.uuid4().hex
+    app.session.redis.set(
+        f'{key(beatmap_id, mode, mods)}:populating',
+        token, ex=POPULATE_TIMEOUT
+    )
+    return token
+
+def populate(
+    beatmap_id: int,
+    mode: int,
+    entries: Iterable[Tuple[int, int]],
+    token: str,
+    mods: int | None = None
+) -> None:
+    """Cache a full leaderboard, including all writes since `begin_populate`
+    `entries`: Iterable[Tuple[score_id, total_score]]
+    """
+    keys = journal_keys(key(beatmap_id, mode, mods))
+    mapping = {encode_member(score_id): total_score for score_id, total_score in entries}
+    mapping[PLACEHOLDER] = float('-inf')
+
+    with app.session.redis.pipeline() as pipe:
+        pipe.delete(keys[0])
+        pipe.zadd(keys[0], mapping)
+        scoreboard_script('merge', MERGE_SCRIPT)(
+            keys=keys,
+            args=[token, config.SCOREBOARD_CACHE_TTL],
+            client=pipe
+        )
+        pipe.execute()
+
+def add(
+    beatmap_id: int,
+    mode: int,
+    score_id: int,
+    total_score: int,
+    mods: int | None = None,
+    pipe: Pipeline | None = None
+) -> None:
+    """Add a score to a leaderboard, if that leaderboard is currently cached"""
+    scoreboard_script('add', ADD_SCRIPT)(
+        keys=journal_keys(key(beatmap_id, mode, mods)),
+        args=[total_score, encode_member(score_id)],
+        client=pipe
+    )
+
+def remove(
+    beatmap_id: int,
+    mode: int,
+    score_id: int,
+    mods: int | None = None,
+    pipe: Pipeline | None = None
+) -> None:
+    """Remove a score from a leaderboard"""
+    scoreboard_script('remove', REMOVE_SCRIPT)(
+        keys=journal_keys(key(beatmap_id, mode, mods)),
+        args=[encode_member(score_id)],
+        client=pipe
+    )
+
+def invalidate(beatmap_id: int) -> None:
+    """Remove all cached leaderboards of a beatmap"""
+    keys = app.session.redis.scan_iter(
+        match=f'bancho:scoreboards:{beatmap_id}:*',
+        count=1000
+    )
+
+    with app.session.redis.pipeline(transaction=False) as pipe:
+        for scoreboard_key in keys:
+            pipe.delete(scoreboard_key)
+
+        pipe.execute()
+
+def scoreboard_script(name: str, source: str) -> Script:
+    """Register a script on first use, which will then be sent via EVALSHA"""
+    if name not in scripts:
+        scripts[name] = app.session.redis.register_script(source)
+
+    return scripts[name]
@@ -27,6 +27,20 @@ class Config(BaseSettings):
     POSTGRES_POOL_RECYCLE: int = 900
     POSTGRES_POOL_TIMEOUT: int = 15
 
+    # Optional streaming replicas, which will serve fetch_* & search_* calls
+    POSTGRES_REPLICA_DSNS: list[str] = []
+    POSTGRES_REPLICA_MAX_LAG: float = 5.0
+    POSTGRES_REPLICA_CHECK_INTERVAL: int = 10
+
+    # Reads that follow a write of the same thread/task go to the primary for this many seconds
+    POSTGRES_REPLICA_PIN_DURATION: float = 5.0
+
+    # Per-function latency metrics & a sampled log of slow queries
+    INSTRUMENTATION_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD: float = 0.5
+    SLOW_QUERY_SAMPLE_RATE: float = 1.0
+    SLOW_QUERY_LOG_SIZE: int = 100
+
     ## Redis configuration
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
@@ -57,6 +71,9 @@ class Config(BaseSettings):
     S3_MAX_IO_QUEUE: int = 100
     S3_USE_THREADS: bool = True
 
+    # Amount of 2 MB blocks that every S3 file reader keeps in memory
+    S3_READER_MAX_BLOCKS: int = 4
+
     # Path to store application data locally, if S3 is disabled
     DATA_PATH: str = Field(default_factory=lambda: os.path.abspath(".data"))
 
@@ -122,6 +139,33 @@ class Config(BaseSettings):
     # Amount of scores that will be sent for rankings
     SCORE_RESPONSE_LIMIT: int = 50
 
+    # Serve beatmap leaderboards from redis sorted sets instead of postgres
+    # Inactive beatmaps will be evicted after the ttl (in seconds)
+    SCOREBOARD_CACHE_ENABLED: bool = False
+    SCOREBOARD_CACHE_TTL: int = 3600
+
+    # Beatmap resources are only fetched once at a time per process, this will
+    # also coordinate fetches between processes, by using locks inside of redis
+    BEATMAP_RESOURCES_REDIS_LOCK: bool = False
+    BEATMAP_RESOURCES_LOCK_TIMEOUT: int = 30
+
+    # In-process cache for .osu files in front of redis, with a budget in bytes & ttl in seconds
+    # Replaced beatmap files get invalidated in all processes through redis pub/sub
+    LOCAL_BLOB_CACHE_ENABLED: bool = False
+    LOCAL_BLOB_CACHE_SIZE: int = 128 * 1024 * 1024
+    LOCAL_BLOB_CACHE_TTL: int = 300
+    LOCAL_BLOB_CACHE_COMPRESSION: bool = False
+
+    # Send a request to the next mirror, if the previous one didn't respond within the delay (in seconds)
+    MIRROR_HEDGING_ENABLED: bool = False
+    MIRROR_HEDGING_DELAY: float = 1.0
+
+    # Prefer mirrors with a lower average response time over their configured priority
+    MIRROR_LATENCY_ORDERING: bool = False
+
+    # Build no-video variants of uploaded .osz files in the background, so they can be served directly
+    OSZ_NOVIDEO_VARIANTS_ENABLED: bool = False
+
     # Maximum amount of beatmap favourites a user can have
     BEATMAP_FAVOURITES_LIMIT: int = 100
 
@@ -140,6 +184,13 @@ class Config(BaseSettings):
     # If set to false, the client will always provide a full submission of the osz2 file instead of a patch
     BEATMAP_SUBMISSION_STORE_OSZ2: bool = True
 
+    # Memory budget (in bytes) for parsed beatmaps, which are kept by the rosu pp calculator
+    PPV2_BEATMAP_CACHE_SIZE: int = 256 * 1024 * 1024
+
+    # Difficulty attributes are cached in-process (amount of entries) and inside redis (ttl in seconds)
+    PPV2_DIFFICULTY_CACHE_SIZE: int = 10000
+    PPV2_DIFFICULTY_CACHE_TTL: int = 60 * 60 * 24 * 7
+
     # Used to freeze rank graph updates, useful for pp recalculations
     FROZEN_RANK_UPDATES: bool = False
 
@@ -350,6 +401,11 @@ class Config(BaseSettings):
             f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DATABASE or self.POSTGRES_USER}"
         )
 
+    @computed_field
+    @property
+    def POSTGRES_ASYNC_DSN(self) -> str:
+        return self.POSTGRES_DSN.replace("postgresql://", "postgresql+asyncpg://", 1)
+
     @computed_field
     @property
     def OSU_BASEURL(self) -> str:
@@ -39,6 +39,7 @@ class Mods(IntFlag):
     KeyMod = Key1 | Key2 | Key3 | Key4 | Key5 | Key6 | Key7 | Key8 | Key9 | KeyCoop
     FreeModAllowed = NoFail | Easy | Hidden | HardRock | SuddenDeath | Flashlight | FadeIn | Relax | Autopilot | SpunOut | KeyMod
     SpeedMods = DoubleTime | HalfTime| Nightcore
+    DifficultyMods = Easy | NoVideo | Hidden | HardRock | DoubleTime | Relax | HalfTime | Flashlight | Autopilot | KeyMod
 
     @property
     def members(self) -> list:
@@ -1,4 +1,5 @@
 
-from .postgres import Postgres
+from .postgres import Postgres, AsyncPostgres
+from .scope import scope, current_scope
 from .repositories import *
 from .objects import *
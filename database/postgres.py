@@ -1,39 +1,89 @@
 
 from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import NullPool, QueuePool
 from sqlalchemy import create_engine, text
-from contextlib import contextmanager
-from typing import Generator
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager, asynccontextmanager
+from typing import Generator, AsyncGenerator, ContextManager
 
 from ..config import Config
+from .. import profiling
 from .. import officer
 
 from .objects import Base
 from . import extensions
+from . import scope
 
+import itertools
+import asyncio
 import logging
 import time
 
+# Replication lag in seconds, which is 0 when the replica has replayed
+# everything that it has received, so idle primaries don't count as lag
+REPLICA_LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+def create_pooled_engine(dsn: str, config: Config) -> Engine:
+    engine = create_engine(
+        dsn,
+        poolclass=QueuePool if config.POSTGRES_POOL_ENABLED else NullPool,
+        max_overflow=config.POSTGRES_POOL_SIZE_OVERFLOW,
+        pool_size=config.POSTGRES_POOL_SIZE,
+        pool_pre_ping=config.POSTGRES_POOL_PRE_PING,
+        pool_recycle=config.POSTGRES_POOL_RECYCLE,
+        pool_timeout=config.POSTGRES_POOL_TIMEOUT,
+        echo_pool=None,
+        echo=None
+    )
+    scope.register_events(engine)
+    profiling.register_events(engine)
+    return engine
+
+class Replica:
+    def __init__(self, dsn: str, config: Config) -> None:
+        self.engine = create_pooled_engine(dsn, config)
+        self.sessionmaker = sessionmaker(
+            bind=self.engine,
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False
+        )
+        self.name = self.engine.url.host or dsn
+        self.healthy = True
+        self.lag = 0.0
+
+    def check(self, max_lag: float) -> bool:
+        try:
+            with self.engine.connect() as connection:
+                self.lag = float(connection.execute(REPLICA_LAG_QUERY).scalar() or 0)
+                self.healthy = self.lag <= max_lag
+        except Exception:
+            self.healthy = False
+
+        return self.healthy
+
 class Postgres:
     def __init__(self, config: Config) -> None:
-        self.engine = create_engine(
-            config.POSTGRES_DSN,
-            poolclass=QueuePool if config.POSTGRES_POOL_ENABLED else NullPool,
-            max_overflow=config.POSTGRES_POOL_SIZE_OVERFLOW,
-            pool_size=config.POSTGRES_POOL_SIZE,
-            pool_pre_ping=config.POSTGRES_POOL_PRE_PING,
-            pool_recycle=config.POSTGRES_POOL_RECYCLE,
-            pool_timeout=config.POSTGRES_POOL_TIMEOUT,
-            echo_pool=None,
-            echo=None
-        )
+        self.engine = create_pooled_engine(config.POSTGRES_DSN, config)
         self.sessionmaker = sessionmaker(
             bind=self.engine,
             autoflush=False,
             autocommit=False,
             expire_on_commit=False
         )
+        self.replicas = [
+            Replica(dsn, config)
+            for dsn in config.POSTGRES_REPLICA_DSNS
+        ]
+        self.replica_max_lag = config.POSTGRES_REPLICA_MAX_LAG
+        self.replica_check_interval = config.POSTGRES_REPLICA_CHECK_INTERVAL
+        self.replica_counter = itertools.count()
         self.ignored_exceptions = (
             'RequestValidationError',
             'HTTPException',
@@ -44,21 +94,30 @@ class Postgres:
         self.executor = ThreadPoolExecutor(max_workers=1)
         self.logger = logging.getLogger('postgres')
 
+        if self.replicas:
+            Thread(target=self.monitor_replicas, daemon=True).start()
+
     @property
     def session(self) -> Session:
         return self.sessionmaker(bind=self.engine)
 
+    def scope(self, autocommit: bool = True) -> ContextManager[scope.Scope]:
+        return scope.scope(autocommit=autocommit)
+
     @contextmanager
-    def managed_session(self, autocommit: bool = True) -> Generator[Session, None, None]:
-        yield from self.yield_session(autocommit=autocommit)
+    def managed_session(self, autocommit: bool = True, readonly: bool = False) -> Generator[Session, None, None]:
+        yield from self.yield_session(autocommit=autocommit, readonly=readonly)
 
-    def yield_session(self, autocommit: bool = True) -> Generator[Session, None, None]:
-        session = self.sessionmaker(bind=self.engine)
+    def yield_session(self, autocommit: bool = True, readonly: bool = False) -> Generator[Session, None, None]:
+        session = (
+            self.readonly_sessionmaker()()
+            if readonly else self.sessionmaker(bind=self.engine)
+        )
 
         try:
             yield session
 
-            if autocommit:
+            if autocommit and not readonly:
                 session.commit()
         except Exception as e:
             self.log_transaction_failure(e)
@@ -79,6 +138,32 @@ class Postgres:
 
         raise ConnectionError('Failed to establish a connection to the database')
     
+    def readonly_sessionmaker(self) -> sessionmaker:
+        """Pick a healthy replica in round-robin order, or fall back to the primary"""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+
+        if not healthy:
+            return self.sessionmaker
+
+        return healthy[next(self.replica_counter) % len(healthy)].sessionmaker
+
+    def check_replicas(self) -> None:
+        for replica in self.replicas:
+            was_healthy = replica.healthy
+
+            if replica.check(self.replica_max_lag) == was_healthy:
+                continue
+
+            if replica.healthy:
+                self.logger.info(f'Replica "{replica.name}" is healthy again (lag: {replica.lag:.2f}s)')
+            else:
+                self.logger.warning(f'Replica "{replica.name}" is unhealthy (lag: {replica.lag:.2f}s)')
+
+    def monitor_replicas(self) -> None:
+        while True:
+            self.check_replicas()
+            time.sleep(self.replica_check_interval)
+
     def log_transaction_failure(self, e: Exception) -> None:
         exception_name = e.__class__.__name__
 
@@ -87,3 +172,63 @@ class Postgres:
 
         self.executor.submit(officer.call, 'Database transaction failed', exc_info=e, exc_offset=1)
         self.logger.warning('Performing rollback...')
+
+class AsyncPostgres(Postgres):
+    def __init__(self, config: Config) -> None:
+        super().__init__(config)
+        self.async_engine = create_async_engine(
+            config.POSTGRES_ASYNC_DSN,
+            poolclass=AsyncAdaptedQueuePool if config.POSTGRES_POOL_ENABLED else NullPool,
+            max_overflow=config.POSTGRES_POOL_SIZE_OVERFLOW,
+            pool_size=config.POSTGRES_POOL_SIZE,
+            pool_pre_ping=config.POSTGRES_POOL_PRE_PING,
+            pool_recycle=config.POSTGRES_POOL_RECYCLE,
+            pool_timeout=config.POSTGRES_POOL_TIMEOUT,
+            echo_pool=None,
+            echo=None
+        )
+        scope.register_events(self.async_engine.sync_engine)
+        profiling.register_events(self.async_engine.sync_engine)
+        self.async_sessionmaker = async_sessionmaker(
+            bind=self.async_engine,
+            autoflush=False,
+            autocommit=False,
+            expire_on_commit=False,
+            info={'defer_after_commit': True}
+        )
+
+    @property
+    def async_session(self) -> AsyncSession:
+        return self.async_sessionmaker()
+
+    @asynccontextmanager
+    async def managed_async_session(self, autocommit: bool = True) -> AsyncGenerator[AsyncSession, None]:
+        session = self.async_sessionmaker()
+
+        try:
+            yield session
+
+            if autocommit:
+                await session.commit()
+        except Exception as e:
+            self.log_transaction_failure(e)
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def wait_for_async_connection(self, retries: int = 10, delay: int = 1) -> None:
+        for attempt in range(retries):
+            async with self.managed_async_session(autocommit=False) as session:
+                try:
+                    await session.execute(text('SELECT 1'))
+                    return None
+                except Exception as e:
+                    self.logger.warning(f'Failed to connect: "{e}" (attempt {attempt+1}/{retries})')
+                    await asyncio.sleep(delay)
+
+        raise ConnectionError('Failed to establish a connection to the database')
+
+    async def dispose(self) -> None:
+        await self.async_engine.dispose()
+        self.engine.dispose()
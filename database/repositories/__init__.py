@@ -45,3 +45,5 @@ from . import (
     wiki,
     logs
 )
+
+from . import aio
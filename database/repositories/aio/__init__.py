@@ -0,0 +1,13 @@
+
+# Async variants of the most frequently used repositories.
+# They share their queries with the synchronous repositories,
+# which get executed on an AsyncSession through `run_sync`.
+# Repositories that read from redis run on a thread instead.
+
+from . import (
+    beatmapsets,
+    beatmaps,
+    scores,
+    stats,
+    users
+)
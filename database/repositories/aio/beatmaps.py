@@ -0,0 +1,27 @@
+
+from ..wrapper import async_session_wrapper
+from .. import beatmaps
+
+beatmap_relationships = ('beatmapset',)
+
+create = async_session_wrapper(beatmaps.create, eager=beatmap_relationships)
+fetch_by_id = async_session_wrapper(beatmaps.fetch_by_id, eager=beatmap_relationships)
+fetch_by_file = async_session_wrapper(beatmaps.fetch_by_file, eager=beatmap_relationships)
+fetch_by_checksum = async_session_wrapper(beatmaps.fetch_by_checksum, eager=beatmap_relationships)
+fetch_by_set = async_session_wrapper(beatmaps.fetch_by_set, eager=beatmap_relationships)
+fetch_count = async_session_wrapper(beatmaps.fetch_count)
+fetch_count_by_mode = async_session_wrapper(beatmaps.fetch_count_by_mode)
+fetch_count_grouped_status = async_session_wrapper(beatmaps.fetch_count_grouped_status)
+fetch_count_with_leaderboards = async_session_wrapper(beatmaps.fetch_count_with_leaderboards)
+fetch_id_by_filename = async_session_wrapper(beatmaps.fetch_id_by_filename)
+fetch_id_by_set_and_filename = async_session_wrapper(beatmaps.fetch_id_by_set_and_filename)
+fetch_filename_by_id = async_session_wrapper(beatmaps.fetch_filename_by_id)
+fetch_most_played = async_session_wrapper(beatmaps.fetch_most_played, eager=beatmap_relationships)
+fetch_most_played_approved = async_session_wrapper(beatmaps.fetch_most_played_approved, eager=beatmap_relationships)
+fetch_most_played_delta = async_session_wrapper(beatmaps.fetch_most_played_delta, eager=beatmap_relationships)
+update = async_session_wrapper(beatmaps.update)
+exists = async_session_wrapper(beatmaps.exists)
+filename_exists = async_session_wrapper(beatmaps.filename_exists)
+update_by_set_id = async_session_wrapper(beatmaps.update_by_set_id)
+delete_by_id = async_session_wrapper(beatmaps.delete_by_id)
+delete_by_set_id = async_session_wrapper(beatmaps.delete_by_set_id)
@@ -0,0 +1,25 @@
+
+from ..wrapper import async_session_wrapper
+from .. import beatmapsets
+
+beatmapset_relationships = ('beatmaps',)
+
+create = async_session_wrapper(beatmapsets.create, eager=beatmapset_relationships)
+fetch_one = async_session_wrapper(beatmapsets.fetch_one, eager=beatmapset_relationships)
+fetch_count = async_session_wrapper(beatmapsets.fetch_count)
+fetch_by_creator = async_session_wrapper(beatmapsets.fetch_by_creator, eager=beatmapset_relationships)
+fetch_by_topic = async_session_wrapper(beatmapsets.fetch_by_topic, eager=beatmapset_relationships)
+fetch_by_status = async_session_wrapper(beatmapsets.fetch_by_status, eager=beatmapset_relationships)
+fetch_unranked_count = async_session_wrapper(beatmapsets.fetch_unranked_count)
+fetch_ranked_count = async_session_wrapper(beatmapsets.fetch_ranked_count)
+fetch_inactive = async_session_wrapper(beatmapsets.fetch_inactive, eager=beatmapset_relationships)
+fetch_most_played = async_session_wrapper(beatmapsets.fetch_most_played)
+fetch_server_id = async_session_wrapper(beatmapsets.fetch_server_id)
+fetch_download_server_id = async_session_wrapper(beatmapsets.fetch_download_server_id)
+fetch_download_server_by_beatmap = async_session_wrapper(beatmapsets.fetch_download_server_by_beatmap)
+update = async_session_wrapper(beatmapsets.update)
+delete_by_id = async_session_wrapper(beatmapsets.delete_by_id)
+delete_inactive = async_session_wrapper(beatmapsets.delete_inactive)
+search_one = async_session_wrapper(beatmapsets.search_one, eager=beatmapset_relationships)
+search_direct = async_session_wrapper(beatmapsets.search_direct, eager=beatmapset_relationships)
+search_extended = async_session_wrapper(beatmapsets.search_extended, eager=beatmapset_relationships)
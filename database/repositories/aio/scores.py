@@ -0,0 +1,58 @@
+
+from ..wrapper import async_session_wrapper, async_thread_wrapper
+from .. import scores
+
+score_relationships = ('user', 'beatmap.beatmapset')
+
+create = async_session_wrapper(scores.create, eager=score_relationships)
+update = async_session_wrapper(scores.update)
+update_by_beatmap_id = async_session_wrapper(scores.update_by_beatmap_id)
+hide_all = async_session_wrapper(scores.hide_all)
+fetch_by_id = async_session_wrapper(scores.fetch_by_id, eager=score_relationships)
+fetch_by_replay_checksum = async_session_wrapper(scores.fetch_by_replay_checksum, eager=score_relationships)
+fetch_count = async_session_wrapper(scores.fetch_count)
+fetch_total_count = async_session_wrapper(scores.fetch_total_count)
+fetch_count_beatmap = async_session_wrapper(scores.fetch_count_beatmap)
+fetch_top_scores = async_session_wrapper(scores.fetch_top_scores, eager=score_relationships)
+fetch_top_scores_count = async_session_wrapper(scores.fetch_top_scores_count)
+fetch_leader_scores = async_thread_wrapper(scores.fetch_leader_scores, eager=score_relationships)
+fetch_leader_count = async_thread_wrapper(scores.fetch_leader_count)
+fetch_first_place = async_session_wrapper(scores.fetch_first_place)
+update_leader = async_session_wrapper(scores.update_leader)
+update_leaders_by_beatmap = async_session_wrapper(scores.update_leaders_by_beatmap)
+fetch_best = async_session_wrapper(scores.fetch_best, eager=score_relationships)
+fetch_best_by_score = async_session_wrapper(scores.fetch_best_by_score, eager=score_relationships)
+fetch_best_by_beatmap = async_session_wrapper(scores.fetch_best_by_beatmap, eager=score_relationships)
+fetch_pinned = async_session_wrapper(scores.fetch_pinned, eager=score_relationships)
+fetch_pinned_count = async_session_wrapper(scores.fetch_pinned_count)
+fetch_personal_best = async_session_wrapper(scores.fetch_personal_best, eager=score_relationships)
+fetch_personal_bests = async_session_wrapper(scores.fetch_personal_bests, eager=score_relationships)
+fetch_personal_best_score = async_session_wrapper(scores.fetch_personal_best_score, eager=score_relationships)
+fetch_grades = async_session_wrapper(scores.fetch_grades)
+fetch_range_scores = async_session_wrapper(scores.fetch_range_scores, eager=score_relationships)
+fetch_range_scores_country = async_session_wrapper(scores.fetch_range_scores_country, eager=score_relationships)
+fetch_range_scores_friends = async_session_wrapper(scores.fetch_range_scores_friends, eager=score_relationships)
+fetch_range_scores_mods = async_session_wrapper(scores.fetch_range_scores_mods, eager=score_relationships)
+fetch_score_index = async_session_wrapper(scores.fetch_score_index)
+fetch_scoreboard_entries = async_session_wrapper(scores.fetch_scoreboard_entries)
+fetch_scoreboard_range = async_thread_wrapper(scores.fetch_scoreboard_range)
+fetch_scoreboard_position = async_thread_wrapper(scores.fetch_scoreboard_position)
+fetch_by_ids_ordered = async_session_wrapper(scores.fetch_by_ids_ordered, eager=score_relationships)
+update_scoreboards_by_user = async_session_wrapper(scores.update_scoreboards_by_user)
+fetch_score_index_by_id = async_session_wrapper(scores.fetch_score_index_by_id)
+fetch_score_index_by_tscore = async_session_wrapper(scores.fetch_score_index_by_tscore)
+fetch_score_above = async_session_wrapper(scores.fetch_score_above, eager=score_relationships)
+fetch_recent = async_session_wrapper(scores.fetch_recent, eager=score_relationships)
+fetch_recent_until = async_session_wrapper(scores.fetch_recent_until, eager=score_relationships)
+fetch_recent_by_status = async_session_wrapper(scores.fetch_recent_by_status, eager=score_relationships)
+fetch_recent_by_status_and_mode = async_session_wrapper(scores.fetch_recent_by_status_and_mode, eager=score_relationships)
+fetch_recent_all = async_session_wrapper(scores.fetch_recent_all, eager=score_relationships)
+fetch_recent_top_scores = async_session_wrapper(scores.fetch_recent_top_scores, eager=score_relationships)
+fetch_most_viewed = async_session_wrapper(scores.fetch_most_viewed, eager=score_relationships)
+fetch_most_viewed_by_user = async_session_wrapper(scores.fetch_most_viewed_by_user, eager=score_relationships)
+fetch_most_viewed_by_user_count = async_session_wrapper(scores.fetch_most_viewed_by_user_count)
+fetch_pp_record = async_session_wrapper(scores.fetch_pp_record, eager=score_relationships)
+fetch_clears = async_session_wrapper(scores.fetch_clears)
+delete = async_session_wrapper(scores.delete)
+delete_by_beatmap_id = async_session_wrapper(scores.delete_by_beatmap_id)
+restore_hidden_scores = async_session_wrapper(scores.restore_hidden_scores)
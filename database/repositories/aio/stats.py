@@ -0,0 +1,10 @@
+
+from ..wrapper import async_session_wrapper
+from .. import stats
+
+create = async_session_wrapper(stats.create)
+update = async_session_wrapper(stats.update)
+update_all = async_session_wrapper(stats.update_all)
+delete_all = async_session_wrapper(stats.delete_all)
+fetch_by_mode = async_session_wrapper(stats.fetch_by_mode)
+fetch_all = async_session_wrapper(stats.fetch_all)
@@ -0,0 +1,33 @@
+
+from ..wrapper import async_session_wrapper
+from .. import users
+
+user_relationships = ('stats', 'groups')
+
+create = async_session_wrapper(users.create, eager=user_relationships)
+update = async_session_wrapper(users.update)
+fetch_by_name = async_session_wrapper(users.fetch_by_name, eager=user_relationships)
+fetch_by_name_case_insensitive = async_session_wrapper(users.fetch_by_name_case_insensitive, eager=user_relationships)
+fetch_by_name_extended = async_session_wrapper(users.fetch_by_name_extended, eager=user_relationships)
+fetch_by_safe_name = async_session_wrapper(users.fetch_by_safe_name, eager=user_relationships)
+fetch_by_id = async_session_wrapper(users.fetch_by_id, eager=user_relationships)
+fetch_by_id_no_options = async_session_wrapper(users.fetch_by_id_no_options, eager=user_relationships)
+fetch_for_profile = async_session_wrapper(users.fetch_for_profile, eager=user_relationships)
+fetch_by_email = async_session_wrapper(users.fetch_by_email, eager=user_relationships)
+fetch_all = async_session_wrapper(users.fetch_all, eager=user_relationships)
+fetch_active = async_session_wrapper(users.fetch_active, eager=user_relationships)
+fetch_by_discord_id = async_session_wrapper(users.fetch_by_discord_id, eager=user_relationships)
+fetch_count = async_session_wrapper(users.fetch_count)
+fetch_username = async_session_wrapper(users.fetch_username)
+fetch_usernames = async_session_wrapper(users.fetch_usernames)
+fetch_irc_token = async_session_wrapper(users.fetch_irc_token)
+fetch_user_id = async_session_wrapper(users.fetch_user_id)
+fetch_avatar_checksum = async_session_wrapper(users.fetch_avatar_checksum)
+fetch_many = async_session_wrapper(users.fetch_many, eager=user_relationships)
+fetch_many_for_rankings = async_session_wrapper(users.fetch_many_for_rankings, eager=user_relationships)
+fetch_top = async_session_wrapper(users.fetch_top, eager=user_relationships)
+fetch_recent = async_session_wrapper(users.fetch_recent, eager=user_relationships)
+fetch_post_count = async_session_wrapper(users.fetch_post_count)
+fetch_post_counts = async_session_wrapper(users.fetch_post_counts)
+fetch_subscriptions = async_session_wrapper(users.fetch_subscriptions, eager=user_relationships)
+fetch_bookmarks = async_session_wrapper(users.fetch_bookmarks, eager=user_relationships)
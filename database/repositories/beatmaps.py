@@ -4,6 +4,7 @@ from sqlalchemy.orm import selectinload
 from sqlalchemy import func
 
 from .wrapper import session_wrapper, SessionProvider
+from . import scores
 
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple
@@ -188,6 +189,11 @@ def update(
         .filter(DBBeatmap.id == beatmap_id) \
         .update(updates)
     session.flush()
+
+    if changes_status(updates):
+        # The beatmap may have gained or lost its cached #1 score
+        scores.update_leaders_by_beatmap(beatmap_id, session=session)
+
     return rows
 
 @session_wrapper
@@ -212,8 +218,22 @@ def update_by_set_id(
         .filter(DBBeatmap.set_id == set_id) \
         .update(updates)
     session.flush()
+
+    if changes_status(updates):
+        # The beatmaps may have gained or lost their cached #1 scores
+        beatmap_ids = session.query(DBBeatmap.id) \
+            .filter(DBBeatmap.set_id == set_id) \
+            .all()
+
+        for beatmap_id, in beatmap_ids:
+            scores.update_leaders_by_beatmap(beatmap_id, session=session)
+
     return rows
 
+def changes_status(updates: dict) -> bool:
+    # Updates can either be keyed by column names or by the columns themselves
+    return any(getattr(key, 'key', key) == 'status' for key in updates)
+
 @session_wrapper
 def delete_by_id(id: int, session: Session = SessionProvider) -> int:
     rows = session.query(DBBeatmap) \
@@ -10,7 +10,7 @@ from app.common.database.objects import (
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
 from datetime import datetime
-from typing import List
+from typing import List, Dict, Tuple
 
 from .wrapper import session_wrapper, SessionProvider
 
@@ -126,12 +126,19 @@ def fetch_replay_history_all(
 def update_rank(
     stats: DBStats,
     country: str,
+    ranks: Dict[str, Tuple[int, int]] | None = None,
     session: Session = SessionProvider
 ) -> None:
-    country_rank = leaderboards.country_rank(stats.user_id, stats.mode, country)
-    global_rank = leaderboards.global_rank(stats.user_id, stats.mode)
-    score_rank = leaderboards.score_rank(stats.user_id, stats.mode)
-    ppv1_rank = leaderboards.ppv1_rank(stats.user_id, stats.mode)
+    if ranks is not None:
+        # Ranks were already returned by leaderboards.update()
+        global_rank, country_rank = ranks['performance']
+        score_rank = ranks['rscore'][0]
+        ppv1_rank = ranks['ppv1'][0]
+    else:
+        country_rank = leaderboards.country_rank(stats.user_id, stats.mode, country)
+        global_rank = leaderboards.global_rank(stats.user_id, stats.mode)
+        score_rank = leaderboards.score_rank(stats.user_id, stats.mode)
+        ppv1_rank = leaderboards.ppv1_rank(stats.user_id, stats.mode)
 
     if any([
         global_rank <= 0,
@@ -1,4 +1,6 @@
 
+from app.common.config import config_instance as config
+from app.common.cache import leaders, scoreboards
 from app.common.constants import Grade
 from app.common.database.objects import (
     DBBeatmap,
@@ -7,17 +9,29 @@ from app.common.database.objects import (
 )
 
 from sqlalchemy.orm import aliased, selectinload, Session
-from sqlalchemy import and_, or_, func, select
+from sqlalchemy import and_, or_, func, select, update as update_statement, values, column, BigInteger, Float
+from redis.client import Pipeline
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
+from ..scope import after_commit
 from .wrapper import session_wrapper, SessionProvider
 
+import app
+
+# Updates to these columns can change the leaderboards of a beatmap
+ranking_columns = frozenset(('hidden', 'status_score', 'total_score'))
+
 @session_wrapper
 def create(score: DBScore, session: Session = SessionProvider) -> DBScore:
     session.add(score)
     session.flush()
     session.refresh(score)
+
+    if score.status_score == 3 and not score.hidden:
+        update_leader(score.beatmap_id, score.mode, session=session)
+
+    update_scoreboards(score, session=session)
     return score
 
 @session_wrapper
@@ -30,6 +44,23 @@ def update(
         .filter(DBScore.id == score_id) \
         .update(updates)
     session.flush()
+
+    if rows and ranking_columns.intersection(updates):
+        score = session.query(
+                DBScore.id,
+                DBScore.beatmap_id,
+                DBScore.mode,
+                DBScore.mods,
+                DBScore.total_score,
+                DBScore.status_score,
+                DBScore.hidden
+            ) \
+            .filter(DBScore.id == score_id) \
+            .one()
+
+        update_leader(score.beatmap_id, score.mode, session=session)
+        update_scoreboards(score, session=session)
+
     return rows
 
 @session_wrapper
@@ -42,6 +73,13 @@ def update_by_beatmap_id(
         .filter(DBScore.beatmap_id == beatmap_id) \
         .update(updates)
     session.flush()
+
+    if rows and ranking_columns.intersection(updates):
+        update_leaders_by_beatmap(beatmap_id, session=session)
+
+        if config.SCOREBOARD_CACHE_ENABLED:
+            after_commit(session, lambda: scoreboards.invalidate(beatmap_id))
+
     return rows
 
 @session_wrapper
@@ -50,8 +88,42 @@ def hide_all(user_id: int, session: Session = SessionProvider) -> int:
         .filter(DBScore.user_id == user_id) \
         .update({'hidden': True})
     session.flush()
+
+    # The player can't hold any first places anymore
+    after_commit(session, lambda: refresh_leaders_by_user(user_id))
+
+    if config.SCOREBOARD_CACHE_ENABLED:
+        update_scoreboards_by_user(user_id, session=session)
+
     return rows
 
+@session_wrapper
+def update_bulk(
+    column_name: str,
+    values_by_id: Dict[int, float],
+    session: Session = SessionProvider
+) -> int:
+    """Update a numeric column for many scores through a single `UPDATE ... FROM (VALUES ...)`"""
+    assert column_name not in ranking_columns, "Ranking columns need to go through update()"
+
+    if not values_by_id:
+        return 0
+
+    data = values(
+        column('id', BigInteger),
+        column('value', Float),
+        name='data'
+    ).data(list(values_by_id.items()))
+
+    result = session.execute(
+        update_statement(DBScore)
+            .where(DBScore.id == data.c.id)
+            .values({column_name: data.c.value}),
+        execution_options={'synchronize_session': False}
+    )
+    session.flush()
+    return result.rowcount
+
 @session_wrapper
 def fetch_by_id(id: int, session: Session = SessionProvider) -> DBScore | None:
     return session.query(DBScore) \
@@ -173,6 +245,16 @@ def fetch_top_scores_count(
         .filter(DBScore.hidden == False) \
         .scalar()
 
+def outranks(other_score):
+    """Ties on the total score go to the earlier submission, just like in fetch_first_place"""
+    return or_(
+        other_score.total_score > DBScore.total_score,
+        and_(
+            other_score.total_score == DBScore.total_score,
+            other_score.id < DBScore.id
+        )
+    )
+
 @session_wrapper
 def fetch_leader_scores(
     user_id: int,
@@ -181,6 +263,22 @@ def fetch_leader_scores(
     offset: int = 0,
     session: Session = SessionProvider
 ) -> List[DBScore]:
+    if leaders.is_populated(mode):
+        score_ids = leaders.score_ids(user_id, mode)
+
+        if not score_ids:
+            return []
+
+        return session.query(DBScore) \
+            .options(selectinload(DBScore.beatmap).selectinload(DBBeatmap.beatmapset)) \
+            .join(DBScore.beatmap) \
+            .filter(DBBeatmap.status > 0) \
+            .filter(DBScore.id.in_(score_ids)) \
+            .order_by(DBScore.id.desc()) \
+            .limit(limit) \
+            .offset(offset) \
+            .all()
+
     other_score = aliased(DBScore)
 
     return session.query(DBScore) \
@@ -196,7 +294,7 @@ def fetch_leader_scores(
             .filter(other_score.mode == DBScore.mode)
             .filter(other_score.status_score == 3)
             .filter(other_score.hidden == False)
-            .filter(other_score.total_score > DBScore.total_score)
+            .filter(outranks(other_score))
             .exists()
         ) \
         .order_by(DBScore.id.desc()) \
@@ -210,6 +308,9 @@ def fetch_leader_count(
     mode: int,
     session: Session = SessionProvider
 ) -> int:
+    if leaders.is_populated(mode):
+        return leaders.count(user_id, mode)
+
     other_score = aliased(DBScore)
 
     return session.query(func.count(DBScore.id)) \
@@ -224,11 +325,109 @@ def fetch_leader_count(
             .filter(other_score.mode == DBScore.mode)
             .filter(other_score.status_score == 3)
             .filter(other_score.hidden == False)
-            .filter(other_score.total_score > DBScore.total_score)
+            .filter(outranks(other_score))
             .exists()
         ) \
         .scalar()
 
+@session_wrapper
+def fetch_first_place(
+    beatmap_id: int,
+    mode: int,
+    session: Session = SessionProvider
+) -> Tuple[int, int] | None:
+    """`returns`: Tuple[user_id, score_id] of the #1 score on a beatmap"""
+    return session.query(DBScore.user_id, DBScore.id) \
+        .join(DBScore.beatmap) \
+        .filter(DBBeatmap.status > 0) \
+        .filter(DBScore.beatmap_id == beatmap_id) \
+        .filter(DBScore.mode == mode) \
+        .filter(DBScore.status_score == 3) \
+        .filter(DBScore.hidden == False) \
+        .order_by(DBScore.total_score.desc(), DBScore.id.asc()) \
+        .first()
+
+@session_wrapper
+def update_leader(
+    beatmap_id: int,
+    mode: int,
+    session: Session = SessionProvider
+) -> None:
+    """Refresh the cached #1 score of a beatmap, once the transaction has been committed"""
+    after_commit(session, lambda: refresh_leader(beatmap_id, mode))
+
+@session_wrapper
+def update_leaders_by_beatmap(beatmap_id: int, session: Session = SessionProvider) -> None:
+    for mode in range(4):
+        update_leader(beatmap_id, mode, session=session)
+
+def refresh_leader(beatmap_id: int, mode: int) -> None:
+    """Write the committed #1 score of a beatmap to the cache"""
+    if not leaders.is_tracked(mode):
+        return
+
+    # This runs after the commit, so the caller's session can't be used anymore
+    with app.session.database.managed_session() as session:
+        first_place = fetch_first_place(beatmap_id, mode, session=session)
+
+    user_id, score_id = first_place or (None, None)
+    leaders.update(beatmap_id, mode, user_id, score_id)
+
+def refresh_leaders_by_user(user_id: int) -> None:
+    for mode in range(4):
+        if not leaders.is_populated(mode):
+            continue
+
+        for beatmap_id in leaders.beatmap_ids(user_id, mode):
+            refresh_leader(beatmap_id, mode)
+
+def restore_leaders_by_user(user_id: int) -> None:
+    tracked_modes = [mode for mode in range(4) if leaders.is_tracked(mode)]
+
+    if not tracked_modes:
+        return
+
+    with app.session.database.managed_session() as session:
+        beatmaps = session.query(DBScore.beatmap_id, DBScore.mode) \
+            .filter(DBScore.user_id == user_id) \
+            .filter(DBScore.mode.in_(tracked_modes)) \
+            .filter(DBScore.status_score == 3) \
+            .distinct() \
+            .all()
+
+    for beatmap_id, mode in beatmaps:
+        refresh_leader(beatmap_id, mode)
+
+@session_wrapper
+def rebuild_leaders(
+    mode: int,
+    batch_size: int = 5000,
+    session: Session = SessionProvider
+) -> int:
+    """Rebuild the cached #1 scores of a mode from scratch"""
+    # Beatmaps that change while we read the snapshot get replayed afterwards
+    leaders.begin_rebuild(mode)
+
+    try:
+        first_places = session.query(DBScore.beatmap_id, DBScore.user_id, DBScore.id) \
+            .join(DBScore.beatmap) \
+            .filter(DBBeatmap.status > 0) \
+            .filter(DBScore.mode == mode) \
+            .filter(DBScore.status_score == 3) \
+            .filter(DBScore.hidden == False) \
+            .distinct(DBScore.beatmap_id) \
+            .order_by(DBScore.beatmap_id, DBScore.total_score.desc(), DBScore.id.asc()) \
+            .yield_per(batch_size)
+
+        total = leaders.rebuild(mode, first_places, batch_size)
+    finally:
+        changed_beatmaps = leaders.finish_rebuild(mode)
+
+    for beatmap_id in changed_beatmaps:
+        refresh_leader(beatmap_id, mode)
+
+    return total
+
 @session_wrapper
 def fetch_best(
     user_id: int,
@@ -395,6 +594,7 @@ def fetch_personal_best_score(
             .filter(DBScore.mode == mode) \
             .filter(DBScore.status_score == 3) \
             .filter(DBScore.hidden == False) \
+            .order_by(DBScore.total_score.desc(), DBScore.id.asc()) \
             .first()
 
     return session.query(DBScore) \
@@ -404,6 +604,7 @@ def fetch_personal_best_score(
         .filter(or_(DBScore.status_score == 3, DBScore.status_score == 4)) \
         .filter(DBScore.hidden == False) \
         .filter(DBScore.mods == mods) \
+        .order_by(DBScore.total_score.desc(), DBScore.id.asc()) \
         .first()
 
 @session_wrapper
@@ -441,6 +642,12 @@ def fetch_range_scores(
     offset: int = 0,
     session: Session = SessionProvider
 ) -> List[DBScore]:
+    if config.SCOREBOARD_CACHE_ENABLED:
+        return fetch_by_ids_ordered(
+            fetch_scoreboard_range(beatmap_id, mode, offset, limit, session=session),
+            session=session
+        )
+
     return session.query(DBScore) \
         .options(selectinload(DBScore.user)) \
         .filter(DBScore.beatmap_id == beatmap_id) \
@@ -504,6 +711,12 @@ def fetch_range_scores_mods(
     offset: int = 0,
     session: Session = SessionProvider
 ) -> List[DBScore]:
+    if config.SCOREBOARD_CACHE_ENABLED:
+        return fetch_by_ids_ordered(
+            fetch_scoreboard_range(beatmap_id, mode, offset, limit, mods, session=session),
+            session=session
+        )
+
     return session.query(DBScore) \
         .options(selectinload(DBScore.user)) \
         .filter(or_(DBScore.status_score == 3, DBScore.status_score == 4)) \
@@ -526,6 +739,22 @@ def fetch_score_index(
     country: str | None = None,
     session: Session = SessionProvider
 ) -> int:
+    if config.SCOREBOARD_CACHE_ENABLED and friends is None and country is None:
+        personal_best = fetch_personal_best_score(
+            beatmap_id, user_id,
+            mode, mods,
+            session=session
+        )
+
+        if not personal_best:
+            return 0
+
+        return fetch_scoreboard_position(
+            beatmap_id, mode,
+            personal_best.id, mods,
+            session=session
+        )
+
     target_score = aliased(DBScore)
     better_score = aliased(DBScore)
 
@@ -580,6 +809,159 @@ def fetch_score_index(
 
     return result[-1]
 
+@session_wrapper
+def fetch_scoreboard_entries(
+    beatmap_id: int,
+    mode: int,
+    mods: int | None = None,
+    session: Session = SessionProvider
+) -> List[Tuple[int, int]]:
+    """`returns`: List[Tuple[score_id, total_score]] of a full beatmap leaderboard"""
+    query = session.query(DBScore.id, DBScore.total_score) \
+        .filter(DBScore.beatmap_id == beatmap_id) \
+        .filter(DBScore.mode == mode) \
+        .filter(DBScore.hidden == False)
+
+    if mods is None:
+        query = query.filter(DBScore.status_score == 3)
+    else:
+        query = query.filter(or_(DBScore.status_score == 3, DBScore.status_score == 4)) \
+                     .filter(DBScore.mods == mods)
+
+    return [
+        (score_id, total_score) for score_id, total_score in
+        query.order_by(DBScore.total_score.desc(), DBScore.id.asc()).all()
+    ]
+
+def populate_scoreboard(beatmap_id: int, mode: int, mods: int | None = None) -> List[Tuple[int, int]]:
+    """Fill a cached leaderboard with the committed scores of the primary
+
+    Replicas may lag behind the writes that get journaled during the populate,
+    and a scope's session could still contain writes that might be rolled back.
+    """
+    token = scoreboards.begin_populate(beatmap_id, mode, mods)
+
+    with app.session.database.managed_session(autocommit=False) as session:
+        entries = fetch_scoreboard_entries(beatmap_id, mode, mods, session=session)
+
+    scoreboards.populate(beatmap_id, mode, entries, token, mods)
+    return entries
+
+@session_wrapper
+def fetch_scoreboard_range(
+    beatmap_id: int,
+    mode: int,
+    offset: int = 0,
+    limit: int = 5,
+    mods: int | None = None,
+    session: Session = SessionProvider
+) -> List[int]:
+    """Get the score ids of a leaderboard range, populating the cache on a miss"""
+    score_ids = scoreboards.fetch_range(beatmap_id, mode, offset, limit, mods)
+
+    if score_ids is not None:
+        return score_ids
+
+    entries = populate_scoreboard(beatmap_id, mode, mods)
+
+    return [score_id for score_id, total_score in entries[offset:offset + limit]]
+
+@session_wrapper
+def fetch_scoreboard_position(
+    beatmap_id: int,
+    mode: int,
+    score_id: int,
+    mods: int | None = None,
+    session: Session = SessionProvider
+) -> int:
+    """Get the leaderboard position of a score, populating the cache on a miss"""
+    position = scoreboards.fetch_position(beatmap_id, mode, score_id, mods)
+
+    if position is not None:
+        return position
+
+    entries = populate_scoreboard(beatmap_id, mode, mods)
+
+    target_score = next(
+        (total_score for entry_id, total_score in entries if entry_id == score_id),
+        None
+    )
+
+    if target_score is None:
+        return 0
+
+    # Scores with the same total score share a position
+    return sum(1 for _, total_score in entries if total_score > target_score) + 1
+
+@session_wrapper
+def fetch_by_ids_ordered(score_ids: List[int], session: Session = SessionProvider) -> List[DBScore]:
+    if not score_ids:
+        return []
+
+    results = session.query(DBScore) \
+        .options(selectinload(DBScore.user)) \
+        .filter(DBScore.id.in_(score_ids)) \
+        .all()
+
+    positions = {score_id: index for index, score_id in enumerate(score_ids)}
+    return sorted(results, key=lambda score: positions[score.id])
+
+def update_scoreboards(score: DBScore, session: Session) -> None:
+    """Write a score through to the cached beatmap leaderboards, once `session` has been committed"""
+    if not config.SCOREBOARD_CACHE_ENABLED:
+        return
+
+    # Keep a copy, since the score may still change before the commit
+    values = (
+        score.id, score.beatmap_id, score.mode, score.mods,
+        score.total_score, score.status_score, score.hidden
+    )
+    after_commit(session, lambda: write_scoreboards(*values))
+
+def write_scoreboards(
+    score_id: int,
+    beatmap_id: int,
+    mode: int,
+    mods: int,
+    total_score: int,
+    status_score: int,
+    hidden: bool,
+    pipe: Pipeline | None = None
+) -> None:
+    if status_score == 3 and not hidden:
+        scoreboards.add(beatmap_id, mode, score_id, total_score, pipe=pipe)
+    else:
+        scoreboards.remove(beatmap_id, mode, score_id, pipe=pipe)
+
+    if status_score in (3, 4) and not hidden:
+        scoreboards.add(beatmap_id, mode, score_id, total_score, mods, pipe=pipe)
+    else:
+        scoreboards.remove(beatmap_id, mode, score_id, mods, pipe=pipe)
+
+@session_wrapper
+def update_scoreboards_by_user(user_id: int, session: Session = SessionProvider) -> None:
+    user_scores = session.query(
+            DBScore.id,
+            DBScore.beatmap_id,
+            DBScore.mode,
+            DBScore.mods,
+            DBScore.total_score,
+            DBScore.status_score,
+            DBScore.hidden
+        ) \
+        .filter(DBScore.user_id == user_id) \
+        .filter(DBScore.status_score.in_((3, 4))) \
+        .all()
+
+    def write_user_scoreboards() -> None:
+        with app.session.redis.pipeline(transaction=False) as pipe:
+            for score in user_scores:
+                write_scoreboards(*score, pipe=pipe)
+
+            pipe.execute()
+
+    after_commit(session, write_user_scoreboards)
+
 @session_wrapper
 def fetch_score_index_by_id(
     score_id: int,
@@ -845,17 +1227,39 @@ def fetch_clears(
 
 @session_wrapper
 def delete(score_id: int, session: Session = SessionProvider):
+    score = session.query(DBScore.beatmap_id, DBScore.mode, DBScore.mods) \
+        .filter(DBScore.id == score_id) \
+        .first()
+
     session.query(DBScore) \
         .filter(DBScore.id == score_id) \
         .delete()
     session.flush()
 
+    if not score:
+        return
+
+    update_leader(score.beatmap_id, score.mode, session=session)
+
+    if not config.SCOREBOARD_CACHE_ENABLED:
+        return
+
+    def remove_from_scoreboards() -> None:
+        scoreboards.remove(score.beatmap_id, score.mode, score_id)
+        scoreboards.remove(score.beatmap_id, score.mode, score_id, score.mods)
+
+    after_commit(session, remove_from_scoreboards)
+
 @session_wrapper
 def delete_by_beatmap_id(beatmap_id: int, session: Session = SessionProvider):
     session.query(DBScore) \
         .filter(DBScore.beatmap_id == beatmap_id) \
         .delete()
     session.flush()
+    update_leaders_by_beatmap(beatmap_id, session=session)
+
+    if config.SCOREBOARD_CACHE_ENABLED:
+        after_commit(session, lambda: scoreboards.invalidate(beatmap_id))
 
 @session_wrapper
 def restore_hidden_scores(user_id: int, session: Session = SessionProvider):
@@ -863,3 +1267,9 @@ def restore_hidden_scores(user_id: int, session: Session = SessionProvider):
         .filter(DBScore.user_id == user_id) \
         .update({'hidden': False})
     session.flush()
+
+    if config.SCOREBOARD_CACHE_ENABLED:
+        update_scoreboards_by_user(user_id, session=session)
+
+    # Restored scores may take back some first places
+    after_commit(session, lambda: restore_leaders_by_user(user_id))
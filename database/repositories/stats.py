@@ -1,14 +1,16 @@
 
+from app.common.cache import leaderboards
 from app.common.database.objects import (
     DBReplayHistory,
     DBBeatmap,
     DBStats,
-    DBScore
+    DBScore,
+    DBUser
 )
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
+from typing import Iterable, List, Dict
 
 from .wrapper import session_wrapper, SessionProvider
 from . import scores
@@ -79,3 +81,61 @@ def fetch_all(user_id: int, session: Session = SessionProvider) -> List[DBStats]
     return session.query(DBStats) \
         .filter(DBStats.user_id == user_id) \
         .all()
+
+@session_wrapper
+def rebuild_leaderboards(
+    modes: Iterable[int] = range(4),
+    batch_size: int = 10000,
+    session: Session = SessionProvider
+) -> Dict[str, float]:
+    """Stream all stats rows into a full rebuild of the leaderboards"""
+    modes = list(modes)
+    clears = (
+        DBStats.xh_count + DBStats.x_count +
+        DBStats.sh_count + DBStats.s_count +
+        DBStats.a_count + DBStats.b_count +
+        DBStats.c_count + DBStats.d_count
+    )
+
+    rows = session.query(
+            DBStats.user_id,
+            DBStats.mode,
+            DBUser.country,
+            DBStats.pp,
+            DBStats.rscore,
+            DBStats.tscore,
+            DBStats.ppv1,
+            DBStats.acc,
+            clears.label('clears')
+        ) \
+        .join(DBStats.user) \
+        .filter(DBUser.restricted == False) \
+        .filter(DBStats.mode.in_(modes)) \
+        .yield_per(batch_size)
+
+    # Players that change while we read the snapshot get replayed afterwards
+    leaderboards.begin_rebuild()
+
+    try:
+        metrics = leaderboards.rebuild(rows, modes, batch_size)
+    finally:
+        changed_users = leaderboards.finish_rebuild()
+
+    for user_id in changed_users:
+        user = session.query(DBUser.id, DBUser.country, DBUser.restricted) \
+            .filter(DBUser.id == user_id) \
+            .first()
+
+        if not user:
+            continue
+
+        if user.restricted:
+            leaderboards.remove(user.id, user.country)
+            continue
+
+        for user_stats in fetch_all(user.id, session=session):
+            if user_stats.mode in modes:
+                leaderboards.update(user_stats, user.country)
+
+    metrics['replayed'] = len(changed_users)
+    return metrics
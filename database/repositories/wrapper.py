@@ -1,8 +1,13 @@
 
-from sqlalchemy.orm import Session
-from functools import wraps
-from functools import wraps
-from typing import Any
+from app.common.database.scope import current_scope, pin_primary, primary_pinned
+from app.common import profiling
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import inspect
+from functools import wraps, partial
+from typing import Any, Dict, List, Tuple
+
+import asyncio
 
 import app
 
@@ -12,9 +17,21 @@ When @session_wrapper is used, this will guarantee that a session is always prov
 """
 SessionProvider: Any | Session = ...
 
+"""
+Repository functions with these prefixes only read data, and may be routed to a replica.
+"""
+readonly_prefixes = ('fetch_', 'search_')
+
 def session_wrapper(func):
+    readonly = func.__name__.startswith(readonly_prefixes)
+    name = profiling.function_name(func)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
+        with profiling.measure(name):
+            return dispatch(*args, **kwargs)
+
+    def dispatch(*args, **kwargs):
         if kwargs.get('session'):
             # Use existing session
             return func(*args, **kwargs)
@@ -23,13 +40,135 @@ def session_wrapper(func):
             # Use existing session
             return func(*args, **kwargs)
 
-        with app.session.database.managed_session() as session:
+        if (unit := current_scope()) is not None:
+            # Use the session of the surrounding scope
+            unit.statistics.calls += 1
+            kwargs['session'] = unit.session_for(readonly)
+            return func(*args, **kwargs)
+
+        if not readonly:
+            # Reads following this write should be able to see it
+            pin_primary()
+
+        with app.session.database.managed_session(readonly=readonly and not primary_pinned()) as session:
             # Get new session for this function
             kwargs['session'] = session
             return func(*args, **kwargs)
 
     return wrapper
 
+def async_session_wrapper(func, eager: Tuple[str, ...] = ()):
+    """
+    Turns a synchronous repository function into a coroutine, by running it on an AsyncSession through `run_sync`.
+    This allows the async repositories to share their query definitions with the synchronous ones.
+    Sessions are provided by `app.session.database`, which needs to be an `AsyncPostgres` instance.
+
+    Lazy loads can't be awaited once the results leave `run_sync`, so the relationships in
+    `eager` (e.g. "beatmap.beatmapset") get loaded for the returned objects beforehand.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        session = kwargs.pop('session', None)
+
+        if args and isinstance(args[-1], AsyncSession):
+            # Use existing session
+            *args, session = args
+
+        def run(sync_session: Session):
+            result = func(*args, session=sync_session, **kwargs)
+
+            if eager:
+                load_relationships(sync_session, result, eager)
+
+            return result
+
+        if session is not None:
+            # Use existing session
+            return await session.run_sync(run)
+
+        async with app.session.database.managed_async_session() as session:
+            # Get new session for this function
+            return await session.run_sync(run)
+
+    return wrapper
+
+def async_thread_wrapper(func, eager: Tuple[str, ...] = ()):
+    """
+    Turns a synchronous repository function into a coroutine, by running it on the default executor.
+    This is used for repositories that read from redis, which would otherwise block the event loop.
+    The function always runs on its own synchronous session, instead of the session of the caller.
+    """
+    readonly = func.__name__.startswith(readonly_prefixes)
+
+    def run(readonly: bool, *args, **kwargs):
+        with app.session.database.managed_session(readonly=readonly) as session:
+            result = func(*args, session=session, **kwargs)
+
+            if eager:
+                load_relationships(session, result, eager)
+
+            return result
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        kwargs.pop('session', None)
+
+        if args and isinstance(args[-1], AsyncSession):
+            *args, _ = args
+
+        # Executors don't copy the context, so that the
+        # scope of the caller won't be shared across threads
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(run, readonly and not primary_pinned(), *args, **kwargs))
+
+    return wrapper
+
+def load_relationships(session: Session, result: Any, paths: Tuple[str, ...]) -> None:
+    """Load the given relationship paths of all mapped objects inside `result`"""
+    items = result if isinstance(result, list) else [result]
+    objects_by_class: Dict[type, List[Any]] = {}
+
+    for item in items:
+        # Rows can contain mapped objects next to plain columns
+        objects = item if isinstance(item, tuple) else [item]
+
+        for obj in objects:
+            if hasattr(obj, '__mapper__'):
+                objects_by_class.setdefault(type(obj), []).append(obj)
+
+    for model, instances in objects_by_class.items():
+        mapper = inspect(model)
+        options = []
+
+        for path in paths:
+            names = path.split('.')
+
+            if names[0] not in mapper.relationships:
+                continue
+
+            option = selectinload(getattr(model, names[0]))
+            target = mapper.relationships[names[0]].mapper.class_
+
+            for name in names[1:]:
+                option = option.selectinload(getattr(target, name))
+                target = inspect(target).relationships[name].mapper.class_
+
+            options.append(option)
+
+        if not options or len(mapper.primary_key) != 1:
+            continue
+
+        primary_key = getattr(model, mapper.get_property_by_column(mapper.primary_key[0]).key)
+        ids = [mapper.primary_key_from_instance(obj)[0] for obj in instances]
+
+        # The objects are already part of the session, which
+        # is why the loaded state needs to be applied to them
+        session.query(model) \
+            .filter(primary_key.in_(ids)) \
+            .options(*options) \
+            .populate_existing() \
+            .all()
+
 # Please don't look at this mess, thanks :)
 def exception_wrapper(on_fail=None):
     def wrapper(func):
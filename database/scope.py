@@ -0,0 +1,197 @@
+
+from app.common.config import config_instance as config
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy import event
+from contextvars import ContextVar
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Generator, List
+
+import logging
+import time
+import app
+
+@dataclass
+class ScopeStatistics:
+    calls: int = 0
+    queries: int = 0
+    checkouts: int = 0
+    query_time: float = 0.0
+    duration: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+class Scope:
+    """A unit of work, which shares a single session between all repository calls"""
+
+    def __init__(self, autocommit: bool = True) -> None:
+        self.autocommit = autocommit
+        self.statistics = ScopeStatistics()
+        self.started_at = time.perf_counter()
+        self._session: Session | None = None
+        self._replica_session: Session | None = None
+        self.pinned = primary_pinned()
+
+    @property
+    def active(self) -> bool:
+        return self._session is not None
+
+    @property
+    def session(self) -> Session:
+        # The session is only created once it's needed, so
+        # that scopes without any database access stay cheap
+        if self._session is None:
+            self._session = app.session.database.sessionmaker()
+
+        return self._session
+
+    @property
+    def replica_session(self) -> Session:
+        if self._replica_session is None:
+            self._replica_session = app.session.database.readonly_sessionmaker()()
+
+        return self._replica_session
+
+    def session_for(self, readonly: bool) -> Session:
+        """Route reads to a replica, until the first write pins this scope to the primary"""
+        if not readonly:
+            self.pinned = True
+            pin_primary()
+
+        if self.pinned or not app.session.database.replicas:
+            return self.session
+
+        return self.replica_session
+
+    def commit(self) -> None:
+        if self._session is not None:
+            self._session.commit()
+
+    def rollback(self) -> None:
+        if self._session is not None:
+            self._session.rollback()
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+        if self._replica_session is not None:
+            self._replica_session.close()
+            self._replica_session = None
+
+        self.statistics.duration = time.perf_counter() - self.started_at
+
+current: ContextVar[Scope | None] = ContextVar('database_scope', default=None)
+
+def current_scope() -> Scope | None:
+    return current.get()
+
+primary_pin: ContextVar[float] = ContextVar('primary_pin', default=0.0)
+
+def pin_primary() -> None:
+    """Route reads of this thread/task to the primary for a while, so that they can see the latest writes
+
+    Scopes stay pinned until they end, but reads outside of a scope
+    would otherwise hit a replica that may still be lagging behind.
+    """
+    primary_pin.set(time.monotonic() + config.POSTGRES_REPLICA_PIN_DURATION)
+
+def primary_pinned() -> bool:
+    return time.monotonic() < primary_pin.get()
+
+@contextmanager
+def scope(autocommit: bool = True) -> Generator[Scope, None, None]:
+    """Share one session between all repository calls inside of this block
+
+    Nested scopes will re-use the outermost scope, which is also
+    the one that commits or rolls back the transaction in the end.
+    """
+    if (existing := current.get()) is not None:
+        yield existing
+        return
+
+    unit = Scope(autocommit=autocommit)
+    token = current.set(unit)
+
+    try:
+        yield unit
+
+        if autocommit:
+            unit.commit()
+    except Exception as e:
+        if unit.active:
+            app.session.database.log_transaction_failure(e)
+            unit.rollback()
+        raise
+    finally:
+        current.reset(token)
+        unit.close()
+
+# A single worker keeps the callbacks of one transaction in commit order
+callback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='after-commit')
+
+def after_commit(session: Session, callback: Callable[[], Any]) -> None:
+    """Run a callback once the current transaction of `session` has been committed
+
+    Callbacks are dropped when the transaction is rolled back instead, so that
+    caches like redis never see writes that didn't make it into the database.
+    """
+    session.info.setdefault('after_commit', []).append(callback)
+
+@event.listens_for(Session, 'after_commit')
+def run_after_commit(session: Session) -> None:
+    if session.in_nested_transaction():
+        # Savepoints can still be rolled back by the outer transaction
+        return
+
+    callbacks = session.info.pop('after_commit', [])
+
+    if not callbacks:
+        return
+
+    if session.info.get('defer_after_commit'):
+        # Async sessions commit on the event loop, which shouldn't
+        # be blocked by the cache writes inside of these callbacks
+        callback_executor.submit(run_callbacks, callbacks)
+        return
+
+    run_callbacks(callbacks)
+
+def run_callbacks(callbacks: List[Callable[[], Any]]) -> None:
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logging.getLogger('postgres').error(f'Failed to run after-commit callback: {e}', exc_info=e)
+
+@event.listens_for(Session, 'after_transaction_end')
+def discard_after_commit(session: Session, transaction: Any) -> None:
+    if transaction.parent is None:
+        session.info.pop('after_commit', None)
+
+def register_events(engine: Engine) -> None:
+    """Attribute connection checkouts & query timings to the current scope"""
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(*args) -> None:
+        if (unit := current.get()) is not None:
+            unit.statistics.checkouts += 1
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, *args) -> None:
+        # A connection only runs one query at a time, and failed queries
+        # never reach after_cursor_execute, so no stack is kept here
+        conn.info['scope_query_start'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, *args) -> None:
+        start = conn.info.pop('scope_query_start', None)
+
+        if start is None or (unit := current.get()) is None:
+            return
+
+        unit.statistics.queries += 1
+        unit.statistics.query_time += time.perf_counter() - start
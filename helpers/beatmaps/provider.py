@@ -1,11 +1,14 @@
 
+from ...config import config_instance as config
 from ...storage.base import BaseStorage
+from ...helpers import caching
 from ...database.repositories import beatmapsets
 from .resolver import BeatmapResourceProvider
 from .provider_mirror import MirrorResolver
 from .provider_storage import StorageResolver
+from .singleflight import SingleFlight
 
-from typing import Iterator, Tuple
+from typing import Callable, Iterator, Tuple
 from datetime import timedelta
 from redis import Redis
 
@@ -31,20 +34,23 @@ class BeatmapResources:
         }
         self.fallback = self.mirror_resolver
 
+        # Concurrent cache misses of the same resource will share a single fetch
+        self.flights = SingleFlight(
+            redis=cache if config.BEATMAP_RESOURCES_REDIS_LOCK else None,
+            lock_timeout=config.BEATMAP_RESOURCES_LOCK_TIMEOUT
+        )
+
     def osz(self, set_id: int, no_video: bool = False) -> Tuple[Iterator | None, int]:
         """Stream an .osz archive for the given set"""
         return self.resolver_for_set(set_id).osz(set_id, no_video)
 
     def osu(self, beatmap_id: int) -> bytes | None:
         """Return a beatmap (.osu) file"""
-        if (osu := self.cache_get(f'osu:{beatmap_id}')):
-            return osu
-
-        if not (osu := self.resolver_for_beatmap(beatmap_id).osu(beatmap_id)):
-            return None
-
-        self.cache_set(f'osu:{beatmap_id}', osu, timedelta(hours=4))
-        return osu
+        return self.fetch_cached(
+            f'osu:{beatmap_id}',
+            lambda: self.resolver_for_beatmap(beatmap_id).osu(beatmap_id),
+            timedelta(hours=4)
+        )
 
     def cache_beatmap(self, beatmap_id: int) -> None:
         """Populate the .osu cache for a beatmap if not already cached"""
@@ -58,27 +64,36 @@ class BeatmapResources:
 
     def preview(self, set_id: int) -> bytes | None:
         """Return the .mp3 preview for a set"""
-        if (mp3 := self.cache_get(f'mp3:{set_id}')):
-            return mp3
-
-        if not (mp3 := self.resolver_for_set(set_id).preview(set_id)):
-            return None
-
-        self.cache_set(f'mp3:{set_id}', mp3, timedelta(hours=6))
-        return mp3
+        return self.fetch_cached(
+            f'mp3:{set_id}',
+            lambda: self.resolver_for_set(set_id).preview(set_id),
+            timedelta(hours=6)
+        )
 
     def background(self, set_id: int, large: bool = False) -> bytes | None:
         """Return the thumbnail image for a set"""
-        key = f'mt:{set_id}l' if large else f'mt:{set_id}'
+        return self.fetch_cached(
+            f'mt:{set_id}l' if large else f'mt:{set_id}',
+            lambda: self.resolver_for_set(set_id).background(set_id, large),
+            timedelta(hours=12)
+        )
 
-        if (image := self.cache_get(key)):
-            return image
+    def fetch_cached(self, key: str, fetch: Callable[[], bytes | None], expiry: timedelta) -> bytes | None:
+        """Get a resource from the cache, or fetch it once for all concurrent callers"""
+        if (content := self.cache_get(key)):
+            return content
 
-        if not (image := self.resolver_for_set(set_id).background(set_id, large)):
-            return None
+        def fetch_and_cache() -> bytes | None:
+            if not (content := fetch()):
+                return None
+
+            self.cache_set(key, content, expiry)
+            return content
 
-        self.cache_set(key, image, timedelta(hours=12))
-        return image
+        return self.flights.do(
+            key, fetch_and_cache,
+            check=lambda: self.cache_get(key)
+        )
 
     def resolver_for_server(self, server: int) -> BeatmapResourceProvider:
         return self.resolvers.get(server, self.fallback)
@@ -94,9 +109,31 @@ class BeatmapResources:
         )
 
     def cache_get(self, name: str) -> bytes | None:
-        return self.cache.get(name)
+        local_cache = self.local_cache_for(name)
+
+        if local_cache and (content := local_cache.get(name)) is not None:
+            return content
+
+        content = self.cache.get(name)
+
+        if local_cache and content:
+            local_cache.set(name, content)
+
+        return content
 
     def cache_set(self, name: str, content: bytes, expiry: timedelta) -> None:
         if len(content) > 40_000_000: # 40MB
             return
         self.cache.set(name, content, expiry)
+
+        if local_cache := self.local_cache_for(name):
+            local_cache.set(name, content)
+
+    def local_cache_for(self, name: str) -> caching.BlobCache | None:
+        if not (local_cache := caching.local_blob_cache(self.cache)):
+            return None
+
+        if not local_cache.handles(name):
+            return None
+
+        return local_cache
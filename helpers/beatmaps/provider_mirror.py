@@ -4,25 +4,67 @@ from app.common.database.objects import DBResourceMirror
 from app.common.config import config_instance as config
 from .resolver import BeatmapResourceProvider
 
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from typing import Iterator, List, Any, Tuple
 from requests.exceptions import ConnectionError
 from requests.adapters import HTTPAdapter
 from requests import Session, Response
 from urllib3.util.retry import Retry
 from urllib.parse import urlparse
+from threading import local
 from redis import Redis
 
 import logging
 
+# Updates the moving average of a mirror's response time in one step, since
+# concurrent requests to the same mirror would otherwise overwrite their samples
+# KEYS: latency hash; ARGV: mirror url, latency sample, smoothing factor
+LATENCY_SCRIPT = """
+local latency = tonumber(ARGV[2])
+local previous = redis.call('HGET', KEYS[1], ARGV[1])
+
+if previous then
+    previous = tonumber(previous)
+    latency = previous + tonumber(ARGV[3]) * (latency - previous)
+end
+
+redis.call('HSET', KEYS[1], ARGV[1], tostring(latency))
+"""
+
 class MirrorResolver(BeatmapResourceProvider):
     """Resolves beatmap resources from external mirrors over HTTP"""
 
+    # Weight of new samples for the average response time of a mirror
+    latency_smoothing = 0.2
+
+    # Response time that gets recorded for failed requests
+    latency_penalty = 10.0
+
     def __init__(self, cache: Redis) -> None:
         self.logger = logging.getLogger('beatmap-mirror')
         self.id_offset = 1000000000
 
-        self.session = self.create_session()
+        self.sessions = local()
         self.cache = cache
+        self.latency_script = cache.register_script(LATENCY_SCRIPT)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=8,
+            thread_name_prefix='mirror-hedging'
+        )
+
+    @property
+    def session(self) -> Session:
+        # Sessions aren't thread-safe, and hedged requests run on
+        # multiple threads, which is why every thread gets its own
+        if (session := getattr(self.sessions, 'session', None)) is None:
+            session = self.sessions.session = self.create_session()
+
+        return session
+
+    @session.setter
+    def session(self, session: Session) -> None:
+        self.sessions.session = session
 
     def create_session(self) -> Session:
         session = Session()
@@ -60,6 +102,14 @@ class MirrorResolver(BeatmapResourceProvider):
             self.logger.warning(f'Daily limit reached on "{mirror.url}", available again in {daily_reset} seconds.')
             self.set_ratelimit(mirror.url, daily_reset)
 
+        if response.ok:
+            self.record_latency(mirror.url, response.elapsed.total_seconds())
+
+        elif response.status_code >= 500:
+            # Server & connection errors, while e.g. a 404 just means
+            # that the mirror doesn't have this specific resource
+            self.record_latency(mirror.url, self.latency_penalty)
+
         if response.status_code == 429:
             retry = self.resolve_header(response, 'Retry-After', 120, cast=int)
             self.logger.warning(f'Rate limited on "{mirror.url}", available again in {retry} seconds.')
@@ -141,7 +191,109 @@ class MirrorResolver(BeatmapResourceProvider):
             next_index, ex=60
         )
 
-        return mirrors[mirror_index:] + mirrors[:mirror_index]
+        return self.order_by_latency(
+            mirrors[mirror_index:] + mirrors[:mirror_index]
+        )
+
+    def order_by_latency(self, mirrors: List[DBResourceMirror]) -> List[DBResourceMirror]:
+        if not config.MIRROR_LATENCY_ORDERING:
+            return mirrors
+
+        latencies = {
+            url.decode(): float(latency)
+            for url, latency in self.cache.hgetall('mirrors:latency').items()
+        }
+
+        # Mirrors without any samples will be tried first, so that they get some
+        return sorted(mirrors, key=lambda mirror: latencies.get(mirror.url, 0.0))
+
+    def record_latency(self, url: str, latency: float) -> None:
+        self.latency_script(
+            keys=['mirrors:latency'],
+            args=[url, latency, self.latency_smoothing]
+        )
+
+    def request_mirrors(
+        self,
+        mirrors: List[DBResourceMirror],
+        id: int,
+        require_content: bool = False
+    ) -> Response | None:
+        """Request a resource from the first mirror that responds successfully"""
+        if not config.MIRROR_HEDGING_ENABLED or len(mirrors) <= 1:
+            for mirror in mirrors:
+                if response := self.request_mirror(mirror, id, require_content):
+                    return response
+
+            return None
+
+        return self.request_hedged(mirrors, id, require_content)
+
+    def request_hedged(
+        self,
+        mirrors: List[DBResourceMirror],
+        id: int,
+        require_content: bool = False
+    ) -> Response | None:
+        """Start requesting the next mirror, whenever the previous ones are too slow or have failed"""
+        remaining = list(mirrors)
+        pending: set[Future] = set()
+        winner: Response | None = None
+
+        while winner is None and (remaining or pending):
+            if remaining:
+                mirror = remaining.pop(0)
+                pending.add(self.executor.submit(self.request_mirror, mirror, id, require_content))
+
+            done, pending = wait(
+                pending,
+                timeout=config.MIRROR_HEDGING_DELAY if remaining else None,
+                return_when=FIRST_COMPLETED
+            )
+
+            for future in done:
+                if not (response := future.result()):
+                    continue
+
+                if winner is None:
+                    winner = response
+                    continue
+
+                response.close()
+
+        for future in pending:
+            # Requests that are still running will be closed once they finish
+            future.cancel()
+            future.add_done_callback(self.close_response)
+
+        return winner
+
+    def request_mirror(
+        self,
+        mirror: DBResourceMirror,
+        id: int,
+        require_content: bool = False
+    ) -> Response | None:
+        response = self.perform_mirror_request(
+            self.format_mirror_url(mirror.url, id),
+            mirror=mirror
+        )
+
+        if not response:
+            return None
+
+        if require_content and not response.content:
+            return None
+
+        return response
+
+    @staticmethod
+    def close_response(future: Future) -> None:
+        if future.cancelled():
+            return
+
+        if response := future.result():
+            response.close()
 
     def osz_response(self, set_id: int, no_video: bool = False) -> Response | None:
         self.logger.debug(f'Downloading osz... ({set_id})')
@@ -154,18 +306,7 @@ class MirrorResolver(BeatmapResourceProvider):
         if not mirrors:
             return None
 
-        for mirror in mirrors:
-            response = self.perform_mirror_request(
-                self.format_mirror_url(mirror.url, set_id),
-                mirror=mirror
-            )
-
-            if not response:
-                continue
-
-            return response
-
-        return None
+        return self.request_mirrors(mirrors, set_id)
 
     def osz(self, set_id: int, no_video: bool = False) -> Tuple[Iterator | None, int]:
         if not (response := self.osz_response(set_id, no_video)):
@@ -179,23 +320,14 @@ class MirrorResolver(BeatmapResourceProvider):
     def osu(self, beatmap_id: int) -> bytes | None:
         self.logger.debug(f'Downloading beatmap... ({beatmap_id})')
 
-        mirrors = resources.fetch_by_type_all(2)
-
-        for mirror in mirrors:
-            response = self.perform_mirror_request(
-                self.format_mirror_url(mirror.url, beatmap_id),
-                mirror=mirror
-            )
-
-            if not response:
-                continue
-
-            if not response.content:
-                continue
+        mirrors = self.order_by_latency(
+            resources.fetch_by_type_all(2)
+        )
 
-            return response.content
+        if not (response := self.request_mirrors(mirrors, beatmap_id, require_content=True)):
+            return None
 
-        return None
+        return response.content
 
     def preview(self, set_id: int) -> bytes | None:
         self.logger.debug(f'Downloading preview... ({set_id})')
@@ -205,18 +337,10 @@ class MirrorResolver(BeatmapResourceProvider):
             server=self.determine_server(set_id)
         )
 
-        for mirror in mirrors:
-            response = self.perform_mirror_request(
-                self.format_mirror_url(mirror.url, set_id),
-                mirror=mirror
-            )
-
-            if not response:
-                continue
-
-            return response.content
+        if not (response := self.request_mirrors(mirrors, set_id, require_content=True)):
+            return None
 
-        return None
+        return response.content
 
     def background(self, set_id: int, large: bool = False) -> bytes | None:
         self.logger.debug(f'Downloading background... ({set_id})')
@@ -226,18 +350,10 @@ class MirrorResolver(BeatmapResourceProvider):
             server=self.determine_server(set_id)
         )
 
-        for mirror in mirrors:
-            response = self.perform_mirror_request(
-                self.format_mirror_url(mirror.url, set_id),
-                mirror=mirror
-            )
-
-            if not response:
-                continue
-
-            return response.content
+        if not (response := self.request_mirrors(mirrors, set_id, require_content=True)):
+            return None
 
-        return None
+        return response.content
 
     @staticmethod
     def resolve_header(
@@ -28,11 +28,25 @@ class StorageResolver(BeatmapResourceProvider):
                 self.storage.get_osz_size(set_id) or 0
             )
 
+        # Serve the pre-built variant, if it was already created
+        if self.storage.config.OSZ_NOVIDEO_VARIANTS_ENABLED:
+            if (info := self.storage.get_osz_novideo_info(set_id)):
+                return (
+                    self.storage.get_osz_novideo_iterable(set_id, chunk_size=1024*256),
+                    info.size
+                )
+
         # Stream directly from storage instead of loading the whole osz into memory
         if not (osz := self.storage.get_osz_io(set_id)):
             return None, 0
 
-        iterator = NoVideoZipIterator(osz, chunk_size=1024*256)
+        # Copy entries as-is when the archive supports it, else rebuild it
+        manifest = self.storage.get_osz_manifest(set_id, osz)
+        iterator = NoVideoZipIterator(
+            osz, chunk_size=1024*256,
+            manifest=manifest,
+            raw=manifest is not None
+        )
         return iterator, len(iterator)
 
     def osu(self, beatmap_id: int) -> bytes | None:
@@ -0,0 +1,160 @@
+
+from typing import Callable, Generic, TypeVar
+from threading import Event, Lock
+from redis import Redis
+
+import logging
+import time
+
+T = TypeVar('T')
+
+class Flight(Generic[T]):
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: T | None = None
+        self.error: Exception | None = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent fetches of the same resource into a single one
+
+    Callers inside of this process wait for the result of the first caller,
+    and fetch the resource themselves if that takes longer than `wait_timeout`.
+    If a redis client is given, a short-lived lock will also make callers in
+    other processes wait for the fetch, by polling the cache with `check`.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        lock_timeout: float = 30,
+        wait_timeout: float = 10,
+        poll_interval: float = 0.05
+    ) -> None:
+        self.logger = logging.getLogger('singleflight')
+        self.redis = redis
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.flights: dict[str, Flight] = {}
+        self.lock = Lock()
+        self.metrics = {
+            'fetches': 0,
+            'coalesced': 0,
+            'remote_waits': 0,
+            'remote_timeouts': 0,
+            'local_timeouts': 0,
+            'wait_time': 0.0
+        }
+
+    def do(self, key: str, fetch: Callable[[], T], check: Callable[[], T | None] | None = None) -> T | None:
+        with self.lock:
+            if (flight := self.flights.get(key)) is not None:
+                flight.waiters += 1
+                self.metrics['coalesced'] += 1
+                leader = False
+            else:
+                flight = self.flights[key] = Flight()
+                leader = True
+
+        if not leader:
+            return self.wait(key, flight, fetch)
+
+        try:
+            flight.result = self.fetch(key, fetch, check)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+
+            flight.done.set()
+
+    def wait(self, key: str, flight: Flight[T], fetch: Callable[[], T]) -> T | None:
+        start = time.perf_counter()
+        finished = flight.done.wait(self.wait_timeout)
+        self.record_wait(time.perf_counter() - start)
+
+        if not finished:
+            # The leader is stuck, e.g. on a slow mirror
+            self.logger.warning(f'Timed out while waiting for "{key}" to be fetched')
+
+            with self.lock:
+                self.metrics['local_timeouts'] += 1
+
+            return self.run(fetch)
+
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.result
+
+    def fetch(self, key: str, fetch: Callable[[], T], check: Callable[[], T | None] | None) -> T | None:
+        if self.redis is None or check is None:
+            return self.run(fetch)
+
+        lock = self.redis.lock(
+            f'singleflight:{key}',
+            timeout=self.lock_timeout,
+            blocking=False
+        )
+
+        if lock.acquire():
+            try:
+                return self.run(fetch)
+            finally:
+                try:
+                    lock.release()
+                except Exception:
+                    # Lock has expired in the meantime
+                    pass
+
+        # Another process is already fetching this resource
+        if (result := self.wait_remote(key, check)) is not None:
+            return result
+
+        return self.run(fetch)
+
+    def wait_remote(self, key: str, check: Callable[[], T | None]) -> T | None:
+        start = time.perf_counter()
+        deadline = start + self.wait_timeout
+
+        with self.lock:
+            self.metrics['remote_waits'] += 1
+
+        try:
+            while time.perf_counter() < deadline:
+                if (result := check()) is not None:
+                    return result
+
+                if not self.redis.exists(f'singleflight:{key}'):
+                    # The fetch has finished, but didn't produce anything we can use
+                    return check()
+
+                time.sleep(self.poll_interval)
+
+            self.logger.warning(f'Timed out while waiting for "{key}" to be fetched')
+
+            with self.lock:
+                self.metrics['remote_timeouts'] += 1
+        finally:
+            self.record_wait(time.perf_counter() - start)
+
+    def run(self, fetch: Callable[[], T]) -> T | None:
+        with self.lock:
+            self.metrics['fetches'] += 1
+
+        return fetch()
+
+    def record_wait(self, elapsed: float) -> None:
+        with self.lock:
+            self.metrics['wait_time'] += elapsed
+
+    def statistics(self) -> dict:
+        with self.lock:
+            return {
+                **self.metrics,
+                'in_flight': len(self.flights)
+            }
@@ -1,8 +1,15 @@
 # type: ignore
 
+from app.common.config import config_instance as config
 from datetime import timedelta, datetime
 from functools import lru_cache, wraps
-from typing import Callable
+from collections import OrderedDict
+from typing import Callable, Hashable, Any
+from threading import Lock
+from redis import Redis
+
+import zlib
+import time
 
 def ttl_cache(maxsize: int = 128, typed: bool = False, ttl: int = -1):
     ttl = 0x10000 if ttl <= 0 else ttl
@@ -31,3 +38,162 @@ def ttl_cache(maxsize: int = 128, typed: bool = False, ttl: int = -1):
         wrapped_func.cache_clear = cache_clear
         return wrapped_func
     return wrapper
+
+class SizedLRUCache:
+    """A thread-safe LRU cache, which evicts entries based on their size instead of their count"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.lock = Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        with self.lock:
+            if (entry := self.entries.get(key)) is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.max_size:
+            # This would evict everything else
+            return
+
+        with self.lock:
+            if (previous := self.entries.pop(key, None)) is not None:
+                self.size -= previous[1]
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self.lock:
+            if (entry := self.entries.pop(key, None)) is not None:
+                self.size -= entry[1]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def statistics(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+class BlobCache:
+    """A local tier for blobs inside of redis, e.g. beatmap files
+
+    Entries expire after `ttl` seconds, and get removed in every process
+    that is subscribed to the invalidation channel once they are replaced.
+    """
+
+    channel = 'blob-cache:invalidate'
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: int,
+        compression: bool = False,
+        prefixes: tuple[str, ...] = ('osu:',)
+    ) -> None:
+        self.entries = SizedLRUCache(max_size)
+        self.compression = compression
+        self.prefixes = prefixes
+        self.ttl = ttl
+        self.subscription = None
+        self.lock = Lock()
+
+    def handles(self, key: str) -> bool:
+        return key.startswith(self.prefixes)
+
+    def get(self, key: str) -> bytes | None:
+        if (entry := self.entries.get(key)) is None:
+            return None
+
+        expires_at, compressed, content = entry
+
+        if time.monotonic() > expires_at:
+            self.entries.delete(key)
+            return None
+
+        return zlib.decompress(content) if compressed else content
+
+    def set(self, key: str, content: bytes) -> None:
+        compressed = self.compression
+
+        if compressed:
+            content = zlib.compress(content, level=1)
+
+        self.entries.set(
+            key,
+            (time.monotonic() + self.ttl, compressed, content),
+            len(content)
+        )
+
+    def delete(self, key: str) -> None:
+        self.entries.delete(key)
+
+    def invalidate(self, redis: Redis, key: str) -> None:
+        """Remove an entry in this & all other subscribed processes"""
+        self.delete(key)
+        redis.publish(self.channel, key)
+
+    def subscribe(self, redis: Redis) -> None:
+        """Listen for invalidations from other processes, if not done already"""
+        with self.lock:
+            if self.subscription is not None:
+                return
+
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self.on_invalidation})
+            self.subscription = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def on_invalidation(self, message: dict) -> None:
+        key = message['data']
+
+        if isinstance(key, bytes):
+            key = key.decode()
+
+        self.delete(key)
+
+blob_cache: BlobCache | None = None
+blob_cache_lock = Lock()
+
+def local_blob_cache(redis: Redis) -> BlobCache | None:
+    """Get the shared blob cache of this process, if enabled"""
+    global blob_cache
+
+    if not config.LOCAL_BLOB_CACHE_ENABLED:
+        return None
+
+    with blob_cache_lock:
+        if blob_cache is None:
+            blob_cache = BlobCache(
+                config.LOCAL_BLOB_CACHE_SIZE,
+                config.LOCAL_BLOB_CACHE_TTL,
+                config.LOCAL_BLOB_CACHE_COMPRESSION
+            )
+
+    blob_cache.subscribe(redis)
+    return blob_cache
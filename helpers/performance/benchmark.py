@@ -0,0 +1,340 @@
+
+from app.common.database.objects import DBScore
+from app.common.constants import GameMode, Mods
+from importlib import metadata
+from typing import Callable, Dict, List, Tuple
+from datetime import datetime
+from statistics import mean
+
+from .ppv2_base import PerformanceCalculator, LocalBeatmapResources
+
+import multiprocessing
+import importlib
+import argparse
+import platform
+import resource
+import logging
+import json
+import time
+import sys
+import os
+
+# Reproducible benchmark of the ppv2 backends, which can be run with:
+#   python -m app.common.helpers.performance.benchmark <corpus> -o results.json
+# Every backend runs inside of its own process, so that their peak memory usage
+# can be compared. Scores are generated synthetically for every beatmap, mode,
+# mod combination and accuracy variant, so two runs over the same corpus match.
+
+MOD_COMBINATIONS = ('NM', 'HD', 'HR', 'DT', 'HDHR', 'HDDT', 'EZ', 'HT', 'FL')
+
+# name: (100s ratio, 50s ratio, misses)
+SCORE_VARIANTS = {
+    'ss': (0.0, 0.0, 0),
+    'fc': (0.02, 0.0, 0),
+    'choke': (0.04, 0.01, 3)
+}
+
+BACKENDS = {
+    'rosu': ('ppv2_rosu', 'RosuPerformanceCalculator', 'rosu-pp-py'),
+    'native': ('ppv2_native', 'NativePerformanceCalculator', 'osu-native-py')
+}
+
+class Fixture:
+    def __init__(self, key: str, beatmap_id: int, mode: GameMode, mods: Mods, score: DBScore) -> None:
+        self.key = key
+        self.beatmap_id = beatmap_id
+        self.mode = mode
+        self.mods = mods
+        self.score = score
+
+def load_corpus(path: str) -> Dict[str, bytes]:
+    """Load all .osu files of a directory, sorted by their name"""
+    files = sorted(
+        filename for filename in os.listdir(path)
+        if filename.endswith('.osu')
+    )
+
+    corpus = {}
+
+    for filename in files:
+        with open(os.path.join(path, filename), 'rb') as file:
+            corpus[filename] = file.read()
+
+    return corpus
+
+def parse_beatmap_info(beatmap_file: bytes) -> Tuple[GameMode, int]:
+    """Get the mode & amount of hit objects of a beatmap, without any pp library"""
+    mode = GameMode.Osu
+    objects = 0
+    section = None
+
+    for line in beatmap_file.decode('utf-8-sig', errors='replace').splitlines():
+        line = line.strip()
+
+        if line.startswith('[') and line.endswith(']'):
+            section = line[1:-1]
+            continue
+
+        if section == 'General' and line.startswith('Mode:'):
+            mode = GameMode(int(line.split(':', 1)[1]))
+
+        elif section == 'HitObjects' and line:
+            objects += 1
+
+    return mode, objects
+
+def create_fixtures(corpus: Dict[str, bytes]) -> List[Fixture]:
+    fixtures = []
+
+    for beatmap_id, (filename, beatmap_file) in enumerate(corpus.items(), start=1):
+        beatmap_mode, objects = parse_beatmap_info(beatmap_file)
+
+        if objects <= 0:
+            continue
+
+        # osu! beatmaps can be converted into every other mode
+        modes = list(GameMode) if beatmap_mode == GameMode.Osu else [beatmap_mode]
+
+        for mode in modes:
+            for mod_string in MOD_COMBINATIONS:
+                mods = Mods.from_string(mod_string)
+
+                for variant, (ratio_100, ratio_50, misses) in SCORE_VARIANTS.items():
+                    n100 = int(objects * ratio_100)
+                    n50 = int(objects * ratio_50)
+                    n300 = max(0, objects - n100 - n50 - misses)
+
+                    score = DBScore(
+                        id=len(fixtures) + 1,
+                        beatmap_id=beatmap_id,
+                        mode=int(mode),
+                        mods=int(mods),
+                        client_version=20240000,
+                        touchscreen=False,
+                        perfect=misses == 0,
+                        n300=n300,
+                        n100=n100,
+                        n50=n50,
+                        nMiss=misses,
+                        nGeki=0,
+                        nKatu=0,
+                        # The max combo gets capped by the backends
+                        max_combo=objects * 10 if misses == 0 else objects // (misses + 1),
+                        total_score=0,
+                        failtime=None,
+                        acc=None
+                    )
+
+                    fixtures.append(Fixture(
+                        f'{filename}:{mode.name}:{mod_string}:{variant}',
+                        beatmap_id, mode, mods, score
+                    ))
+
+    return fixtures
+
+def summarize(timings: List[float]) -> dict:
+    if not timings:
+        return {}
+
+    ordered = sorted(timings)
+
+    return {
+        'total': sum(ordered),
+        'mean': mean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1]
+    }
+
+def measure(function: Callable, timings: List[float]):
+    start = time.perf_counter()
+    result = function()
+    timings.append(time.perf_counter() - start)
+    return result
+
+def run_backend(name: str, corpus_path: str, repeat: int) -> dict:
+    """Benchmark a single backend, meant to be run inside of its own process"""
+    module_name, class_name, package = BACKENDS[name]
+    module = importlib.import_module(f'{__package__}.{module_name}')
+    calculator_class = getattr(module, class_name)
+
+    corpus = load_corpus(corpus_path)
+    fixtures = create_fixtures(corpus)
+    files = {beatmap_id: beatmap_file for beatmap_id, beatmap_file in enumerate(corpus.values(), start=1)}
+
+    resources = LocalBeatmapResources()
+    resources.files = files
+    calculator: PerformanceCalculator = calculator_class(resources)
+
+    timings = {'parse': [], 'difficulty': [], 'performance': [], 'total': []}
+    results: Dict[str, float | None] = {}
+    failures = 0
+
+    for _ in range(repeat):
+        for fixture in fixtures:
+            beatmap_file = files[fixture.beatmap_id]
+            measure_stages(name, module, calculator, fixture, beatmap_file, timings)
+
+            # The parsed beatmaps of the rosu backend would otherwise turn
+            # the end-to-end timing into a measurement of cache hits
+            if (cache := getattr(calculator, 'beatmap_cache', None)) is not None:
+                cache.clear()
+
+            pp = measure(lambda: calculator.calculate_ppv2(fixture.score), timings['total'])
+            failures += pp is None
+            results[fixture.key] = pp
+
+    elapsed = sum(timings['total'])
+
+    return {
+        'version': package_version(package),
+        'scores': len(fixtures) * repeat,
+        'failures': failures,
+        'throughput': len(timings['total']) / elapsed if elapsed > 0 else 0,
+        # ru_maxrss is reported in kilobytes on linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'timings': {stage: summarize(values) for stage, values in timings.items()},
+        'pp': results
+    }
+
+def measure_stages(
+    name: str,
+    module,
+    calculator: PerformanceCalculator,
+    fixture: Fixture,
+    beatmap_file: bytes,
+    timings: Dict[str, List[float]]
+) -> None:
+    """Time the parse, difficulty & performance stages of a backend separately"""
+    mods = calculator.adjust_mods(fixture.mods, fixture.mode)
+
+    if name == 'rosu':
+        mode = calculator.convert_to_rosu_mode(fixture.mode)
+        performance = calculator.create_performance(fixture.score, mods)
+
+        def parse():
+            beatmap = module.RosuBeatmap(bytes=beatmap_file)
+            beatmap.convert(mode, mods.value)
+            return beatmap
+
+        beatmap = measure(parse, timings['parse'])
+        difficulty = measure(lambda: performance.difficulty().calculate(beatmap), timings['difficulty'])
+        measure(lambda: performance.calculate(difficulty), timings['performance'])
+        return
+
+    ruleset = calculator.convert_to_native_ruleset(fixture.mode)
+    native_mods = calculator.convert_to_native_mods(mods)
+    beatmap = measure(lambda: calculator.load_native_beatmap(beatmap_file), timings['parse'])
+
+    if not beatmap:
+        return
+
+    try:
+        difficulty = measure(
+            lambda: module.create_difficulty_calculator(ruleset, beatmap).calculate(native_mods),
+            timings['difficulty']
+        )
+        measure(
+            lambda: module.create_performance_calculator(ruleset).calculate(
+                ruleset, beatmap, native_mods,
+                calculator.convert_to_score_info(fixture.score),
+                difficulty
+            ),
+            timings['performance']
+        )
+    except Exception as e:
+        calculator.logger.warning(f'Stage benchmark failed for {fixture.key}: {e}')
+    finally:
+        calculator.close_native_objects(beatmap, ruleset)
+
+def compare(results: Dict[str, dict]) -> Dict[str, dict]:
+    """Compare the pp values of every pair of backends"""
+    names = sorted(results)
+    deltas = {}
+
+    for index, first in enumerate(names):
+        for second in names[index + 1:]:
+            differences = []
+
+            for key, pp in results[first]['pp'].items():
+                other = results[second]['pp'].get(key)
+
+                if pp is None or other is None:
+                    continue
+
+                differences.append((key, other - pp, (other - pp) / pp if pp else 0.0))
+
+            if not differences:
+                continue
+
+            differences.sort(key=lambda entry: abs(entry[1]), reverse=True)
+
+            deltas[f'{first}:{second}'] = {
+                'compared': len(differences),
+                'mean_absolute': mean(abs(delta) for _, delta, _ in differences),
+                'mean_relative': mean(abs(relative) for _, _, relative in differences),
+                'max_absolute': abs(differences[0][1]),
+                'largest': [
+                    {'key': key, 'delta': delta, 'relative': relative}
+                    for key, delta, relative in differences[:25]
+                ]
+            }
+
+    return deltas
+
+def package_version(package: str) -> str | None:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+def run(corpus_path: str, backends: List[str], repeat: int = 1, include_pp: bool = False) -> dict:
+    context = multiprocessing.get_context('spawn')
+    results = {}
+
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in backends:
+            try:
+                results[name] = pool.apply(run_backend, (name, corpus_path, repeat))
+            except ImportError as e:
+                logging.getLogger('performance').warning(f'Skipping backend "{name}": {e}')
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'corpus': os.path.abspath(corpus_path),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'repeat': repeat
+        },
+        'deltas': compare(results),
+        'backends': results
+    }
+
+    if not include_pp:
+        for result in results.values():
+            result.pop('pp')
+
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the ppv2 backends')
+    parser.add_argument('corpus', help='Directory with .osu files')
+    parser.add_argument('-o', '--output', help='Path of the JSON report, defaults to stdout')
+    parser.add_argument('-b', '--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('-r', '--repeat', type=int, default=1)
+    parser.add_argument('--include-pp', action='store_true', help='Include the pp of every fixture in the report')
+    args = parser.parse_args()
+
+    report = run(args.corpus, args.backends, args.repeat, args.include_pp)
+    output = json.dumps(report, indent=4)
+
+    if not args.output:
+        print(output)
+        return
+
+    with open(args.output, 'w') as file:
+        file.write(output)
+
+if __name__ == '__main__':
+    main()
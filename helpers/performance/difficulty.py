@@ -0,0 +1,121 @@
+
+from app.common.helpers.performance.ppv2_base import PerformanceCalculator, DifficultyAttributes
+from app.common.config import config_instance as config
+from app.common.helpers.caching import SizedLRUCache
+from app.common.constants import GameMode, Mods
+from dataclasses import asdict, replace
+from hashlib import md5
+
+import json
+import app
+
+# Difficulty attributes are cached in two tiers:
+#   1. An in-process LRU, keyed by (file checksum, mode, mods)
+#   2. Redis hashes with "{mode}:{mods}" as their fields:
+#        difficulty:{checksum}             -> Calculated from a beatmap file
+#        difficulty:beatmap:{beatmap_id}   -> Calculated from a beatmap id, removed on re-upload
+# Beatmap ids can point to a different file after a re-upload, which
+# is why those entries are only kept inside of redis.
+# Only the mods that affect difficulty are part of the key, see `canonical_mods`.
+# Calculators still receive the mods of the caller unchanged.
+
+memory_cache = SizedLRUCache(config.PPV2_DIFFICULTY_CACHE_SIZE)
+
+def canonical_mods(mods: int) -> Mods:
+    """Reduce mods to the ones that affect difficulty, which are only used for the cache key
+
+    NoVideo is kept, since the calculators treat that bit as TouchDevice.
+    """
+    mods = Mods(mods)
+
+    if Mods.Nightcore in mods:
+        # NC only ever appears with DT enabled at the same time
+        mods |= Mods.DoubleTime
+
+    return mods & Mods.DifficultyMods
+
+def encode(attributes: DifficultyAttributes) -> str:
+    data = asdict(attributes)
+    data['mode'] = int(attributes.mode)
+    data['mods'] = int(attributes.mods)
+    return json.dumps(data)
+
+def decode(data: bytes) -> DifficultyAttributes:
+    attributes = json.loads(data)
+    attributes['mode'] = GameMode(attributes['mode'])
+    attributes['mods'] = Mods(attributes['mods'])
+    return DifficultyAttributes(**attributes)
+
+def fetch(
+    key: str,
+    mode: GameMode | int,
+    mods: Mods,
+    in_memory: bool = True
+) -> DifficultyAttributes | None:
+    field = f'{int(mode)}:{int(mods)}'
+
+    if in_memory and (attributes := memory_cache.get((key, field))) is not None:
+        return attributes
+
+    if not (data := app.session.redis.hget(key, field)):
+        return None
+
+    attributes = decode(data)
+
+    if in_memory:
+        memory_cache.set((key, field), attributes, 1)
+
+    return attributes
+
+def store(
+    key: str,
+    mode: GameMode | int,
+    mods: Mods,
+    attributes: DifficultyAttributes,
+    in_memory: bool = True
+) -> None:
+    field = f'{int(mode)}:{int(mods)}'
+
+    if in_memory:
+        memory_cache.set((key, field), attributes, 1)
+
+    with app.session.redis.pipeline() as pipe:
+        pipe.hset(key, field, encode(attributes))
+        pipe.expire(key, config.PPV2_DIFFICULTY_CACHE_TTL)
+        pipe.execute()
+
+def calculate_difficulty(
+    calculator: PerformanceCalculator,
+    beatmap_file: bytes,
+    mode: GameMode,
+    mods: int
+) -> DifficultyAttributes | None:
+    key = f'difficulty:{md5(beatmap_file).hexdigest()}'
+    key_mods = canonical_mods(mods)
+
+    if (attributes := fetch(key, mode, key_mods)) is not None:
+        return replace(attributes, mods=Mods(mods))
+
+    if (attributes := calculator.calculate_difficulty(beatmap_file, mode, mods)) is None:
+        return None
+
+    store(key, mode, key_mods, attributes)
+    return attributes
+
+def calculate_difficulty_from_id(
+    calculator: PerformanceCalculator,
+    beatmap_id: int,
+    mode: GameMode,
+    mods: int
+) -> DifficultyAttributes | None:
+    key = f'difficulty:beatmap:{beatmap_id}'
+    key_mods = canonical_mods(mods)
+
+    if (attributes := fetch(key, mode, key_mods, in_memory=False)) is not None:
+        return replace(attributes, mods=Mods(mods))
+
+    if (attributes := calculator.calculate_difficulty_from_id(beatmap_id, mode, mods)) is None:
+        return None
+
+    store(key, mode, key_mods, attributes, in_memory=False)
+    return attributes
@@ -0,0 +1,157 @@
+
+from app.common.database.repositories import scores, beatmaps, wrapper
+from app.common.database.objects import DBScore, DBBeatmap
+from app.common.constants import Mods
+
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Iterable
+
+from .ppv1 import resolve_eyup_star_rating
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is an optional dependency, which is only needed for this module
+    np = None
+
+# A beatmap-at-a-time version of ppv1.calculate_ppv1, which loads the leaderboard
+# of a beatmap once and calculates the ppv1 of all of its best scores with numpy.
+# It gives the same results, including 0 pp for relax & autopilot scores.
+
+@wrapper.session_wrapper
+def recalculate_beatmap(
+    beatmap: DBBeatmap | int,
+    session: Session = wrapper.SessionProvider
+) -> int:
+    """Recalculate the ppv1 of all best scores on a beatmap
+    `returns`: The amount of updated scores
+    """
+    if np is None:
+        raise ImportError('Batch ppv1 recalculation requires numpy, see the "Optional dependencies" in README.md')
+
+    if isinstance(beatmap, int):
+        beatmap = beatmaps.fetch_by_id(beatmap, session)
+
+    if not beatmap:
+        return 0
+
+    if beatmap.playcount <= 0:
+        return 0
+
+    best_scores = session.query(
+            DBScore.id,
+            DBScore.mode,
+            DBScore.mods,
+            DBScore.acc,
+            DBScore.perfect,
+            DBScore.total_score,
+            DBScore.submitted_at
+        ) \
+        .filter(DBScore.beatmap_id == beatmap.id) \
+        .filter(DBScore.status_pp == 3) \
+        .filter(DBScore.hidden == False) \
+        .all()
+
+    if not best_scores:
+        return 0
+
+    leaderboard = session.query(
+            DBScore.mode,
+            DBScore.total_score
+        ) \
+        .filter(DBScore.beatmap_id == beatmap.id) \
+        .filter(DBScore.status_score == 3) \
+        .filter(DBScore.hidden == False) \
+        .all()
+
+    ids = np.array([score.id for score in best_scores], dtype=np.int64)
+    modes = np.array([score.mode for score in best_scores], dtype=np.int64)
+    mods = np.array([score.mods for score in best_scores], dtype=np.int64)
+    acc = np.array([score.acc for score in best_scores], dtype=np.float64)
+    perfect = np.array([score.perfect for score in best_scores], dtype=bool)
+    total_score = np.array([score.total_score for score in best_scores], dtype=np.int64)
+    submitted_at = np.array(
+        [score.submitted_at.replace(tzinfo=None) for score in best_scores],
+        dtype='datetime64[s]'
+    )
+
+    score_rank = calculate_ranks(modes, total_score, leaderboard)
+    star_rating = resolve_eyup_star_rating(beatmap, session)
+    base_pp = star_rating**4 / score_rank**0.8
+
+    # Older scores will give less pp
+    score_age = (np.datetime64(datetime.now(), 's') - submitted_at) // np.timedelta64(1, 'D')
+    age_factor = np.maximum(0.01, 1 - 0.01 * (score_age / 10))
+
+    # Bonus for SS's & FC's
+    ss_bonus = np.where(acc == 1, 1.36, 1)
+    fc_bonus = np.where(perfect & (acc != 1), 1.2, 1)
+
+    # Adjustments for mods
+    hr_bonus = np.where(mods & int(Mods.HardRock) != 0, 1.1, 1)
+    dt_bonus = np.where(mods & int(Mods.DoubleTime | Mods.Nightcore) != 0, 1.1, 1)
+    ez_nerf = np.where(mods & int(Mods.Easy | Mods.HalfTime) != 0, 0.2, 1)
+
+    populariy_factor = beatmap.playcount**0.4 * 3.6 * 0.24
+    acc_factor = acc**15
+
+    # Nerf converts
+    base_pp = np.where((modes > 0) & (modes != beatmap.mode), base_pp * 0.2, base_pp)
+
+    # Nerf "easy maps"... idk?
+    if (beatmap.passcount / beatmap.playcount) > 0.3:
+        base_pp = np.where(modes != 1, base_pp * 0.2, base_pp)
+
+    ppv1 = (
+        base_pp *
+        age_factor *
+        ss_bonus *
+        fc_bonus *
+        hr_bonus *
+        dt_bonus *
+        ez_nerf *
+        populariy_factor *
+        acc_factor
+    )
+
+    # Relax & autopilot scores don't give any pp, same as DBScore.relaxing
+    ppv1 = np.where(mods & int(Mods.Relax | Mods.Autopilot) != 0, 0.0, ppv1)
+
+    return scores.update_bulk(
+        'ppv1',
+        dict(zip(ids.tolist(), ppv1.tolist())),
+        session=session
+    )
+
+def recalculate_beatmaps(beatmap_ids: Iterable[int]) -> int:
+    """Recalculate the ppv1 of all best scores on multiple beatmaps, committing after each one"""
+    return sum(
+        recalculate_beatmap(beatmap_id)
+        for beatmap_id in beatmap_ids
+    )
+
+def calculate_ranks(
+    modes: np.ndarray,
+    total_score: np.ndarray,
+    leaderboard: list
+) -> np.ndarray:
+    """Get the leaderboard rank for every score, like scores.fetch_score_index_by_tscore"""
+    ranks = np.ones(len(total_score), dtype=np.float64)
+
+    for mode in np.unique(modes):
+        leaderboard_scores = np.sort(np.array(
+            [entry.total_score for entry in leaderboard if entry.mode == mode],
+            dtype=np.int64
+        ))
+        selection = modes == mode
+
+        # Amount of scores with a higher total score, plus one
+        higher_scores = len(leaderboard_scores) - np.searchsorted(
+            leaderboard_scores,
+            total_score[selection],
+            side='right'
+        )
+        ranks[selection] = higher_scores + 1
+
+    return ranks
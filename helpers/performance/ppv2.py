@@ -1,8 +1,10 @@
 
-from app.common.helpers.performance.ppv2_base import PerformanceCalculator, DifficultyAttributes
+from app.common.helpers.performance.ppv2_base import PerformanceCalculator, DifficultyAttributes, PerformanceResult
 from app.common.database.objects import DBScore
 from app.common.constants import GameMode, Mods
 
+from . import difficulty
+
 # Global ppv2 calculator instance, initialized by the application session
 calculator: PerformanceCalculator | None = None
 
@@ -18,10 +20,14 @@ def calculate_ppv2_if_fc(score: DBScore) -> float | None:
     assert calculator is not None, "ppv2 calculator has not been initialized"
     return calculator.calculate_ppv2_if_fc(score)
 
+def calculate_ppv2_with_fc(score: DBScore) -> PerformanceResult | None:
+    assert calculator is not None, "ppv2 calculator has not been initialized"
+    return calculator.calculate_ppv2_with_fc(score)
+
 def calculate_difficulty(beatmap_file: bytes, mode: GameMode, mods: Mods = Mods.NoMod) -> DifficultyAttributes | None:
     assert calculator is not None, "ppv2 calculator has not been initialized"
-    return calculator.calculate_difficulty(beatmap_file, mode, mods)
+    return difficulty.calculate_difficulty(calculator, beatmap_file, mode, mods)
 
 def calculate_difficulty_from_id(beatmap_id: int, mode: GameMode, mods: Mods = Mods.NoMod) -> DifficultyAttributes | None:
     assert calculator is not None, "ppv2 calculator has not been initialized"
-    return calculator.calculate_difficulty_from_id(beatmap_id, mode, mods)
+    return difficulty.calculate_difficulty_from_id(calculator, beatmap_id, mode, mods)
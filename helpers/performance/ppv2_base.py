@@ -4,7 +4,7 @@ from app.common.database.objects import DBScore
 from app.common.constants import GameMode, Mods
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Tuple
 from copy import copy
 
 import logging
@@ -17,6 +17,21 @@ class DifficultyAttributes:
     star_rating: float
     difficulty_attributes: dict[str, Any]
 
+class LocalBeatmapResources:
+    """Serves beatmap files that were loaded by a parent process to a worker process"""
+
+    def __init__(self) -> None:
+        self.files: dict[int, bytes] = {}
+
+    def osu(self, beatmap_id: int) -> bytes | None:
+        return self.files.get(beatmap_id)
+
+@dataclass
+class PerformanceResult:
+    pp: float | None
+    pp_if_fc: float | None
+    star_rating: float | None
+
 class PerformanceCalculator(ABC):
     def __init__(self, beatmaps: BeatmapResources) -> None:
         self.beatmaps = beatmaps
@@ -40,10 +55,47 @@ class PerformanceCalculator(ABC):
         return self.calculate_difficulty(beatmap_file, mode, mods)
 
     def calculate_ppv2_if_fc(self, score: DBScore) -> float | None:
+        return self.calculate_ppv2(self.create_fc_score(score))
+
+    def calculate_ppv2_with_fc(self, score: DBScore) -> PerformanceResult | None:
+        """Calculate pp, if-fc pp and star rating of a score at once
+
+        This fallback will do the work three times, which is why
+        calculators should override it to share their difficulty calculation.
+        """
+        difficulty = self.calculate_difficulty_from_id(score.beatmap_id, score.mode, score.mods)
+
+        return PerformanceResult(
+            pp=self.calculate_ppv2(score),
+            pp_if_fc=self.calculate_ppv2_if_fc(score),
+            star_rating=difficulty.star_rating if difficulty else None
+        )
+
+    @staticmethod
+    def create_fc_score(score: DBScore) -> DBScore:
         fc_score = copy(score)
         fc_score.max_combo = score.beatmap.max_combo
         fc_score.nMiss = 0
-        return self.calculate_ppv2(fc_score)
+        return fc_score
+
+    def prepare_score(self, score: DBScore) -> Tuple[bytes, Mods] | None:
+        """Get the beatmap file of a score, and the mods that its pp will be calculated with"""
+        beatmap_file = self.beatmaps.osu(score.beatmap_id)
+
+        if not beatmap_file:
+            self.logger.error(
+                f'pp calculation failed: Beatmap file was not found! ({score.beatmap_id})'
+            )
+            return None
+
+        mods = self.adjust_mods(score.mods, score.mode, score.client_version)
+
+        if score.touchscreen:
+            # NV was later repurposed to be TD, so
+            # pp systems will treat it as such
+            mods |= Mods.NoVideo
+
+        return beatmap_file, mods
 
     @staticmethod
     def adjust_mods(mods: int, mode: int | GameMode, client_version: int = 0) -> Mods:
@@ -4,7 +4,7 @@ from app.common.constants.mods import ModMapping
 from app.common.database.objects import DBScore
 from app.common.constants import GameMode, Mods
 from math import isinf, isnan
-from typing import Any
+from typing import Any, Tuple
 
 from osu_native_py.wrapper.calculators import (
     create_difficulty_calculator,
@@ -25,42 +25,23 @@ from osu_native_py.wrapper.objects import (
     ScoreInfo,
 )
 
-from .ppv2 import DifficultyAttributes, PerformanceCalculator
+from .ppv2 import DifficultyAttributes, PerformanceCalculator, PerformanceResult
 
 class NativePerformanceCalculator(PerformanceCalculator):
     def calculate_ppv2(self, score: DBScore) -> float | None:
-        beatmap_file = self.beatmaps.osu(score.beatmap_id)
-
-        if not beatmap_file:
-            self.logger.error(
-                f"pp calculation failed: Beatmap file was not found! ({score.beatmap_id})"
-            )
+        if not (prepared := self.prepare_score(score)):
             return
 
-        mods = self.adjust_mods(
-            score.mods,
-            score.mode,
-            score.client_version
-        )
-
-        if score.touchscreen:
-            # NV was later repurposed to be TD, so
-            # pp systems will treat it as such
-            mods |= Mods.NoVideo
+        beatmap_file, mods = prepared
 
         if Mods.Relax in mods or Mods.Autopilot in mods:
             return 0.0
 
-        ruleset = self.convert_to_native_ruleset(score.mode)
-        native_mods = self.convert_to_native_mods(mods)
-        native_beatmap = self.load_native_beatmap(beatmap_file)
-
-        if not native_beatmap:
-            self.logger.error(
-                f"pp calculation failed: Beatmap file could not be parsed! ({score.beatmap_id})"
-            )
+        if not (objects := self.load_native_objects(score, beatmap_file, mods)):
             return
 
+        ruleset, native_mods, native_beatmap = objects
+
         try:
             diff_calculator = create_difficulty_calculator(ruleset, native_beatmap)
             perf_calculator = create_performance_calculator(ruleset)
@@ -74,25 +55,93 @@ class NativePerformanceCalculator(PerformanceCalculator):
                 diff_attributes,
             )
 
-            if not result:
-                self.logger.error("pp calculation failed: No result")
-                return
+            return self.validate_performance(result)
+        except Exception as exc:
+            self.logger.error(f"pp calculation failed: {exc}")
+        finally:
+            self.close_native_objects(native_beatmap, ruleset)
+
+    def calculate_ppv2_with_fc(self, score: DBScore) -> PerformanceResult | None:
+        if not (prepared := self.prepare_score(score)):
+            return
+
+        beatmap_file, mods = prepared
+
+        if not (objects := self.load_native_objects(score, beatmap_file, mods)):
+            return
+
+        ruleset, native_mods, native_beatmap = objects
+
+        try:
+            # Both calculations will share these difficulty attributes
+            diff_calculator = create_difficulty_calculator(ruleset, native_beatmap)
+            perf_calculator = create_performance_calculator(ruleset)
+            diff_attributes = diff_calculator.calculate(native_mods)
+            star_rating = float(diff_attributes.star_rating)
 
-            if isnan(result.total):
-                self.logger.error("pp calculation failed: NaN pp")
-                return 0.0
+            if Mods.Relax in mods or Mods.Autopilot in mods:
+                return PerformanceResult(0.0, 0.0, star_rating)
 
-            if isinf(result.total):
-                self.logger.error("pp calculation failed: Inf pp")
-                return 0.0
+            result = perf_calculator.calculate(
+                ruleset,
+                native_beatmap,
+                native_mods,
+                self.convert_to_score_info(score),
+                diff_attributes,
+            )
+            fc_result = perf_calculator.calculate(
+                ruleset,
+                native_beatmap,
+                native_mods,
+                self.convert_to_score_info(self.create_fc_score(score)),
+                diff_attributes,
+            )
 
-            self.logger.debug(f"Calculated pp: {result}")
-            return float(result.total)
+            return PerformanceResult(
+                pp=self.validate_performance(result),
+                pp_if_fc=self.validate_performance(fc_result),
+                star_rating=star_rating
+            )
         except Exception as exc:
             self.logger.error(f"pp calculation failed: {exc}")
         finally:
             self.close_native_objects(native_beatmap, ruleset)
 
+    def load_native_objects(
+        self,
+        score: DBScore,
+        beatmap_file: bytes,
+        mods: Mods
+    ) -> Tuple[Ruleset, ModsCollection, NativeBeatmap] | None:
+        ruleset = self.convert_to_native_ruleset(score.mode)
+        native_mods = self.convert_to_native_mods(mods)
+        native_beatmap = self.load_native_beatmap(beatmap_file)
+
+        if not native_beatmap:
+            self.logger.error(
+                f"pp calculation failed: Beatmap file could not be parsed! ({score.beatmap_id})"
+            )
+            self.close_native_objects(None, ruleset)
+            return None
+
+        return ruleset, native_mods, native_beatmap
+
+    def validate_performance(self, result: Any) -> float | None:
+        if not result:
+            self.logger.error("pp calculation failed: No result")
+            return
+
+        if isnan(result.total):
+            self.logger.error("pp calculation failed: NaN pp")
+            return 0.0
+
+        if isinf(result.total):
+            self.logger.error("pp calculation failed: Inf pp")
+            return 0.0
+
+        self.logger.debug(f"Calculated pp: {result}")
+        return float(result.total)
+
     def calculate_difficulty(
         self,
         beatmap_data: bytes,
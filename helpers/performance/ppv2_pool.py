@@ -0,0 +1,252 @@
+
+from app.common.database.objects import DBScore, DBBeatmap
+from app.common.helpers.beatmaps import BeatmapResources
+from app.common.constants import GameMode, Mods
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from queue import Queue, Empty
+from threading import Lock, Thread
+from typing import Any, Type
+
+from .ppv2_base import (
+    PerformanceCalculator,
+    PerformanceResult,
+    DifficultyAttributes,
+    LocalBeatmapResources
+)
+
+import multiprocessing
+import resource
+import time
+
+# Jobs are sent as (method, beatmap_id, beatmap_file, arguments) tuples, and
+# answered with (result, max_rss) tuples, so that workers can be recycled
+# once they grow too large. Sending None will shut a worker down.
+
+def worker_main(connection: Connection, calculator_class: Type[PerformanceCalculator]) -> None:
+    resources = LocalBeatmapResources()
+    calculator = calculator_class(resources)
+
+    while (job := connection.recv()) is not None:
+        method, beatmap_id, beatmap_file, arguments = job
+        resources.files = {beatmap_id: beatmap_file}
+
+        try:
+            result = run_job(calculator, method, beatmap_file, arguments)
+        except Exception as e:
+            calculator.logger.error(f'pp calculation failed inside worker: {e}')
+            result = None
+
+        # ru_maxrss is reported in kilobytes on linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        connection.send((result, max_rss))
+
+def run_job(
+    calculator: PerformanceCalculator,
+    method: str,
+    beatmap_file: bytes,
+    arguments: dict
+) -> Any:
+    if method == 'difficulty':
+        return calculator.calculate_difficulty(
+            beatmap_file,
+            arguments['mode'],
+            arguments['mods']
+        )
+
+    score = DBScore(**arguments['score'])
+    score.beatmap = DBBeatmap(
+        id=score.beatmap_id,
+        max_combo=arguments['max_combo']
+    )
+
+    if method == 'ppv2':
+        return calculator.calculate_ppv2(score)
+
+    if method == 'ppv2_with_fc':
+        return calculator.calculate_ppv2_with_fc(score)
+
+    raise ValueError(f'Unknown method "{method}"')
+
+class Worker:
+    def __init__(self, context: Any, calculator_class: Type[PerformanceCalculator]) -> None:
+        self.connection, child_connection = context.Pipe()
+        self.process: BaseProcess = context.Process(
+            target=worker_main,
+            args=(child_connection, calculator_class),
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.jobs = 0
+        self.max_rss = 0
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+            self.process.join(timeout=1)
+        except (OSError, ValueError):
+            pass
+
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.connection.close()
+
+class PooledPerformanceCalculator(PerformanceCalculator):
+    """Runs another calculator inside of a pool of worker processes
+
+    Calculations that exceed their deadline will get their worker killed, and
+    crashing workers will be replaced, so that neither can take down the caller.
+    Replacements are spawned in the background.
+    """
+
+    def __init__(
+        self,
+        beatmaps: BeatmapResources,
+        calculator_class: Type[PerformanceCalculator],
+        workers: int = 2,
+        timeout: float = 5.0,
+        max_jobs: int = 1000,
+        max_memory: int = 1024 * 1024 * 1024
+    ) -> None:
+        super().__init__(beatmaps)
+        self.context = multiprocessing.get_context('spawn')
+        self.calculator_class = calculator_class
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.workers = workers
+        self.idle: Queue[Worker] = Queue()
+        self.lock = Lock()
+        self.metrics = {
+            'jobs': 0,
+            'waiting': 0,
+            'timeouts': 0,
+            'crashes': 0,
+            'recycled': 0
+        }
+
+        for _ in range(workers):
+            self.idle.put(self.create_worker())
+
+    def calculate_ppv2(self, score: DBScore) -> float | None:
+        return self.submit_score('ppv2', score)
+
+    def calculate_ppv2_with_fc(self, score: DBScore) -> PerformanceResult | None:
+        return self.submit_score('ppv2_with_fc', score)
+
+    def calculate_difficulty(self, beatmap_data: bytes, mode: GameMode, mods: Mods) -> DifficultyAttributes | None:
+        return self.submit(
+            'difficulty', 0, beatmap_data,
+            {'mode': mode, 'mods': mods}
+        )
+
+    def submit_score(self, method: str, score: DBScore) -> Any:
+        beatmap_file = self.beatmaps.osu(score.beatmap_id)
+
+        if not beatmap_file:
+            self.logger.error(
+                f'pp calculation failed: Beatmap file was not found! ({score.beatmap_id})'
+            )
+            return
+
+        arguments = {
+            'score': {
+                attribute.key: getattr(score, attribute.key)
+                for attribute in DBScore.__mapper__.column_attrs
+            },
+            # Only needed for the if-fc calculation
+            'max_combo': score.beatmap.max_combo if method == 'ppv2_with_fc' else 0
+        }
+
+        return self.submit(method, score.beatmap_id, beatmap_file, arguments)
+
+    def submit(self, method: str, beatmap_id: int, beatmap_file: bytes, arguments: dict) -> Any:
+        worker = self.acquire()
+        replace = True
+
+        try:
+            worker.connection.send((method, beatmap_id, beatmap_file, arguments))
+
+            if not worker.connection.poll(self.timeout):
+                self.logger.error(
+                    f'pp calculation failed: Exceeded deadline of {self.timeout}s ({beatmap_id})'
+                )
+                self.increment('timeouts')
+                return
+
+            result, worker.max_rss = worker.connection.recv()
+            worker.jobs += 1
+            self.increment('jobs')
+
+            replace = worker.jobs >= self.max_jobs or worker.max_rss >= self.max_memory
+
+            if replace:
+                self.increment('recycled')
+
+            return result
+        except (EOFError, OSError) as e:
+            self.logger.error(f'pp calculation failed: Worker crashed ({e})')
+            self.increment('crashes')
+        except Exception as e:
+            # The pipe may still hold a partial job or an unread result
+            self.logger.error(f'pp calculation failed: {e}', exc_info=e)
+            self.increment('crashes')
+        finally:
+            if replace:
+                self.replace_worker(worker)
+            else:
+                self.idle.put(worker)
+
+    def acquire(self) -> Worker:
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+
+        self.increment('waiting')
+
+        try:
+            return self.idle.get()
+        finally:
+            self.increment('waiting', -1)
+
+    def create_worker(self) -> Worker:
+        return Worker(self.context, self.calculator_class)
+
+    def replace_worker(self, worker: Worker) -> None:
+        # Spawning a new interpreter takes a while, which is why this
+        # doesn't happen on the request path. Callers will wait inside
+        # of acquire() if there are no other idle workers left.
+        Thread(target=self.respawn_worker, args=(worker,), daemon=True).start()
+
+    def respawn_worker(self, worker: Worker) -> None:
+        worker.kill()
+
+        while True:
+            try:
+                return self.idle.put(self.create_worker())
+            except Exception as e:
+                self.logger.error(f'Failed to spawn pp worker: {e}', exc_info=e)
+                time.sleep(1)
+
+    def increment(self, metric: str, amount: int = 1) -> None:
+        with self.lock:
+            self.metrics[metric] += amount
+
+    def statistics(self) -> dict:
+        with self.lock:
+            return {
+                **self.metrics,
+                'workers': self.workers,
+                'idle': self.idle.qsize()
+            }
+
+    def shutdown(self) -> None:
+        for _ in range(self.workers):
+            self.idle.get().stop()
@@ -1,12 +1,17 @@
 
+from app.common.config import config_instance as config
+from app.common.helpers.caching import SizedLRUCache
+from app.common.helpers.beatmaps import BeatmapResources
 from app.common.helpers import score as score_helper
 from app.common.database.objects import DBScore
 from app.common.constants import Mods, GameMode
 from math import isnan, isinf
+from hashlib import md5
 
 from .ppv2 import (
     PerformanceCalculator,
-    DifficultyAttributes
+    DifficultyAttributes,
+    PerformanceResult
 )
 
 from rosu_pp_py import (
@@ -16,40 +21,69 @@ from rosu_pp_py import (
     Beatmap as RosuBeatmap
 )
 
+# Parsed beatmaps take up a lot more memory than their files
+PARSED_BEATMAP_SIZE_FACTOR = 8
+
 class RosuPerformanceCalculator(PerformanceCalculator):
+    def __init__(self, beatmaps: BeatmapResources) -> None:
+        super().__init__(beatmaps)
+        self.beatmap_cache = SizedLRUCache(config.PPV2_BEATMAP_CACHE_SIZE)
+
     def calculate_ppv2(self, score: DBScore) -> float | None:
-        beatmap_file = self.beatmaps.osu(score.beatmap_id)
+        if not (prepared := self.prepare_score(score)):
+            return
 
-        if not beatmap_file:
-            self.logger.error(
-                f'pp calculation failed: Beatmap file was not found! ({score.beatmap_id})'
-            )
+        beatmap_file, mods = prepared
+
+        if Mods.Relax in mods or Mods.Autopilot in mods:
+            return 0.0
+
+        if (beatmap := self.load_score_beatmap(score, beatmap_file, mods)) is None:
             return
 
-        mods = self.adjust_mods(score.mods, score.mode, score.client_version)
-        mode = self.convert_to_rosu_mode(score.mode)
+        perf = self.create_performance(score, mods)
+        return self.calculate_performance(perf, beatmap)
 
-        if score.touchscreen:
-            # NV was later repurposed to be TD, so
-            # pp systems will treat it as such
-            mods |= Mods.NoVideo
+    def calculate_ppv2_with_fc(self, score: DBScore) -> PerformanceResult | None:
+        if not (prepared := self.prepare_score(score)):
+            return
 
-        total_hits = score_helper.calculate_total_hits(score)
-        relaxing = Mods.Relax in mods or Mods.Autopilot in mods
+        beatmap_file, mods = prepared
 
-        if relaxing:
-            return 0.0
+        if (beatmap := self.load_score_beatmap(score, beatmap_file, mods)) is None:
+            return
 
-        # Load beatmap file & convert it
-        beatmap = RosuBeatmap(bytes=beatmap_file)
-        beatmap.convert(mode, mods.value)
+        # Attributes of the full beatmap, which are shared by the
+        # star rating, the if-fc pp and the pp of passed scores
+        difficulty = RosuPerformance(lazer=False, mods=mods.value).difficulty().calculate(beatmap)
+
+        if Mods.Relax in mods or Mods.Autopilot in mods:
+            return PerformanceResult(0.0, 0.0, difficulty.stars)
+
+        # Failed scores only cover a part of the beatmap, which is why their
+        # difficulty is the only one calculated again. A full combo always
+        # covers the whole beatmap, with the remaining objects as 300s.
+        prior = difficulty if score.passed else beatmap
+
+        return PerformanceResult(
+            pp=self.calculate_performance(self.create_performance(score, mods), prior),
+            pp_if_fc=self.calculate_performance(self.create_performance(self.create_fc_score(score), mods, full_map=True), difficulty),
+            star_rating=difficulty.stars
+        )
+
+    def load_score_beatmap(self, score: DBScore, beatmap_file: bytes, mods: Mods) -> RosuBeatmap | None:
+        mode = self.convert_to_rosu_mode(score.mode)
+        beatmap = self.load_beatmap(beatmap_file, mode, mods)
 
         if beatmap.is_suspicious():
             self.logger.error(
                 f'pp calculation failed: Beatmap file is suspicious! ({score.beatmap_id})'
             )
-            return
+            return None
+
+        return beatmap
 
+    def create_performance(self, score: DBScore, mods: Mods, full_map: bool = False) -> RosuPerformance:
         perf = RosuPerformance(
             lazer=False,
             mods=mods.value,
@@ -63,10 +97,17 @@ class RosuPerformanceCalculator(PerformanceCalculator):
             legacy_total_score=score.total_score
         )
 
-        if not score.passed:
-            perf.set_passed_objects(total_hits)
+        if not score.passed and not full_map:
+            perf.set_passed_objects(score_helper.calculate_total_hits(score))
 
-        if not (result := perf.calculate(beatmap)):
+        return perf
+
+    def calculate_performance(
+        self,
+        perf: RosuPerformance,
+        prior: RosuBeatmap | RosuDifficultyAttributes
+    ) -> float | None:
+        if not (result := perf.calculate(prior)):
             self.logger.error(
                 'pp calculation failed: No result'
             )
@@ -110,8 +151,7 @@ class RosuPerformanceCalculator(PerformanceCalculator):
     ) -> RosuDifficultyAttributes | None:
         converted_mode = RosuPerformanceCalculator.convert_to_rosu_mode(mode)
         perf = RosuPerformance(mods=mods.value)
-        beatmap = RosuBeatmap(bytes=beatmap_file)
-        beatmap.convert(converted_mode, mods.value)
+        beatmap = self.load_beatmap(beatmap_file, converted_mode, mods)
         difficulty = perf.difficulty()
 
         if not (result := difficulty.calculate(beatmap)):
@@ -134,6 +174,29 @@ class RosuPerformanceCalculator(PerformanceCalculator):
 
         return result
 
+    def load_beatmap(
+        self,
+        beatmap_file: bytes,
+        mode: RosuGameMode,
+        mods: Mods
+    ) -> RosuBeatmap:
+        """Parse & convert a beatmap, or get it from the cache"""
+        # Only key mods have an effect on the conversion (for mania)
+        conversion_mods = mods & Mods.KeyMod if mode == RosuGameMode.Mania else Mods.NoMod
+        key = (md5(beatmap_file).digest(), int(mode), int(conversion_mods))
+
+        if (beatmap := self.beatmap_cache.get(key)) is not None:
+            return beatmap
+
+        beatmap = RosuBeatmap(bytes=beatmap_file)
+        beatmap.convert(mode, conversion_mods.value)
+
+        self.beatmap_cache.set(
+            key, beatmap,
+            len(beatmap_file) * PARSED_BEATMAP_SIZE_FACTOR
+        )
+        return beatmap
+
     @staticmethod
     def map_difficulty_attributes(result: RosuDifficultyAttributes, mods: Mods) -> DifficultyAttributes:
         difficulty_attributes = {
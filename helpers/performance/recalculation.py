@@ -0,0 +1,158 @@
+
+from app.common.helpers.performance.ppv2_base import PerformanceCalculator, LocalBeatmapResources
+from app.common.database.objects import DBScore
+from app.common.database.repositories import scores
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Dict, List, Tuple, Type
+
+import multiprocessing
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger('recalculation')
+
+worker_calculator: PerformanceCalculator | None = None
+worker_resources: LocalBeatmapResources | None = None
+
+def initialize_worker(calculator_class: Type[PerformanceCalculator]) -> None:
+    global worker_calculator, worker_resources
+    worker_resources = LocalBeatmapResources()
+    worker_calculator = calculator_class(worker_resources)
+
+def calculate_group(
+    beatmap_id: int,
+    beatmap_file: bytes,
+    score_payloads: List[dict]
+) -> List[Tuple[int, float]]:
+    """Calculate the pp of all scores on one beatmap inside of a worker process"""
+    worker_resources.files = {beatmap_id: beatmap_file}
+    results = []
+
+    for payload in score_payloads:
+        try:
+            pp = worker_calculator.calculate_ppv2(DBScore(**payload))
+        except Exception as e:
+            worker_calculator.logger.error(f'pp calculation failed for score {payload["id"]}: {e}')
+            continue
+
+        if pp is None:
+            continue
+
+        results.append((payload['id'], pp))
+
+    return results
+
+def serialize_score(score: DBScore) -> dict:
+    return {
+        attribute.key: getattr(score, attribute.key)
+        for attribute in DBScore.__mapper__.column_attrs
+    }
+
+def load_checkpoint(path: str | None) -> int:
+    """Get the last score id that was fully processed"""
+    if not path or not os.path.isfile(path):
+        return 0
+
+    with open(path, 'r') as file:
+        return json.load(file).get('last_score_id', 0)
+
+def save_checkpoint(path: str | None, last_score_id: int, processed: int) -> None:
+    if not path:
+        return
+
+    # Write to a temporary file first, so that an
+    # interruption can't leave a corrupted checkpoint
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump({'last_score_id': last_score_id, 'processed': processed}, file)
+
+    os.replace(f'{path}.tmp', path)
+
+def recalculate_many(
+    score_iter: Iterable[DBScore],
+    calculator: PerformanceCalculator,
+    workers: int = os.cpu_count() or 1,
+    batch_size: int = 10000,
+    checkpoint: str | None = None,
+    column: str = 'pp'
+) -> Dict[str, float]:
+    """Recalculate the ppv2 of many scores, using a pool of worker processes
+
+    Scores are processed in batches, which get grouped by beatmap, so that every beatmap
+    only needs to be loaded & parsed once per batch. `score_iter` should be ordered by
+    score id, e.g. `DBScore.id > load_checkpoint(path)`, so that the checkpoint file can
+    be used to resume an interrupted recalculation. Scores at or below the checkpoint
+    will be skipped either way.
+    """
+    last_score_id = load_checkpoint(checkpoint)
+    start_time = time.time()
+    processed = 0
+    updated = 0
+    failed = 0
+
+    def process_batch(pool: ProcessPoolExecutor, batch: List[DBScore]) -> None:
+        nonlocal processed, updated, failed
+        groups: Dict[int, List[dict]] = {}
+
+        for score in batch:
+            groups.setdefault(score.beatmap_id, []).append(serialize_score(score))
+
+        futures = []
+
+        for beatmap_id, score_payloads in groups.items():
+            if not (beatmap_file := calculator.beatmaps.osu(beatmap_id)):
+                logger.warning(f'Skipping {len(score_payloads)} scores: Beatmap file was not found ({beatmap_id})')
+                continue
+
+            futures.append(pool.submit(calculate_group, beatmap_id, beatmap_file, score_payloads))
+
+        results: Dict[int, float] = {}
+
+        for future in futures:
+            results.update(future.result())
+
+        updated += scores.update_bulk(column, results)
+        processed += len(batch)
+        failed += len(batch) - len(results)
+
+        save_checkpoint(checkpoint, max(score.id for score in batch), processed)
+        elapsed = time.time() - start_time
+
+        logger.info(
+            f'Recalculated {processed} scores '
+            f'({processed / elapsed:.0f} scores/s, {failed} failed)'
+        )
+
+    # Forking would copy the database & redis connection pools, as well
+    # as the state of background threads into every worker process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=initialize_worker,
+        initargs=(calculator.__class__,)
+    ) as pool:
+        batch: List[DBScore] = []
+
+        for score in score_iter:
+            if score.id <= last_score_id:
+                continue
+
+            batch.append(score)
+
+            if len(batch) >= batch_size:
+                process_batch(pool, batch)
+                batch = []
+
+        if batch:
+            process_batch(pool, batch)
+
+    elapsed = time.time() - start_time
+
+    return {
+        'processed': processed,
+        'updated': updated,
+        'failed': failed,
+        'elapsed': elapsed,
+        'scores_per_second': processed / elapsed if elapsed > 0 else 0
+    }
@@ -1,8 +1,12 @@
 
-from typing import IO, Generator
+from typing import IO, Generator, List, Tuple
 from zipstream import ZipStream
 from pathlib import PurePath
 from zipfile import ZipFile
+from io import SEEK_END
+
+import struct
+import json
 
 video_file_extensions = frozenset((
     ".wmv", ".flv", ".mp4",
@@ -11,19 +15,182 @@ video_file_extensions = frozenset((
     ".ogv", ".mpeg", ".3gp"
 ))
 
+def is_video_file(filename: str) -> bool:
+    return PurePath(filename).suffix.lower() in video_file_extensions
+
+def contains_video_files(source: IO[bytes]) -> bool:
+    with ZipFile(source, 'r') as zip_file:
+        return any(is_video_file(filename) for filename in zip_file.namelist())
+
+end_of_central_directory = struct.Struct('<4s4H2LH')
+zip64_end_of_central_directory_locator = struct.Struct('<4sLQL')
+central_directory_header = struct.Struct('<4s6H3L5H2L')
+local_file_header_size = 30
+
+class ZipManifest:
+    """Layout of a zip file without its video files
+
+    Every segment is a range of the source file, which contains the local
+    header & compressed data of an entry, and can be copied as-is. The
+    trailer holds the new central directory, with rewritten offsets.
+    """
+
+    def __init__(self, source_size: int, segments: List[Tuple[int, int]], trailer: bytes) -> None:
+        self.source_size = source_size
+        self.segments = segments
+        self.trailer = trailer
+
+    def __len__(self) -> int:
+        return sum(length for _, length in self.segments) + len(self.trailer)
+
+    @classmethod
+    def from_source(cls, source: IO[bytes]) -> "ZipManifest | None":
+        """Parse the central directory of a zip file, or return None if it can't be copied raw"""
+        source_size = source.seek(0, SEEK_END)
+        tail_size = min(source_size, end_of_central_directory.size + 0xFFFF)
+        source.seek(source_size - tail_size)
+        tail = source.read(tail_size)
+
+        if (eocd_position := tail.rfind(b'PK\x05\x06')) < 0:
+            return None
+
+        if len(tail) - eocd_position < end_of_central_directory.size:
+            return None
+
+        (
+            _, disk, directory_disk, _, entry_count,
+            directory_size, directory_offset, _
+        ) = end_of_central_directory.unpack_from(tail, eocd_position)
+
+        if disk != 0 or directory_disk != 0:
+            # Split archives
+            return None
+
+        locator_position = eocd_position - zip64_end_of_central_directory_locator.size
+
+        if locator_position >= 0 and tail[locator_position:locator_position + 4] == b'PK\x06\x07':
+            # Zip64 archives are rare enough to just use the fallback
+            return None
+
+        if directory_offset + directory_size != source_size - tail_size + eocd_position:
+            # Data was prepended to the archive, or the central directory is broken
+            return None
+
+        source.seek(directory_offset)
+        directory = source.read(directory_size)
+        entries = []
+        position = 0
+
+        for _ in range(entry_count):
+            if position + central_directory_header.size > len(directory):
+                return None
+
+            header = central_directory_header.unpack_from(directory, position)
+            (
+                signature, _, _, flags, _, _, _, _,
+                compressed_size, file_size, name_length, extra_length,
+                comment_length, _, _, _, header_offset
+            ) = header
+
+            if signature != b'PK\x01\x02':
+                return None
+
+            if 0xFFFFFFFF in (compressed_size, file_size, header_offset):
+                # Entry uses zip64 extensions
+                return None
+
+            record_length = central_directory_header.size + name_length + extra_length + comment_length
+            name = directory[position + central_directory_header.size:][:name_length]
+            encoding = 'utf-8' if flags & 0x800 else 'cp437'
+
+            entries.append((
+                header_offset,
+                local_file_header_size + name_length + compressed_size,
+                name.decode(encoding, errors='replace'),
+                directory[position:position + record_length]
+            ))
+            position += record_length
+
+        entries.sort(key=lambda entry: entry[0])
+        segments = []
+        records = []
+        offset = 0
+
+        for index, (header_offset, minimum_length, filename, record) in enumerate(entries):
+            # Each entry spans until the next one, including its data descriptor
+            next_offset = entries[index + 1][0] if index + 1 < len(entries) else directory_offset
+            length = next_offset - header_offset
+
+            if length < minimum_length:
+                return None
+
+            if is_video_file(filename):
+                continue
+
+            # Point the central directory record to the new location of the entry
+            records.append(record[:42] + struct.pack('<L', offset) + record[46:])
+            segments.append((header_offset, length))
+            offset += length
+
+        directory = b''.join(records)
+        trailer = directory + end_of_central_directory.pack(
+            b'PK\x05\x06', 0, 0,
+            len(records), len(records),
+            len(directory), offset, 0
+        )
+
+        return cls(source_size, segments, trailer)
+
+    def serialize(self) -> dict:
+        return {
+            'source_size': self.source_size,
+            'segments': json.dumps(self.segments),
+            'trailer': self.trailer
+        }
+
+    @classmethod
+    def deserialize(cls, data: dict) -> "ZipManifest":
+        return cls(
+            int(data[b'source_size']),
+            [tuple(segment) for segment in json.loads(data[b'segments'])],
+            data[b'trailer']
+        )
+
 class NoVideoZipIterator:
-    """An iterator that streams a zip file while excluding video files"""
+    """An iterator that streams a zip file while excluding video files
+
+    By default, the entries are copied from the source byte-for-byte using a
+    `ZipManifest`, which can be passed in if it was cached. Archives that the
+    manifest doesn't support are rebuilt with zipstream instead.
+    """
 
-    def __init__(self, source: IO[bytes], chunk_size: int = 1024 * 64) -> None:
+    def __init__(
+        self,
+        source: IO[bytes],
+        chunk_size: int = 1024 * 64,
+        manifest: ZipManifest | None = None,
+        raw: bool = True
+    ) -> None:
         self.closed: bool = False
         self.source: IO[bytes] | None = source
-        self.source_zip = ZipFile(source, 'r')
-        self.zip_stream = ZipStream(sized=True)
+        self.source_zip: ZipFile | None = None
+        self.zip_stream: ZipStream | None = None
         self.iterator: Generator | None = None
         self.chunk_size = chunk_size
-        self.prepare_stream()
+        self.manifest = manifest
+
+        if raw and self.manifest is None:
+            self.manifest = ZipManifest.from_source(source)
+
+        if not raw or self.manifest is None:
+            self.source_zip = ZipFile(source, 'r')
+            self.zip_stream = ZipStream(sized=True)
+            self.prepare_stream()
 
     def __len__(self) -> int:
+        if self.manifest is not None:
+            return len(self.manifest)
+
         assert self.zip_stream is not None
         return len(self.zip_stream)
 
@@ -37,6 +204,9 @@ class NoVideoZipIterator:
         if self.closed:
             raise StopIteration
 
+        if self.iterator is None and self.manifest is not None:
+            self.iterator = self.stream_raw()
+
         if self.iterator is None:
             assert self.zip_stream is not None
             self.iterator = iter(self.zip_stream)
@@ -52,9 +222,7 @@ class NoVideoZipIterator:
         assert self.source_zip is not None
 
         for item in self.source_zip.infolist():
-            extension = PurePath(item.filename).suffix.lower()
-
-            if extension in video_file_extensions:
+            if is_video_file(item.filename):
                 continue
 
             # Add each file as a chunked iterator instead
@@ -73,6 +241,22 @@ class NoVideoZipIterator:
             while chunk := entry.read(chunk_size):
                 yield chunk
 
+    def stream_raw(self) -> Generator[bytes, None, None]:
+        assert self.manifest is not None
+        assert self.source is not None
+
+        for offset, length in self.manifest.segments:
+            self.source.seek(offset)
+
+            while length > 0:
+                if not (chunk := self.source.read(min(self.chunk_size, length))):
+                    raise EOFError('Zip file ended unexpectedly')
+
+                length -= len(chunk)
+                yield chunk
+
+        yield self.manifest.trailer
+
     def close(self) -> None:
         if self.closed:
             return
@@ -1,5 +1,17 @@
 
+from app.common.config import config_instance as config
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from threading import Lock
+from sqlalchemy import event
+from typing import Callable, Generator, Deque, Dict
+
 import importlib
+import logging
+import random
+import time
 
 def setup() -> None:
     try:
@@ -7,3 +19,186 @@ def setup() -> None:
         pytracy.enable_tracing(True)
     except ImportError:
         pass
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+class FunctionMetrics:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.queries = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[index] += 1
+                break
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'queries': self.queries,
+            'rows': self.rows,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'average_time': self.total_time / self.calls if self.calls else 0.0,
+            'histogram': {
+                str(bound): count
+                for bound, count in zip(LATENCY_BUCKETS, self.buckets)
+            }
+        }
+
+metrics: Dict[str, FunctionMetrics] = {}
+slow_queries: Deque[dict] = deque(maxlen=config.SLOW_QUERY_LOG_SIZE)
+current_function: ContextVar[str | None] = ContextVar('current_function', default=None)
+logger = logging.getLogger('slow-queries')
+lock = Lock()
+
+def function_name(func: Callable) -> str:
+    """Get the name of a repository function, e.g. "scores.fetch_by_id" """
+    return f'{func.__module__.rsplit(".", 1)[-1]}.{func.__name__}'
+
+@contextmanager
+def measure(name: str) -> Generator[None, None, None]:
+    """Record the latency of a repository function call"""
+    if not config.INSTRUMENTATION_ENABLED:
+        yield
+        return
+
+    token = current_function.set(name)
+    start = time.perf_counter()
+    failed = False
+
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        current_function.reset(token)
+
+        with lock:
+            metrics.setdefault(name, FunctionMetrics()).observe(elapsed, failed)
+
+def register_events(engine: Engine) -> None:
+    """Attribute queries & rows to repository functions, and log slow queries"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, *args) -> None:
+        # A connection only runs one query at a time, and failed queries
+        # never reach after_cursor_execute, so no stack is kept here
+        conn.info['profiling_query_start'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, *args) -> None:
+        start = conn.info.pop('profiling_query_start', None)
+
+        if start is None or not config.INSTRUMENTATION_ENABLED:
+            return
+
+        elapsed = time.perf_counter() - start
+
+        name = current_function.get()
+        rows = max(cursor.rowcount, 0)
+
+        if name is not None:
+            with lock:
+                function = metrics.setdefault(name, FunctionMetrics())
+                function.queries += 1
+                function.rows += rows
+
+        if elapsed < config.SLOW_QUERY_THRESHOLD:
+            return
+
+        if random.random() >= config.SLOW_QUERY_SAMPLE_RATE:
+            return
+
+        record_slow_query({
+            'function': name,
+            'statement': statement,
+            'elapsed': elapsed,
+            'rows': rows,
+            'time': time.time()
+        })
+
+        logger.warning(
+            f'Slow query in {name or "unknown function"} '
+            f'({elapsed:.3f}s, {rows} rows): {" ".join(statement.split())}'
+        )
+
+def record_slow_query(entry: dict) -> None:
+    global slow_queries
+
+    with lock:
+        if slow_queries.maxlen != config.SLOW_QUERY_LOG_SIZE:
+            # The log size can be changed at runtime
+            slow_queries = deque(slow_queries, maxlen=config.SLOW_QUERY_LOG_SIZE)
+
+        slow_queries.append(entry)
+
+def snapshot() -> dict:
+    """Get all collected metrics as a dictionary"""
+    with lock:
+        return {
+            'functions': {
+                name: function.as_dict()
+                for name, function in metrics.items()
+            },
+            'slow_queries': list(slow_queries)
+        }
+
+# Counter families of the prometheus output: (name, help, attribute)
+COUNTER_FAMILIES = (
+    ('repository_calls_total', 'Calls to repository functions', 'calls'),
+    ('repository_errors_total', 'Repository function calls that raised an exception', 'errors'),
+    ('repository_queries_total', 'Queries executed by repository functions', 'queries'),
+    ('repository_rows_total', 'Rows returned or affected by repository functions', 'rows')
+)
+
+def prometheus() -> str:
+    """Get all collected metrics in the prometheus text format"""
+    lines = []
+
+    with lock:
+        functions = sorted(metrics.items())
+
+        # Every family needs to be listed in one block, right below its metadata
+        for family, description, attribute in COUNTER_FAMILIES:
+            lines.append(f'# HELP {family} {description}')
+            lines.append(f'# TYPE {family} counter')
+
+            for name, function in functions:
+                lines.append(f'{family}{{function="{name}"}} {getattr(function, attribute)}')
+
+        lines.append('# HELP repository_call_duration_seconds Latency of repository functions')
+        lines.append('# TYPE repository_call_duration_seconds histogram')
+
+        for name, function in functions:
+            labels = f'function="{name}"'
+            cumulative = 0
+
+            for bound, count in zip(LATENCY_BUCKETS, function.buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else str(bound)
+                lines.append(f'repository_call_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+
+            lines.append(f'repository_call_duration_seconds_sum{{{labels}}} {function.total_time}')
+            lines.append(f'repository_call_duration_seconds_count{{{labels}}} {function.calls}')
+
+    return '\n'.join(lines) + '\n'
+
+def reset() -> None:
+    with lock:
+        metrics.clear()
+        slow_queries.clear()
@@ -1,7 +1,7 @@
 
 from ..config import Config
 from .local import LocalStorage
-from .base import BaseStorage
+from .base import BaseStorage, ObjectInfo
 from .s3 import S3Storage
 
 def Storage(config: Config) -> BaseStorage:
@@ -10,4 +10,4 @@ def Storage(config: Config) -> BaseStorage:
 
     return LocalStorage(config)
 
-__all__ = ('Storage', 'BaseStorage', 'LocalStorage', 'S3Storage')
+__all__ = ('Storage', 'BaseStorage', 'LocalStorage', 'S3Storage', 'ObjectInfo')
@@ -1,17 +1,27 @@
 
 from concurrent.futures import ThreadPoolExecutor
-from typing import Generator, List, Any, IO
+from typing import Generator, List, Set, Any, IO
 from abc import ABC, abstractmethod
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+from threading import Lock
 from redis import Redis
 
 from ..database.repositories import scores, wrapper
 from ..database.objects import DBScore
-from ..helpers import replays, cloudflare
+from ..helpers import replays, cloudflare, caching, streaming
 from ..config import Config
 
+import tempfile
 import logging
+import io
+
+@dataclass(slots=True)
+class ObjectInfo:
+    size: int
+    etag: str | None
+    last_modified: datetime | None
 
 class BaseStorage(ABC):
     """Base class for storage backends"""
@@ -27,15 +37,46 @@ class BaseStorage(ABC):
             max_workers=1,
             thread_name_prefix='cache-purge'
         )
+        self.variant_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='osz-variants'
+        )
+        self.pending_variants: Set[int] = set()
+        self.pending_variants_lock = Lock()
 
     @abstractmethod
-    def save(self, key: str, content: bytes, bucket: str) -> bool: ...
+    def save(self, key: str, content: bytes | IO[bytes], bucket: str) -> bool: ...
 
     @abstractmethod
     def get(self, key: str, bucket: str) -> bytes | None: ...
 
     @abstractmethod
-    def get_iterator(self, key: str, bucket: str, chunk_size: int = 1024 * 64) -> Generator: ...
+    def get_iterator(
+        self,
+        key: str,
+        bucket: str,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator: ...
+
+    @abstractmethod
+    def get_range(self, key: str, bucket: str, start: int, end: int | None = None) -> bytes | None:
+        """Read the bytes from `start` to `end` (inclusive, like http ranges) of a file"""
+
+    @abstractmethod
+    def get_range_iterator(
+        self,
+        key: str,
+        bucket: str,
+        start: int,
+        end: int | None = None,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator: ...
+
+    @abstractmethod
+    def get_info(self, key: str, bucket: str) -> ObjectInfo | None:
+        """Get the size, etag & modification date of a file, without reading it"""
 
     @abstractmethod
     def get_io(self, key: str, bucket: str) -> IO[bytes] | None: ...
@@ -55,21 +96,57 @@ class BaseStorage(ABC):
     @abstractmethod
     def get_presigned_url(self, folder: str, key: str, expiration: int = 900) -> str | None: ...
 
+    def get_path(self, key: str, bucket: str) -> str | None:
+        """Filesystem path to a file, e.g. to serve it with sendfile"""
+        return None
+
     def get_osz_internal_path(self, set_id: int) -> str | None:
         """Filesystem path to an .osz file"""
         return None
 
     def get_from_cache(self, name: str) -> Any | None:
-        return self.cache.get(f'{name}')
+        local_cache = self.local_cache_for(name)
+
+        if local_cache and (content := local_cache.get(name)) is not None:
+            return content
+
+        content = self.cache.get(f'{name}')
+
+        if local_cache and content:
+            local_cache.set(name, content)
+
+        return content
 
     def save_to_cache(self, name: str, content: bytes, expiry=timedelta(days=1), override=True) -> bool:
         if len(content) > 40_000_000:
             return True
-        return bool(self.cache.set(f'{name}', content, expiry, nx=(not override)))
+
+        success = bool(self.cache.set(f'{name}', content, expiry, nx=(not override)))
+
+        if success and (local_cache := self.local_cache_for(name)):
+            local_cache.set(name, content)
+
+        return success
 
     def remove_from_cache(self, name: str) -> bool:
+        self.invalidate_local_cache(name)
         return bool(self.cache.delete(f'{name}'))
 
+    def local_cache_for(self, name: str) -> caching.BlobCache | None:
+        """Get the in-process cache tier, if enabled & used for this key"""
+        if not (local_cache := caching.local_blob_cache(self.cache)):
+            return None
+
+        if not local_cache.handles(name):
+            return None
+
+        return local_cache
+
+    def invalidate_local_cache(self, name: str) -> None:
+        """Remove a key from the in-process cache of every process"""
+        if local_cache := self.local_cache_for(name):
+            local_cache.invalidate(self.cache, name)
+
     def get_avatar(self, id: str) -> bytes | None:
         if (image := self.get_from_cache(f'avatar:{id}')):
             return image
@@ -139,8 +216,8 @@ class BaseStorage(ABC):
     def get_osz(self, set_id: int) -> bytes | None:
         return self.get(f'{set_id}', 'osz')
 
-    def get_osz_iterable(self, set_id: int, chunk_size: int = 1024 * 64) -> Generator:
-        return self.get_iterator(f'{set_id}', 'osz', chunk_size)
+    def get_osz_iterable(self, set_id: int, chunk_size: int = 1024 * 64, reuse_buffer: bool = False) -> Generator:
+        return self.get_iterator(f'{set_id}', 'osz', chunk_size, reuse_buffer)
 
     def get_osz_io(self, set_id: int) -> IO[bytes] | None:
         return self.get_io(f'{set_id}', 'osz')
@@ -148,11 +225,52 @@ class BaseStorage(ABC):
     def get_osz_size(self, set_id: int) -> int | None:
         return self.get_size(f'{set_id}', 'osz')
 
+    def get_osz_novideo_iterable(self, set_id: int, chunk_size: int = 1024 * 64, reuse_buffer: bool = False) -> Generator:
+        return self.get_iterator(f'{set_id}', 'osz_novideo', chunk_size, reuse_buffer)
+
+    def get_osz_novideo_info(self, set_id: int) -> ObjectInfo | None:
+        return self.get_info(f'{set_id}', 'osz_novideo')
+
+    def get_osz_manifest(self, set_id: int, source: IO[bytes]) -> streaming.ZipManifest | None:
+        """Get the no-video manifest of an osz file from the cache, or parse it from `source`"""
+        source_size = source.seek(0, io.SEEK_END)
+
+        if (data := self.cache.hgetall(f'osz:manifest:{set_id}')):
+            manifest = streaming.ZipManifest.deserialize(data)
+
+            # Guard against manifests of a previous upload
+            if manifest.source_size == source_size:
+                return manifest
+
+        if not (manifest := streaming.ZipManifest.from_source(source)):
+            return None
+
+        with self.cache.pipeline() as pipe:
+            pipe.delete(f'osz:manifest:{set_id}')
+            pipe.hset(f'osz:manifest:{set_id}', mapping=manifest.serialize())
+            pipe.expire(f'osz:manifest:{set_id}', timedelta(days=7))
+            pipe.execute()
+
+        return manifest
+
+    def get_osz_info(self, set_id: int) -> ObjectInfo | None:
+        return self.get_info(f'{set_id}', 'osz')
+
+    def get_osz_range_iterable(
+        self,
+        set_id: int,
+        start: int,
+        end: int | None = None,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        return self.get_range_iterator(f'{set_id}', 'osz', start, end, chunk_size, reuse_buffer)
+
     def get_osz2(self, set_id: int) -> bytes | None:
         return self.get(f'{set_id}', 'osz2')
 
-    def get_osz2_iterable(self, set_id: int, chunk_size: int = 1024 * 64) -> Generator:
-        return self.get_iterator(f'{set_id}', 'osz2', chunk_size)
+    def get_osz2_iterable(self, set_id: int, chunk_size: int = 1024 * 64, reuse_buffer: bool = False) -> Generator:
+        return self.get_iterator(f'{set_id}', 'osz2', chunk_size, reuse_buffer)
 
     def get_osz2_io(self, set_id: int) -> IO[bytes] | None:
         return self.get_io(f'{set_id}', 'osz2')
@@ -160,6 +278,19 @@ class BaseStorage(ABC):
     def get_osz2_size(self, set_id: int) -> int | None:
         return self.get_size(f'{set_id}', 'osz2')
 
+    def get_osz2_info(self, set_id: int) -> ObjectInfo | None:
+        return self.get_info(f'{set_id}', 'osz2')
+
+    def get_osz2_range_iterable(
+        self,
+        set_id: int,
+        start: int,
+        end: int | None = None,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        return self.get_range_iterator(f'{set_id}', 'osz2', start, end, chunk_size, reuse_buffer)
+
     def get_beatmap(self, id: int) -> bytes | None:
         if (osu := self.get_from_cache(f'osu:{id}')):
             return osu
@@ -214,12 +345,28 @@ class BaseStorage(ABC):
     def get_release_file(self, filename: str) -> bytes | None:
         return self.get(filename, 'release')
 
-    def get_release_file_iterator(self, filename: str, chunk_size: int = 1024 * 64) -> Generator:
-        return self.get_iterator(filename, 'release', chunk_size)
+    def get_release_file_iterator(self, filename: str, chunk_size: int = 1024 * 64, reuse_buffer: bool = False) -> Generator:
+        return self.get_iterator(filename, 'release', chunk_size, reuse_buffer)
+
+    def get_release_file_path(self, filename: str) -> str | None:
+        return self.get_path(filename, 'release')
 
     def get_release_file_size(self, filename: str) -> int | None:
         return self.get_size(filename, 'release')
 
+    def get_release_file_info(self, filename: str) -> ObjectInfo | None:
+        return self.get_info(filename, 'release')
+
+    def get_release_file_range_iterator(
+        self,
+        filename: str,
+        start: int,
+        end: int | None = None,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        return self.get_range_iterator(filename, 'release', start, end, chunk_size, reuse_buffer)
+
     def purge_osz_cache(self, set_id: int) -> None:
         if not cloudflare.purge_enabled():
             return
@@ -231,8 +378,67 @@ class BaseStorage(ABC):
 
     def upload_osz(self, set_id: int, content: bytes):
         self.save(f'{set_id}', content, 'osz')
+        self.cache.delete(f'osz:manifest:{set_id}')
+        self.remove_osz_novideo(set_id)
         self.purge_osz_cache(set_id)
 
+        if self.config.OSZ_NOVIDEO_VARIANTS_ENABLED:
+            self.schedule_osz_novideo(set_id)
+
+    def schedule_osz_novideo(self, set_id: int) -> None:
+        # Only the set id gets queued, so that a backlog of uploads doesn't
+        # keep their osz files in memory. The worker reads the latest file,
+        # which is why a set that is already queued won't be queued again.
+        with self.pending_variants_lock:
+            if set_id in self.pending_variants:
+                return
+
+            self.pending_variants.add(set_id)
+
+        self.variant_executor.submit(self.create_osz_novideo, set_id)
+
+    def create_osz_novideo(self, set_id: int) -> None:
+        """Build the no-video variant of an osz file, which is meant to run in the background"""
+        with self.pending_variants_lock:
+            # Uploads from this point on will need another build
+            self.pending_variants.discard(set_id)
+
+        try:
+            if not (source_info := self.get_osz_info(set_id)):
+                # The osz was removed in the meantime
+                return
+
+            if not (source := self.get_osz_io(set_id)):
+                return
+
+            try:
+                if not streaming.contains_video_files(source):
+                    # The regular osz can be streamed without any changes,
+                    # but a variant of a previous upload could still be around
+                    self.remove_osz_novideo(set_id)
+                    return
+
+                manifest = self.get_osz_manifest(set_id, source)
+                source.seek(0)
+
+                # Small variants stay in memory, larger ones are written to disk
+                with tempfile.SpooledTemporaryFile(max_size=1024 * 1024 * 16) as variant:
+                    for chunk in streaming.NoVideoZipIterator(source, manifest=manifest):
+                        variant.write(chunk)
+
+                    if self.get_osz_info(set_id) != source_info:
+                        # The osz was replaced or removed during the build, and
+                        # a newer upload will have scheduled its own build
+                        self.logger.info(f'Skipping outdated no-video variant of osz "{set_id}"')
+                        return
+
+                    variant.seek(0)
+                    self.save(f'{set_id}', variant, 'osz_novideo')
+            finally:
+                source.close()
+        except Exception as e:
+            self.logger.error(f'Failed to create no-video variant of osz "{set_id}": {e}')
+
     def upload_osz2(self, set_id: int, content: bytes):
         self.save(f'{set_id}', content, 'osz2')
 
@@ -269,6 +475,12 @@ class BaseStorage(ABC):
             expiry=timedelta(hours=4)
         )
 
+        # Invalidating only after the new file was written ensures that
+        # other processes can't re-cache the previous file in between.
+        # Cached difficulty attributes, see helpers/performance/difficulty.py
+        self.remove_from_cache(f'difficulty:beatmap:{id}')
+        self.invalidate_local_cache(f'osu:{id}')
+
     def upload_background(self, set_id: int, content: bytes):
         self.remove_from_cache(f'mt:{set_id}')
         self.remove_from_cache(f'mt:{set_id}l')
@@ -302,13 +514,20 @@ class BaseStorage(ABC):
     def remove_beatmap_file(self, beatmap_id: int):
         self.logger.debug(f'Removing beatmap file with id "{beatmap_id}"...')
         self.remove_from_cache(f'osu:{beatmap_id}')
+        self.remove_from_cache(f'difficulty:beatmap:{beatmap_id}')
         self.remove(f'{beatmap_id}', 'beatmaps')
 
     def remove_osz(self, set_id: int):
         self.logger.debug(f'Removing osz with id "{set_id}"...')
         self.remove(f'{set_id}', 'osz')
+        self.cache.delete(f'osz:manifest:{set_id}')
+        self.remove_osz_novideo(set_id)
         self.purge_osz_cache(set_id)
 
+    def remove_osz_novideo(self, set_id: int):
+        if self.file_exists(f'{set_id}', 'osz_novideo'):
+            self.remove(f'{set_id}', 'osz_novideo')
+
     def remove_osz2(self, set_id: int):
         self.logger.debug(f'Removing osz2 with id "{set_id}"...')
         self.remove(f'{set_id}', 'osz2')
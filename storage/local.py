@@ -1,9 +1,12 @@
 
+from datetime import datetime, timezone
 from typing import Generator, List, IO
 
 from ..config import Config
-from .base import BaseStorage
+from .base import BaseStorage, ObjectInfo
 
+import shutil
+import uuid
 import os
 
 
@@ -13,12 +16,27 @@ class LocalStorage(BaseStorage):
     def __init__(self, config: Config) -> None:
         super().__init__(config)
 
-    def save(self, key: str, content: bytes, bucket: str) -> bool:
+    def save(self, key: str, content: bytes | IO[bytes], bucket: str) -> bool:
         try:
             path = f'{self.config.DATA_PATH}/{bucket}'
             os.makedirs(path, exist_ok=True)
-            with open(f'{path}/{key}', 'wb') as f:
-                f.write(content)
+
+            # Readers should never see a partially written file, so the
+            # content is written next to it first and then moved into place
+            temp_path = f'{path}/.{key}.{uuid.uuid4().hex}.tmp'
+
+            try:
+                with open(temp_path, 'wb') as f:
+                    if isinstance(content, bytes):
+                        f.write(content)
+                    else:
+                        shutil.copyfileobj(content, f)
+
+                os.replace(temp_path, f'{path}/{key}')
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
         except Exception as e:
             self.logger.error(f'Failed to save file "{bucket}/{key}": {e}')
             return False
@@ -35,10 +53,57 @@ class LocalStorage(BaseStorage):
             self.logger.error(f'Failed to read file "{bucket}/{key}": {e}')
             return None
 
-    def get_iterator(self, key: str, bucket: str, chunk_size: int = 1024 * 64) -> Generator:
+    def get_iterator(
+        self,
+        key: str,
+        bucket: str,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        return self.get_range_iterator(key, bucket, 0, None, chunk_size, reuse_buffer)
+
+    def get_range(self, key: str, bucket: str, start: int, end: int | None = None) -> bytes | None:
         try:
             with open(f'{self.config.DATA_PATH}/{bucket}/{key}', 'rb') as f:
-                while chunk := f.read(chunk_size):
+                f.seek(start)
+                return f.read(-1 if end is None else max(0, end - start + 1))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.error(f'Failed to read range of file "{bucket}/{key}": {e}')
+            return None
+
+    def get_range_iterator(
+        self,
+        key: str,
+        bucket: str,
+        start: int,
+        end: int | None = None,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        try:
+            with open(f'{self.config.DATA_PATH}/{bucket}/{key}', 'rb', buffering=0) as f:
+                f.seek(start)
+                remaining = None if end is None else max(0, end - start + 1)
+                view = memoryview(bytearray(chunk_size)) if reuse_buffer else None
+
+                while remaining is None or remaining > 0:
+                    size = chunk_size if remaining is None else min(chunk_size, remaining)
+
+                    if view is None:
+                        chunk = f.read(size)
+                    else:
+                        # Every chunk is a view into the same buffer, which
+                        # gets overwritten once the next chunk is requested
+                        chunk = view[:f.readinto(view[:size])]
+
+                    if not chunk:
+                        break
+
+                    if remaining is not None:
+                        remaining -= len(chunk)
+
                     yield chunk
         except FileNotFoundError:
             return None
@@ -55,6 +120,10 @@ class LocalStorage(BaseStorage):
             self.logger.error(f'Failed to open file "{bucket}/{key}": {e}')
             return None
 
+    def get_path(self, key: str, bucket: str) -> str | None:
+        path = f'{self.config.DATA_PATH}/{bucket}/{key}'
+        return path if os.path.isfile(path) else None
+
     def get_size(self, key: str, bucket: str) -> int | None:
         try:
             return os.path.getsize(f'{self.config.DATA_PATH}/{bucket}/{key}')
@@ -64,6 +133,22 @@ class LocalStorage(BaseStorage):
             self.logger.error(f'Failed to get size of file "{bucket}/{key}": {e}')
             return None
 
+    def get_info(self, key: str, bucket: str) -> ObjectInfo | None:
+        try:
+            stat = os.stat(f'{self.config.DATA_PATH}/{bucket}/{key}')
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.error(f'Failed to get info of file "{bucket}/{key}": {e}')
+            return None
+
+        return ObjectInfo(
+            size=stat.st_size,
+            # Same format as the etags that nginx generates for static files
+            etag=f'"{int(stat.st_mtime):x}-{stat.st_size:x}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        )
+
     def remove(self, key: str, bucket: str) -> bool:
         try:
             os.remove(f'{self.config.DATA_PATH}/{bucket}/{key}')
@@ -77,7 +162,11 @@ class LocalStorage(BaseStorage):
         return os.path.isfile(f'{self.config.DATA_PATH}/{folder}/{key}')
 
     def list(self, key: str) -> List[str]:
-        return os.listdir(f'{self.config.DATA_PATH}/{key}')
+        return [
+            # Skip files that are still being written by save()
+            filename for filename in os.listdir(f'{self.config.DATA_PATH}/{key}')
+            if not filename.endswith('.tmp')
+        ]
 
     def get_presigned_url(self, folder: str, key: str, expiration: int = 900) -> str | None:
         return None
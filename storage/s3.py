@@ -6,8 +6,8 @@ from botocore.client import BaseClient
 from boto3.s3.transfer import TransferConfig
 from functools import cached_property
 
-from .s3_file import S3FileReader
-from .base import BaseStorage
+from .s3_file import S3FileReader, readinto_stream
+from .base import BaseStorage, ObjectInfo
 from ..config import Config
 
 import boto3
@@ -90,16 +90,62 @@ class S3Storage(BaseStorage):
 
         return buffer.getvalue()
 
-    def get_iterator(self, key: str, bucket: str, chunk_size: int = 1024 * 64) -> Generator:
+    def get_iterator(
+        self,
+        key: str,
+        bucket: str,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        return self.get_range_iterator(key, bucket, 0, None, chunk_size, reuse_buffer)
+
+    def get_range(self, key: str, bucket: str, start: int, end: int | None = None) -> bytes | None:
         try:
             response = self.s3.get_object(
                 Bucket=self.config.S3_BUCKET,
-                Key=f"{bucket}/{key}"
+                Key=f"{bucket}/{key}",
+                Range=f'bytes={start}-{"" if end is None else end}'
             )
+            return response['Body'].read()
+        except ClientError:
+            # Most likely not found, or the range is not satisfiable
+            return None
+        except Exception as e:
+            self.logger.error(f'Failed to download range of "{key}" from s3: "{e}"')
+            return None
+
+    def get_range_iterator(
+        self,
+        key: str,
+        bucket: str,
+        start: int,
+        end: int | None = None,
+        chunk_size: int = 1024 * 64,
+        reuse_buffer: bool = False
+    ) -> Generator:
+        parameters = {
+            'Bucket': self.config.S3_BUCKET,
+            'Key': f"{bucket}/{key}"
+        }
+
+        if start > 0 or end is not None:
+            parameters['Range'] = f'bytes={start}-{"" if end is None else end}'
+
+        try:
+            response = self.s3.get_object(**parameters)
             body = response['Body']
 
-            while chunk := body.read(chunk_size):
-                yield chunk
+            if not reuse_buffer:
+                while chunk := body.read(chunk_size):
+                    yield chunk
+                return
+
+            # Every chunk is a view into the same buffer, which
+            # gets overwritten once the next chunk is requested
+            view = memoryview(bytearray(chunk_size))
+
+            while count := readinto_stream(body, view):
+                yield view[:count]
         except ClientError:
             # Most likely not found
             return
@@ -118,7 +164,8 @@ class S3Storage(BaseStorage):
             self.s3,
             self.config.S3_BUCKET,
             f"{bucket}/{key}",
-            size
+            size,
+            max_blocks=self.config.S3_READER_MAX_BLOCKS
         )
 
     def get_size(self, key: str, bucket: str) -> int | None:
@@ -134,6 +181,24 @@ class S3Storage(BaseStorage):
             self.logger.error(f'Failed to get size of "{key}" from s3: "{e}"')
             return None
 
+    def get_info(self, key: str, bucket: str) -> ObjectInfo | None:
+        try:
+            response = self.s3.head_object(
+                Bucket=self.config.S3_BUCKET,
+                Key=f"{bucket}/{key}"
+            )
+        except ClientError:
+            return None
+        except Exception as e:
+            self.logger.error(f'Failed to get info of "{key}" from s3: "{e}"')
+            return None
+
+        return ObjectInfo(
+            size=response['ContentLength'],
+            etag=response.get('ETag'),
+            last_modified=response.get('LastModified')
+        )
+
     def remove(self, key: str, bucket: str) -> bool:
         try:
             self.s3.delete_object(
@@ -1,8 +1,26 @@
 
+from concurrent.futures import ThreadPoolExecutor, Future
 from io import RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END
 from botocore.client import BaseClient
-from typing import BinaryIO
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Set
+from threading import Lock
 
+def readinto_stream(body: Any, view: memoryview) -> int:
+    """Fill a buffer from a botocore response body, until it is full or the body has ended"""
+    total = 0
+
+    while total < len(view):
+        chunk = body.read(len(view) - total)
+        count = len(chunk)
+
+        if not count:
+            break
+
+        view[total:total + count] = chunk
+        total += count
+
+    return total
 
 class S3FileReader(RawIOBase, BinaryIO):
     """A read-only, file-like object that actually reads S3 files"""
@@ -10,22 +28,46 @@ class S3FileReader(RawIOBase, BinaryIO):
     # Amount of data to fetch per range request.
     # Consumers like zipfile read in tiny chunks, so without buffering,
     # every chunk would result in a ton of unnecessary requests.
-    block_size = 6 * 1024 * 1024
+    block_size = 2 * 1024 * 1024
+
+    # Default amount of blocks to keep around, so that seeking
+    # back e.g. to the central directory of a zip file is free
+    max_blocks = 4
+
+    # Maximum amount of blocks to prefetch ahead of the current position.
+    # The read-ahead window starts at zero and doubles with every
+    # sequential block, while random access resets it.
+    max_read_ahead = 4
+
+    # Shared between all readers, to limit the amount of concurrent range requests
+    prefetch_executor = ThreadPoolExecutor(
+        max_workers=8,
+        thread_name_prefix='s3-prefetch'
+    )
 
     def __init__(
         self,
         s3: BaseClient,
         bucket: str,
         key: str,
-        size: int
+        size: int,
+        max_blocks: int | None = None
     ) -> None:
         self.s3 = s3
+        self.max_blocks = max_blocks or self.max_blocks
         self.bucket = bucket
         self.key = key
         self.size = size
         self.position = 0
-        self.buffer = b''
-        self.buffer_start = 0
+        self.blocks: OrderedDict[int, bytes] = OrderedDict()
+        self.prefetches: Dict[int, Future] = {}
+        self.used_blocks: Set[int] = set()
+        self.last_block = -1
+        self.read_ahead = 0
+        self.range_requests = 0
+        self.bytes_fetched = 0
+        self.bytes_wasted = 0
+        self.statistics_lock = Lock()
 
     def __repr__(self) -> str:
         return f'<S3FileReader "{self.bucket}/{self.key}" ({self.size} bytes)>'
@@ -46,9 +88,36 @@ class S3FileReader(RawIOBase, BinaryIO):
         return self.read(-1)
 
     def readinto(self, buffer) -> int:
-        data = self.read(len(buffer))
-        buffer[:len(data)] = data
-        return len(data)
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        view = memoryview(buffer).cast('B')
+        total = 0
+
+        while total < len(view) and self.position < self.size:
+            index = self.position // self.block_size
+            offset = self.position - index * self.block_size
+            remaining = min(len(view) - total, self.size - self.position)
+
+            blocks = self.uncached_blocks(index, remaining // self.block_size) if offset == 0 else 0
+
+            if blocks:
+                # Large aligned reads go straight from the response into the buffer
+                self.track_access(index)
+                count = self.fetch_into(view[total:total + blocks * self.block_size], self.position)
+                self.last_block = index + blocks - 1
+            else:
+                block = memoryview(self.block(index))[offset:offset + remaining]
+                count = len(block)
+                view[total:total + count] = block
+
+            if not count:
+                break
+
+            self.position += count
+            total += count
+
+        return total
 
     def read(self, size: int = -1) -> bytes:
         if self.closed:
@@ -63,33 +132,90 @@ class S3FileReader(RawIOBase, BinaryIO):
             self.position += len(data)
             return data
 
-        # Read a specific number of bytes, buffering as necessary
-        result = bytearray()
-        remaining = size
+        buffer = bytearray(min(size, self.size - self.position))
+        count = self.readinto(buffer)
+
+        if count == len(buffer):
+            return bytes(buffer)
+
+        return bytes(memoryview(buffer)[:count])
+
+    def is_uncached(self, index: int) -> bool:
+        return index not in self.blocks and index not in self.prefetches
+
+    def uncached_blocks(self, index: int, limit: int) -> int:
+        """Count the blocks from `index` onwards that aren't cached or being prefetched"""
+        count = 0
+
+        while count < limit and self.is_uncached(index + count):
+            count += 1
+
+        return count
+
+    def block(self, index: int) -> bytes:
+        """Get a block from the cache, a running prefetch or a new range request"""
+        self.track_access(index)
+
+        if (block := self.blocks.get(index)) is not None:
+            self.blocks.move_to_end(index)
+
+        elif (future := self.prefetches.pop(index, None)) is not None:
+            block = self.store_block(index, self.prefetch_result(index, future))
+
+        else:
+            block = self.store_block(index, self.fetch_block(index))
+
+        self.used_blocks.add(index)
+        self.prefetch(index)
+        return block
+
+    def track_access(self, index: int) -> None:
+        if index == self.last_block:
+            return
+
+        if index == self.last_block + 1:
+            # Sequential access -> grow the read-ahead window
+            self.read_ahead = min(max(1, self.read_ahead * 2), self.max_read_ahead)
+        else:
+            # Random access, e.g. zipfile seeking to the central directory
+            self.read_ahead = 0
+
+        self.last_block = index
+
+    def prefetch(self, index: int) -> None:
+        last_index = (self.size - 1) // self.block_size
 
-        while remaining > 0 and self.position < self.size:
-            is_buffered = (
-                self.buffer_start <= self.position < self.buffer_start + len(self.buffer)
+        for next_index in range(index + 1, min(index + self.read_ahead, last_index) + 1):
+            if next_index in self.blocks or next_index in self.prefetches:
+                continue
+
+            self.prefetches[next_index] = self.prefetch_executor.submit(
+                self.fetch_block,
+                next_index
             )
 
-            if not is_buffered:
-                # Requested position isn't buffered -> prefetch a new block
-                end = min(self.position + self.block_size, self.size) - 1
-                self.buffer = self.fetch(self.position, end)
-                self.buffer_start = self.position
+    def prefetch_result(self, index: int, future: Future) -> bytes:
+        try:
+            return future.result()
+        except Exception:
+            # Retry failed prefetches in the foreground
+            return self.fetch_block(index)
+
+    def store_block(self, index: int, block: bytes) -> bytes:
+        self.blocks[index] = block
 
-                if not self.buffer:
-                    break
+        while len(self.blocks) > self.max_blocks:
+            evicted_index, evicted_block = self.blocks.popitem(last=False)
 
-            # Use the buffered data to complete the read request
-            offset = self.position - self.buffer_start
-            chunk = self.buffer[offset:offset + remaining]
-            result += chunk
+            if evicted_index not in self.used_blocks:
+                self.bytes_wasted += len(evicted_block)
 
-            self.position += len(chunk)
-            remaining -= len(chunk)
+        return block
 
-        return bytes(result)
+    def fetch_block(self, index: int) -> bytes:
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        return self.fetch(start, end)
 
     def fetch(self, start: int, end: int) -> bytes:
         response = self.s3.get_object(
@@ -97,7 +223,30 @@ class S3FileReader(RawIOBase, BinaryIO):
             Key=self.key,
             Range=f'bytes={start}-{end}'
         )
-        return response['Body'].read()
+        data = response['Body'].read()
+        self.record_fetch(len(data))
+        return data
+
+    def fetch_into(self, view: memoryview, start: int) -> int:
+        response = self.s3.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f'bytes={start}-{start + len(view) - 1}'
+        )
+        body = response['Body']
+
+        try:
+            count = readinto_stream(body, view)
+        finally:
+            body.close()
+
+        self.record_fetch(count)
+        return count
+
+    def record_fetch(self, size: int) -> None:
+        with self.statistics_lock:
+            self.range_requests += 1
+            self.bytes_fetched += size
 
     def seek(self, offset: int, whence: int = SEEK_SET) -> int:
         if whence == SEEK_SET:
@@ -119,3 +268,38 @@ class S3FileReader(RawIOBase, BinaryIO):
 
         self.position = position
         return self.position
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        for index, future in self.prefetches.items():
+            if future.cancel():
+                continue
+
+            # Prefetches that were already running, but never read
+            future.add_done_callback(self.count_wasted_prefetch)
+
+        for index, block in self.blocks.items():
+            if index not in self.used_blocks:
+                self.bytes_wasted += len(block)
+
+        self.prefetches.clear()
+        self.blocks.clear()
+        super().close()
+
+    def count_wasted_prefetch(self, future: Future) -> None:
+        if future.exception() is not None:
+            return
+
+        with self.statistics_lock:
+            self.bytes_wasted += len(future.result())
+
+    def statistics(self) -> dict:
+        return {
+            'range_requests': self.range_requests,
+            'bytes_fetched': self.bytes_fetched,
+            'bytes_wasted': self.bytes_wasted,
+            'read_ahead': self.read_ahead,
+            'cached_blocks': len(self.blocks)
+        }